@@ -0,0 +1,198 @@
+import copy, math
+from collections import namedtuple
+from typing import Iterable, List, Optional
+
+from nmigen import Module, Signal
+
+# Address decoding for PicoRV32's memory-mapped registers.
+#
+# Every peripheral occupies an aligned power-of-two region. Instead of comparing all 32 address bits per
+# register, each region is selected by the few high address bits that tell it apart from RAM and from every
+# other region, and the registers inside it by their word offset. Each register then becomes one `Case` of a
+# `Switch` on `mem_addr` whose pattern fixes only those bits. Addresses outside every region may alias onto a
+# register, the usual trade-off of partial decoding.
+
+Region = namedtuple('Region', 'name base size')
+
+class Peripheral:
+    """
+    A block of word registers at ``base``. Each of ``registers`` is a ``Mapping`` whose ``addr`` is the
+    register's byte offset from ``base``.
+
+    The block spans the next power of two of bytes past its last register, or ``size`` bytes if given, and
+    ``base`` must be aligned to it. A peripheral without registers is a window that is decoded as a whole
+    and handed to a bus slave (see ``AddressDecoder.matches``).
+    """
+    def __init__(self, name: str, base: int, registers: list = (), size: Optional[int] = None):
+        self.name = name
+        self.base = base
+        self.registers = list(registers)
+        if size is None:
+            last = max(register.addr for register in self.registers) + 4
+            size = 1 << max(2, (last - 1).bit_length())
+        self.size = size
+
+    @classmethod
+    def single(cls, mapping) -> "Peripheral":
+        register = copy.copy(mapping)
+        register.addr = 0
+        return cls(f"{mapping.addr:#010x}", mapping.addr, [register])
+
+def _lut4s(literals: int) -> int:
+    # an AND (or OR) of n inputs as a tree of 4-input LUTs
+    return math.ceil((literals - 1) / 3) if literals > 1 else 0
+
+def _levels(literals: int) -> int:
+    return math.ceil(math.log(literals, 4)) if literals > 1 else 0
+
+class AddressDecoder:
+    """
+    Decoder for ``mappings``, a list of ``Peripheral``s and single-word ``Mapping``s, next to a RAM of
+    ``ram_size`` bytes at address 0.
+
+    Raises ``ValueError`` on misaligned or overlapping regions, including regions that fall inside the
+    power-of-two span of RAM.
+    """
+    def __init__(self, mappings: Iterable, ram_size: int):
+        self.peripherals = [m if isinstance(m, Peripheral) else Peripheral.single(m) for m in mappings]
+        self.ram = Region("ram", 0, 1 << max(2, (ram_size - 1).bit_length()))
+
+        self._check()
+        regions = [self.ram] + [Region(p.name, p.base, p.size) for p in self.peripherals]
+        self.select_bits = {
+            p.name: self._distinguishing_bits(regions[i + 1], regions[:i + 1] + regions[i + 2:])
+            for i, p in enumerate(self.peripherals)
+        }
+
+    def _check(self):
+        names = [p.name for p in self.peripherals]
+        for p in self.peripherals:
+            if names.count(p.name) > 1:
+                raise ValueError(f"peripheral name {p.name!r} is used more than once")
+            if p.size & (p.size - 1) or p.size < 4:
+                raise ValueError(f"{p.name}: size {p.size} is not a power of two of at least one word")
+            if any(register.addr >= p.size for register in p.registers):
+                raise ValueError(f"{p.name}: registers extend past its {p.size}-byte span")
+            if p.base % p.size:
+                raise ValueError(f"{p.name}: base {p.base:#010x} is not aligned to its {p.size}-byte span")
+            offsets = [register.addr for register in p.registers]
+            for register in p.registers:
+                if register.addr % 4:
+                    raise ValueError(f"{p.name}: register offset {register.addr:#x} is not word aligned")
+                if offsets.count(register.addr) > 1:
+                    raise ValueError(f"{p.name}: more than one register at offset {register.addr:#x}")
+                if not register.read and not register.writing_enabled:
+                    raise ValueError(f"{p.name}: register at offset {register.addr:#x} is neither readable nor writable")
+
+        regions = [self.ram] + [Region(p.name, p.base, p.size) for p in self.peripherals]
+        for i, a in enumerate(regions):
+            for b in regions[i + 1:]:
+                if a.base < b.base + b.size and b.base < a.base + a.size:
+                    raise ValueError(f"{a.name} [{a.base:#010x}, {a.base + a.size:#010x}) overlaps "
+                        f"{b.name} [{b.base:#010x}, {b.base + b.size:#010x})")
+
+    @staticmethod
+    def _distinguishing_bits(region: Region, others: List[Region]) -> List[int]:
+        # bit `b` tells `region` apart from `other` if both regions are aligned above it and their bases
+        # differ there; pick greedily the bit that separates the most remaining regions, preferring high bits
+        def separates(b, other):
+            return (1 << b) >= max(region.size, other.size) and (region.base >> b & 1) != (other.base >> b & 1)
+
+        bits = []
+        remaining = list(others)
+        while remaining:
+            b = max(range(31, 1, -1), key=lambda b: sum(separates(b, other) for other in remaining))
+            bits.append(b)
+            remaining = [other for other in remaining if not separates(b, other)]
+        return sorted(bits, reverse=True)
+
+    def pattern(self, peripheral: Peripheral, offset: Optional[int] = None) -> str:
+        """
+        The ``Case`` pattern (most significant bit first) matching the register at ``offset``, or the whole
+        of ``peripheral`` if ``offset`` is ``None``.
+        """
+        fixed = {b: peripheral.base >> b & 1 for b in self.select_bits[peripheral.name]}
+        if offset is not None:
+            fixed.update({b: offset >> b & 1 for b in range(2, peripheral.size.bit_length() - 1)})
+        return "".join(str(fixed[b]) if b in fixed else "-" for b in range(31, -1, -1))
+
+    def matches(self, addr: Signal, name: str):
+        """
+        Whether ``addr`` falls in the peripheral (or window) called ``name``.
+        """
+        peripheral = next(p for p in self.peripherals if p.name == name)
+        return addr.matches(self.pattern(peripheral))
+
+    def read_mux(self, m: Module, addr: Signal, rdata: Signal):
+        """
+        Drive ``rdata`` from the readable register ``addr`` points at, leaving it alone everywhere else.
+        """
+        with m.Switch(addr):
+            for p in self.peripherals:
+                for register in p.registers:
+                    if register.read:
+                        with m.Case(self.pattern(p, register.addr)):
+                            m.d.comb += rdata.eq(register.signal)
+
+    def access(self, m: Module, addr: Signal, wstrb: Signal, wdata: Signal, ready: Signal):
+        """
+        Perform a register access: write ``wdata`` when ``wstrb`` is set, and acknowledge through ``ready``
+        on the next cycle. Registers with a ``write`` callback acknowledge writes themselves.
+        """
+        with m.Switch(addr):
+            for p in self.peripherals:
+                for register in p.registers:
+                    with m.Case(self.pattern(p, register.addr)):
+                        with m.If(wstrb.bool()):
+                            if register.write is not None:
+                                register.write(m, wdata)
+                            elif register.writing_enabled:
+                                m.d.sync += [
+                                    register.signal.eq(wdata),
+                                    ready.eq(1),
+                                ]
+                        with m.Else():
+                            if register.read:
+                                m.d.sync += ready.eq(1)
+
+    def summary(self) -> str:
+        """
+        Per-region decode cost and a rough LUT4 / logic level estimate (before Yosys optimisation) of the
+        register selects and the read mux, next to comparing all 30 word-address bits per register.
+        """
+        lines = [["region", "base", "size", "regs", "select bits", "literals", "LUT4s", "levels"]]
+        decode_luts = flat_luts = 0
+        levels = 0
+        readable = []
+        for p in self.peripherals:
+            # a window is one select, on its region bits only
+            offset_bits = p.size.bit_length() - 1 - 2 if p.registers else 0
+            selects = max(len(p.registers), 1)
+            literals = len(self.select_bits[p.name]) + offset_bits
+            decode_luts += _lut4s(literals) * selects
+            flat_luts += _lut4s(30 if p.registers else 32 - (p.size.bit_length() - 1)) * selects
+            levels = max(levels, _levels(literals))
+            # a window's slave drives all 32 data bits
+            readable += [len(register.signal) for register in p.registers if register.read] if p.registers else [32]
+            lines.append([p.name, f"{p.base:#010x}", str(p.size), str(len(p.registers)),
+                ",".join(map(str, self.select_bits[p.name])), str(literals),
+                str(_lut4s(literals) * selects), str(_levels(literals))])
+
+        # one-hot AND-OR per data bit: a LUT4 takes two (select, data) pairs, then an OR tree; RAM is the default
+        mux_luts = mux_levels = 0
+        for bit in range(32):
+            inputs = sum(width > bit for width in readable) + 1
+            if inputs == 1:
+                continue
+            first = math.ceil(inputs / 2)
+            mux_luts += first + _lut4s(first)
+            mux_levels = max(mux_levels, 1 + _levels(first))
+
+        widths = [max(len(line[i]) for line in lines) for i in range(len(lines[0]))]
+        table = "\n".join("  ".join(cell.rjust(width) for cell, width in zip(line, widths)) for line in lines)
+        return "\n".join([
+            table,
+            f"register selects: ~{decode_luts} LUT4s, {levels} levels (full 32-bit compares: ~{flat_luts} LUT4s, "
+                f"{_levels(30)} levels)",
+            f"read mux: {len(readable)} registers/windows + RAM, ~{mux_luts} LUT4s, {mux_levels} levels",
+        ])
@@ -1,20 +1,35 @@
 use std::env;
-use std::fs::File;
-use std::io::Write;
-use std::path::Path;
+use std::fs;
+use std::path::{Path, PathBuf};
 
-/// Put the linker script somewhere the linker can find it.
+/// Put the linker script and the register bindings somewhere the build can find them: the copies the
+/// gateware generated into `$APP_GENERATED_DIR`, or the checked-in defaults next to this file.
 fn main() {
     let out_dir = env::var("OUT_DIR").expect("No out dir");
     let dest_path = Path::new(&out_dir);
-    let mut f = File::create(&dest_path.join("memory.x"))
-        .expect("Could not create file");
+    let generated = env::var("APP_GENERATED_DIR").ok().map(PathBuf::from);
 
-    f.write_all(include_bytes!("memory.x"))
-        .expect("Could not write file");
+    for name in ["memory.x", "csr.rs"] {
+        let source = generated.as_ref()
+            .map(|dir| dir.join(name))
+            .filter(|path| path.exists())
+            .unwrap_or_else(|| PathBuf::from(name));
+        fs::copy(&source, dest_path.join(name))
+            .unwrap_or_else(|_| panic!("Could not copy {}", source.display()));
+        println!("cargo:rerun-if-changed={}", source.display());
+    }
 
     println!("cargo:rustc-link-search={}", dest_path.display());
 
-    println!("cargo:rerun-if-changed=memory.x");
+    // optional peripherals are compiled in when the generated register bindings have them
+    let csr = fs::read_to_string(dest_path.join("csr.rs")).expect("Could not read csr.rs");
+    for peripheral in ["capture", "nco_bank"] {
+        println!("cargo:rustc-check-cfg=cfg({})", peripheral);
+        if csr.contains(&format!("pub mod {} {{", peripheral)) {
+            println!("cargo:rustc-cfg={}", peripheral);
+        }
+    }
+
+    println!("cargo:rerun-if-env-changed=APP_GENERATED_DIR");
     println!("cargo:rerun-if-changed=build.rs");
 }
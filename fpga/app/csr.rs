@@ -0,0 +1,456 @@
+// Generated from the gateware's CSR map (`python top.py csr`); do not edit.
+
+pub const NCO_CLOCK_FREQUENCY: f64 = 16000000.0;
+
+pub mod nco {
+    pub const BASE: usize = 0xf0000000;
+
+    pub mod ctrl {
+        pub const ADDR: usize = 0xf0000000;
+        pub const WIDTH: u32 = 1;
+        pub const ENABLE: u32 = 0x1;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+}
+
+pub mod led {
+    pub const BASE: usize = 0xf0000100;
+
+    pub mod ctrl {
+        pub const ADDR: usize = 0xf0000100;
+        pub const WIDTH: u32 = 1;
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+}
+
+/// FIFO UART with DMA.
+pub mod uart {
+    pub const BASE: usize = 0xf0000200;
+
+    /// Bit rate as a fraction of the clock, in units of 2**-24.
+    pub mod baud {
+        pub const ADDR: usize = 0xf0000200;
+        pub const WIDTH: u32 = 24;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    /// Queues a byte for transmission.
+    pub mod tx_data {
+        pub const ADDR: usize = 0xf0000204;
+        pub const WIDTH: u32 = 8;
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    /// Oldest received byte; reading pops it.
+    pub mod rx_data {
+        pub const ADDR: usize = 0xf0000208;
+        pub const WIDTH: u32 = 8;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+    }
+
+    pub mod status {
+        pub const ADDR: usize = 0xf000020c;
+        pub const WIDTH: u32 = 4;
+        pub const TX_FULL: u32 = 0x1;
+        pub const RX_EMPTY: u32 = 0x2;
+        pub const TX_DMA_BUSY: u32 = 0x4;
+        pub const RX_DMA_BUSY: u32 = 0x8;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+    }
+
+    /// Bytes in the TX and RX FIFOs.
+    pub mod levels {
+        pub const ADDR: usize = 0xf0000210;
+        pub const WIDTH: u32 = 32;
+        pub const TX: u32 = 0xffff;
+        pub const TX_SHIFT: u32 = 0;
+        pub const RX: u32 = 0xffff0000;
+        pub const RX_SHIFT: u32 = 16;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+    }
+
+    pub mod irq_enable {
+        pub const ADDR: usize = 0xf0000214;
+        pub const WIDTH: u32 = 6;
+        pub const RX_READY: u32 = 0x1;
+        pub const TX_EMPTY: u32 = 0x2;
+        pub const RX_DMA_DONE: u32 = 0x4;
+        pub const TX_DMA_DONE: u32 = 0x8;
+        pub const RX_OVERFLOW: u32 = 0x10;
+        pub const RX_ERROR: u32 = 0x20;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    pub mod irq_pending {
+        pub const ADDR: usize = 0xf0000218;
+        pub const WIDTH: u32 = 6;
+        pub const RX_READY: u32 = 0x1;
+        pub const TX_EMPTY: u32 = 0x2;
+        pub const RX_DMA_DONE: u32 = 0x4;
+        pub const TX_DMA_DONE: u32 = 0x8;
+        pub const RX_OVERFLOW: u32 = 0x10;
+        pub const RX_ERROR: u32 = 0x20;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+    }
+
+    /// Write ones to clear sticky interrupts.
+    pub mod irq_clear {
+        pub const ADDR: usize = 0xf000021c;
+        pub const WIDTH: u32 = 6;
+        pub const RX_READY: u32 = 0x1;
+        pub const TX_EMPTY: u32 = 0x2;
+        pub const RX_DMA_DONE: u32 = 0x4;
+        pub const TX_DMA_DONE: u32 = 0x8;
+        pub const RX_OVERFLOW: u32 = 0x10;
+        pub const RX_ERROR: u32 = 0x20;
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    pub mod rx_dma_addr {
+        pub const ADDR: usize = 0xf0000220;
+        pub const WIDTH: u32 = 32;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    /// Starts receiving this many bytes.
+    pub mod rx_dma_len {
+        pub const ADDR: usize = 0xf0000224;
+        pub const WIDTH: u32 = 16;
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    pub mod rx_dma_remaining {
+        pub const ADDR: usize = 0xf0000228;
+        pub const WIDTH: u32 = 16;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+    }
+
+    pub mod tx_dma_addr {
+        pub const ADDR: usize = 0xf000022c;
+        pub const WIDTH: u32 = 32;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    /// Starts sending this many bytes.
+    pub mod tx_dma_len {
+        pub const ADDR: usize = 0xf0000230;
+        pub const WIDTH: u32 = 16;
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    pub mod tx_dma_remaining {
+        pub const ADDR: usize = 0xf0000234;
+        pub const WIDTH: u32 = 16;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+    }
+}
+
+/// Frequency sweep engine in front of the NCO.
+pub mod chirp {
+    pub const BASE: usize = 0xf0000300;
+
+    pub mod ctrl {
+        pub const ADDR: usize = 0xf0000300;
+        pub const WIDTH: u32 = 1;
+        pub const LOOP: u32 = 0x1;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    pub mod status {
+        pub const ADDR: usize = 0xf0000304;
+        pub const WIDTH: u32 = 2;
+        pub const BUSY: u32 = 0x1;
+        pub const DONE: u32 = 0x2;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+    }
+
+    /// Sets the phase step, 2**32 per turn per clock cycle.
+    pub mod step {
+        pub const ADDR: usize = 0xf0000308;
+        pub const WIDTH: u32 = 32;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    /// The phase step in use.
+    pub mod phase_step {
+        pub const ADDR: usize = 0xf000030c;
+        pub const WIDTH: u32 = 32;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+    }
+
+    /// Plays the segments from this index.
+    pub mod start {
+        pub const ADDR: usize = 0xf0000310;
+        pub const WIDTH: u32 = 6;
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    pub mod stop {
+        pub const ADDR: usize = 0xf0000314;
+        pub const WIDTH: u32 = 1;
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    pub mod seg_addr {
+        pub const ADDR: usize = 0xf0000318;
+        pub const WIDTH: u32 = 6;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    pub mod seg_step {
+        pub const ADDR: usize = 0xf000031c;
+        pub const WIDTH: u32 = 32;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    pub mod seg_delta {
+        pub const ADDR: usize = 0xf0000320;
+        pub const WIDTH: u32 = 32;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    pub mod seg_duration {
+        pub const ADDR: usize = 0xf0000324;
+        pub const WIDTH: u32 = 32;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    /// Stores the segment at `seg_addr` and moves on to the next one.
+    pub mod seg_config {
+        pub const ADDR: usize = 0xf0000328;
+        pub const WIDTH: u32 = 24;
+        pub const INTERVAL: u32 = 0xffff;
+        pub const INTERVAL_SHIFT: u32 = 0;
+        pub const SHIFT: u32 = 0x1f0000;
+        pub const SHIFT_SHIFT: u32 = 16;
+        pub const MODE: u32 = 0x600000;
+        pub const MODE_SHIFT: u32 = 21;
+        pub const LAST: u32 = 0x800000;
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+}
+
+/// Interrupt controller.
+pub mod irq {
+    pub const BASE: usize = 0xf0000400;
+
+    pub mod pending {
+        pub const ADDR: usize = 0xf0000400;
+        pub const WIDTH: u32 = 3;
+        pub const TIMER: u32 = 0x1;
+        pub const UART: u32 = 0x2;
+        pub const CHIRP: u32 = 0x4;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+    }
+
+    pub mod enable {
+        pub const ADDR: usize = 0xf0000404;
+        pub const WIDTH: u32 = 3;
+        pub const TIMER: u32 = 0x1;
+        pub const UART: u32 = 0x2;
+        pub const CHIRP: u32 = 0x4;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    /// Write ones to clear edge-triggered sources.
+    pub mod clear {
+        pub const ADDR: usize = 0xf0000408;
+        pub const WIDTH: u32 = 3;
+        pub const TIMER: u32 = 0x1;
+        pub const UART: u32 = 0x2;
+        pub const CHIRP: u32 = 0x4;
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+}
+
+/// Programmable cycle timer.
+pub mod timer {
+    pub const BASE: usize = 0xf0000500;
+
+    pub mod ctrl {
+        pub const ADDR: usize = 0xf0000500;
+        pub const WIDTH: u32 = 2;
+        pub const ENABLE: u32 = 0x1;
+        pub const PERIODIC: u32 = 0x2;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    pub mod status {
+        pub const ADDR: usize = 0xf0000504;
+        pub const WIDTH: u32 = 1;
+        pub const RUNNING: u32 = 0x1;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+    }
+
+    /// Cycles between events, minus one.
+    pub mod period {
+        pub const ADDR: usize = 0xf0000508;
+        pub const WIDTH: u32 = 32;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+        #[inline(always)]
+        pub fn write(value: u32) {
+            unsafe { (ADDR as *mut u32).write_volatile(value) }
+        }
+    }
+
+    /// Cycles left until the next event.
+    pub mod value {
+        pub const ADDR: usize = 0xf000050c;
+        pub const WIDTH: u32 = 32;
+        #[inline(always)]
+        pub fn read() -> u32 {
+            unsafe { (ADDR as *const u32).read_volatile() }
+        }
+    }
+}
@@ -0,0 +1,60 @@
+use crate::csr;
+use crate::uart::Uart;
+
+/// Starts a dump, see `dump`.
+pub const MAGIC: &[u8] = b"LA01";
+
+/// Handles a command byte from `capture_dump.py`: `c` and five little-endian words (`ctrl`, `trigger_mask`,
+/// `trigger_value`, `pretrigger` and `decimation`) arms a capture, and `f` forces its trigger.
+pub fn command(uart: &Uart, byte: u8) {
+    match byte {
+        b'c' => {
+            csr::capture::ctrl::write(read_word(uart));
+            csr::capture::trigger_mask::write(read_word(uart));
+            csr::capture::trigger_value::write(read_word(uart));
+            csr::capture::pretrigger::write(read_word(uart));
+            csr::capture::decimation::write(read_word(uart));
+            csr::capture::arm::write(1);
+        }
+        b'f' => csr::capture::force::write(1),
+        _ => {}
+    }
+}
+
+/// Sends a finished capture: `MAGIC`, then `ctrl`, `pretrigger`, `decimation`, `depth` and `entry_words`,
+/// then `depth` entries of `entry_words` words, oldest first.
+pub fn dump(uart: &Uart) {
+    let depth = csr::capture::depth::read();
+    let entry_words = csr::capture::entry_words::read();
+    uart.write(MAGIC);
+    for &word in [
+        csr::capture::ctrl::read(),
+        csr::capture::pretrigger::read(),
+        csr::capture::decimation::read(),
+        depth,
+        entry_words,
+    ].iter() {
+        write_word(uart, word);
+    }
+    csr::capture::read_addr::write(0);
+    for _ in 0..depth * entry_words {
+        write_word(uart, csr::capture::read_data::read());
+    }
+}
+
+fn read_word(uart: &Uart) -> u32 {
+    let mut word = 0;
+    for i in 0..4 {
+        let byte = loop {
+            if let Some(byte) = uart.read_byte() {
+                break byte;
+            }
+        };
+        word |= (byte as u32) << (8 * i);
+    }
+    word
+}
+
+fn write_word(uart: &Uart, word: u32) {
+    uart.write(&word.to_le_bytes());
+}
@@ -0,0 +1,19 @@
+use crate::csr;
+
+/// Sleeps until the interrupt controller raises its line and returns the pending sources, as
+/// `csr::irq::pending` masks. The core's own interrupt stays masked, as it is from reset, so no handler runs;
+/// `waitirq` returns on a pending interrupt all the same.
+pub fn wait() -> u32 {
+    // `waitirq a0`, a PicoRV32 custom instruction
+    unsafe { core::arch::asm!(".word 0x0800450b", lateout("a0") _) };
+    csr::irq::pending::read()
+}
+
+pub fn enable(sources: u32) {
+    csr::irq::enable::write(csr::irq::enable::read() | sources);
+}
+
+/// Clears edge-triggered sources; level-triggered ones are acknowledged at their peripheral.
+pub fn clear(sources: u32) {
+    csr::irq::clear::write(sources);
+}
@@ -1,30 +1,13 @@
+use crate::csr;
 
-use bitflags::bitflags;
-
-bitflags! {
-    #[repr(transparent)]
-    struct Flags: u32 {
-        const ENABLE = 1 << 0;
-    }
-}
-
-pub struct Led {
-    mapping: *mut u32,
-}
-
-unsafe impl Sync for Led {}
+pub struct Led;
 
 impl Led {
     pub const fn new() -> Self {
-        Self {
-            mapping: 0xcafebab0 as *mut u32,
-        }
+        Self
     }
 
     pub fn enable(&self, en: bool) {
-        let flags = if en { Flags::ENABLE } else { Flags::empty() };
-        unsafe {
-            self.mapping.write_volatile(flags.bits());
-        }
+        csr::led::ctrl::write(en as u32);
     }
-}
\ No newline at end of file
+}
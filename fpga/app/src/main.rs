@@ -3,16 +3,29 @@
 
 extern crate panic_halt;
 
+#[allow(dead_code)]
+mod csr {
+    include!(concat!(env!("OUT_DIR"), "/csr.rs"));
+}
 mod nco;
 mod led;
+mod uart;
+mod irq;
+mod timer;
+#[cfg(capture)]
+mod capture;
 
 use nco::Nco;
 use led::Led;
+use uart::Uart;
+use timer::Timer;
 
 use picorv32_rt::entry;
 
 static LED: Led = Led::new();
 static NCO: Nco = Nco::new();
+static UART: Uart = Uart::new();
+static TIMER: Timer = Timer::new();
 
 #[entry]
 fn main() -> ! {
@@ -20,6 +33,35 @@ fn main() -> ! {
     NCO.enable(true);
 
     LED.enable(true);
+    UART.write(b"afm\r\n");
 
-    loop {}
+    // blink the LED at 1 Hz, asleep in between
+    let mut led = true;
+    TIMER.start_periodic(timer::CLOCK_FREQUENCY / 2);
+    irq::enable(csr::irq::enable::TIMER);
+    // commands for the logic analyzer, when the gateware has one
+    #[cfg(capture)]
+    {
+        csr::uart::irq_enable::write(csr::uart::irq_enable::RX_READY);
+        irq::enable(csr::irq::enable::UART | csr::irq::enable::CAPTURE);
+    }
+    loop {
+        let pending = irq::wait();
+        if pending & csr::irq::pending::TIMER != 0 {
+            led = !led;
+            LED.enable(led);
+        }
+        #[cfg(capture)]
+        {
+            if pending & csr::irq::pending::UART != 0 {
+                while let Some(byte) = UART.read_byte() {
+                    capture::command(&UART, byte);
+                }
+            }
+            if pending & csr::irq::pending::CAPTURE != 0 {
+                capture::dump(&UART);
+            }
+        }
+        irq::clear(pending);
+    }
 }
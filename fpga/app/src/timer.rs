@@ -0,0 +1,21 @@
+use crate::csr;
+
+pub const CLOCK_FREQUENCY: u32 = 16_000_000; // 16 Mhz
+
+pub struct Timer;
+
+impl Timer {
+    pub const fn new() -> Self {
+        Self
+    }
+
+    /// Raises the timer interrupt every `cycles` clock cycles.
+    pub fn start_periodic(&self, cycles: u32) {
+        csr::timer::period::write(cycles - 1);
+        csr::timer::ctrl::write(csr::timer::ctrl::ENABLE | csr::timer::ctrl::PERIODIC);
+    }
+
+    pub fn stop(&self) {
+        csr::timer::ctrl::write(0);
+    }
+}
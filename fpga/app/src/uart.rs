@@ -0,0 +1,38 @@
+use crate::csr;
+
+pub struct Uart;
+
+impl Uart {
+    pub const fn new() -> Self {
+        Self
+    }
+
+    pub fn write_byte(&self, byte: u8) {
+        while csr::uart::status::read() & csr::uart::status::TX_FULL != 0 {}
+        csr::uart::tx_data::write(byte as u32);
+    }
+
+    pub fn write(&self, bytes: &[u8]) {
+        for &byte in bytes {
+            self.write_byte(byte);
+        }
+    }
+
+    pub fn read_byte(&self) -> Option<u8> {
+        if csr::uart::status::read() & csr::uart::status::RX_EMPTY != 0 {
+            None
+        } else {
+            Some(csr::uart::rx_data::read() as u8)
+        }
+    }
+
+    /// Sends `bytes` by DMA; `bytes` must stay in place until `tx_busy` returns false.
+    pub fn send(&self, bytes: &'static [u8]) {
+        csr::uart::tx_dma_addr::write(bytes.as_ptr() as u32);
+        csr::uart::tx_dma_len::write(bytes.len() as u32);
+    }
+
+    pub fn tx_busy(&self) -> bool {
+        csr::uart::status::read() & csr::uart::status::TX_DMA_BUSY != 0
+    }
+}
@@ -0,0 +1,430 @@
+from typing import List
+
+from nmigen import Elaboratable, Module, Signal, Memory, Record, Mux, Cat, signed
+
+from csr import Bank, Register
+from picorv32 import dma_layout
+
+# Arbitrary waveforms for the DACs.
+#
+# `AWG` plays a table of samples from block RAM at a fractional rate, interpolating linearly between
+# neighbouring samples, so the DACs get a new value every clock however slowly the table is stepped through.
+# The table is double-buffered: the firmware (or the AWG's own DMA engine, from the CPU's RAM) fills the back
+# buffer while the front one plays, and a swap takes effect where the playback wraps, so a looping waveform
+# can be changed without a glitch. `SourceSelect` then picks, per DAC, the NCO, the AWG or their product.
+#
+# Samples are offset binary like the NCO's, two to a 32-bit word: the even one in the low half and the odd one
+# in the high half, each in the low `width` bits. The even and odd samples are kept in separate memories, so
+# both neighbours of any position are read in the same cycle from single-port block RAMs; that is why a
+# looping table needs an even number of samples.
+
+FRAC_BITS = 16 # fractional bits of the sample position and of `step`
+INTERP_BITS = 8 # of those, the ones used to interpolate
+
+NCO_SOURCE, AWG_SOURCE, PRODUCT_SOURCE = range(3)
+
+def playback(samples: List[int], step: int, cycles: int, width: int, loop: bool = True) -> List[int]:
+    """
+    Reference model: the AWG's output on each of ``cycles`` cycles from the start of ``samples`` (offset
+    binary, an even number of them), stepping ``step / 2**FRAC_BITS`` samples per cycle. Without ``loop`` the
+    output returns to midscale after the last sample.
+    """
+    length = len(samples) & ~1
+    out = []
+    position = 0
+    while len(out) < cycles:
+        i, frac = position >> FRAC_BITS, (position >> (FRAC_BITS - INTERP_BITS)) & ((1 << INTERP_BITS) - 1)
+        a, b = samples[i], samples[(i + 1) % length]
+        out.append(a + (((b - a) * frac) >> INTERP_BITS))
+        position += step
+        if position >> FRAC_BITS >= length:
+            if not loop:
+                break
+            position -= length << FRAC_BITS
+    return (out + [1 << (width - 1)] * cycles)[:cycles]
+
+class AWG(Elaboratable):
+    """
+    Arbitrary waveform generator with two buffers of ``samples`` ``width``-bit samples in block RAM, on ``out``.
+
+    Writing ``ctrl`` with ``enable`` set plays the front buffer from its start, ``step / 2**FRAC_BITS``
+    samples per cycle: a rate divider of ``n`` is a step of ``2**FRAC_BITS / n``. The first ``length`` samples
+    (an even number, at least 2) are played, then the table starts over with ``ctrl.loop`` set, and otherwise
+    ``out`` returns to midscale, where it also sits while stopped. ``out`` follows the sample position by
+    ``latency`` cycles.
+
+    The back buffer is written a pair of samples at a time, through ``data`` at pair index ``addr``, which
+    advances with each write, or by DMA: writing a number of words to ``dma_len`` copies them from the CPU's
+    RAM at ``dma_addr`` through ``dma`` (a ``PicoRV32`` ``dma`` port) to ``addr`` onwards. A ``data`` write
+    during a copy is not lost: it holds the copy off for a cycle or two and lands between two of its words.
+    Writing ``swap``
+    exchanges the buffers, and brings in ``length`` with the new front buffer, at once while stopped and
+    otherwise when the table next starts over or ends.
+    ``event`` pulses when a pending swap takes effect and when the playback ends.
+    """
+    latency = 3
+
+    def __init__(self, width: int = 12, samples: int = 1024):
+        assert samples >= 2 and samples & (samples - 1) == 0, "the buffers must hold a power of two of samples"
+        assert width <= 16
+        self.width = width
+        self.samples = samples
+        self.index_bits = samples.bit_length() - 1
+        # each memory holds half of each buffer, the front one selected by the top address bit
+        self.even = Memory(width=width, depth=samples, name="awg_even")
+        self.odd = Memory(width=width, depth=samples, name="awg_odd")
+
+        self.out = Signal(width, reset=1 << (width - 1))
+        self.event = Signal()
+        self.dma = Record(dma_layout(), name="awg_dma")
+
+        self.ctrl = Record([
+            ("enable", 1),
+            ("loop", 1),
+        ])
+        self.status = Record([
+            ("running", 1),
+            ("swap_pending", 1),
+            ("front", 1),
+            ("dma_busy", 1),
+        ])
+        self.step = Signal(FRAC_BITS + self.index_bits)
+        self.length = Signal(range(samples + 1))
+        self.swap = Signal()
+        self.addr = Signal(self.index_bits - 1)
+        self.data = Signal(32)
+        self.dma_addr = Signal(32)
+        self.dma_len = Signal(range(samples // 2 + 1))
+        self.dma_remaining = Signal(range(samples // 2 + 1))
+
+        self.registers = {register.name: register for register in [
+            Register("ctrl", self.ctrl),
+            Register("status", self.status, access="r"),
+            Register("step", self.step, desc=f"Samples per cycle, in units of 2**-{FRAC_BITS}."),
+            Register("length", self.length, desc="Samples to play from the back buffer once it is swapped in."),
+            Register("swap", self.swap, access="w", desc="Swaps the buffers when the table next starts over."),
+            Register("addr", self.addr, desc="Pair of samples in the back buffer written next.", hw_write=True),
+            Register("data", self.data, access="w", desc="Stores two samples at `addr` and moves on."),
+            Register("dma_addr", self.dma_addr),
+            Register("dma_len", self.dma_len, access="w", desc="Copies this many words from RAM to `addr`."),
+            Register("dma_remaining", self.dma_remaining, access="r"),
+        ]}
+
+    def csr_bank(self, name: str = "awg") -> Bank:
+        return Bank(name, self.registers.values(), desc="Arbitrary waveform generator.")
+
+    def elaborate(self, platform):
+        m = Module()
+        registers = self.registers
+        dma = self.dma
+        w = self.width
+        front = self.status.front
+        running = self.status.running
+        swap_pending = self.status.swap_pending
+
+        # loading the back buffer, by DMA or through `data`
+        m.submodules.even_w = even_w = self.even.write_port()
+        m.submodules.odd_w = odd_w = self.odd.write_port()
+        inflight = Signal()
+        dma_busy = self.dma_remaining != 0
+        # a `data` write that arrives with a DMA read's word waits, with no new reads requested, until the
+        # memories are free
+        data_pending = Signal()
+        m.d.comb += [
+            self.status.dma_busy.eq(dma_busy),
+            dma.req.eq(dma_busy & ~data_pending),
+            dma.we.eq(0),
+            dma.sel.eq(0b1111),
+        ]
+        # a read's data is there the cycle after its grant, so the next one can go out at the same time
+        m.d.sync += inflight.eq(dma.grant)
+        with m.If(registers["dma_len"].w_stb):
+            m.d.sync += [
+                dma.adr.eq(self.dma_addr[2:]),
+                self.dma_remaining.eq(self.dma_len),
+            ]
+        with m.Elif(dma.grant):
+            m.d.sync += [
+                dma.adr.eq(dma.adr + 1),
+                self.dma_remaining.eq(self.dma_remaining - 1),
+            ]
+
+        store_data = (registers["data"].w_stb | data_pending) & ~inflight
+        with m.If(store_data):
+            m.d.sync += data_pending.eq(0)
+        with m.Elif(registers["data"].w_stb):
+            m.d.sync += data_pending.eq(1)
+
+        word = Mux(inflight, dma.dat_r, self.data)
+        store = inflight | store_data
+        for port, half in [(even_w, word[:w]), (odd_w, word[16:16 + w])]:
+            m.d.comb += [
+                port.addr.eq(Cat(self.addr, ~front)),
+                port.data.eq(half),
+                port.en.eq(store),
+            ]
+        m.d.comb += [
+            registers["addr"].we.eq(store),
+            registers["addr"].w_data.eq(self.addr + 1),
+        ]
+
+        # playback: the position in the table, and the two samples either side of it
+        position = Signal(FRAC_BITS + self.index_bits + 1)
+        i = position[FRAC_BITS:]
+        # the length of the front buffer, which changes along with it
+        length = Signal.like(self.length)
+        wrap = (i + 1) == length
+        m.submodules.even_r = even_r = self.even.read_port(transparent=False)
+        m.submodules.odd_r = odd_r = self.odd.read_port(transparent=False)
+        m.d.comb += [
+            # i and i + 1 are an even and an odd sample, in one order or the other
+            even_r.addr.eq(Cat(Mux(wrap, 0, (i + 1) >> 1)[:self.index_bits - 1], front)),
+            odd_r.addr.eq(Cat((i >> 1)[:self.index_bits - 1], front)),
+        ]
+
+        swapped = Signal()
+        with m.If(registers["swap"].w_stb):
+            with m.If(running):
+                m.d.sync += swap_pending.eq(1)
+            with m.Else():
+                m.d.sync += [
+                    front.eq(~front),
+                    length.eq(Cat(0, self.length[1:])),
+                ]
+        with m.If(swapped):
+            m.d.sync += [
+                swap_pending.eq(0),
+                front.eq(~front),
+                length.eq(Cat(0, self.length[1:])),
+            ]
+
+        ended = Signal()
+        m.d.comb += self.event.eq(swapped | ended)
+        with m.If(registers["ctrl"].w_stb):
+            m.d.sync += [
+                running.eq(self.ctrl.enable),
+                position.eq(0),
+            ]
+        with m.Elif(running):
+            next_position = position + self.step
+            with m.If(next_position[FRAC_BITS:] >= length):
+                with m.If(self.ctrl.loop):
+                    m.d.sync += position.eq(next_position - (length << FRAC_BITS))
+                    m.d.comb += swapped.eq(swap_pending)
+                with m.Else():
+                    m.d.sync += running.eq(0)
+                    m.d.comb += [
+                        ended.eq(1),
+                        swapped.eq(swap_pending),
+                    ]
+            with m.Else():
+                m.d.sync += position.eq(next_position)
+
+        # interpolation, one stage for the difference times the fraction and one for the sum
+        odd_first = Signal()
+        frac = Signal(INTERP_BITS)
+        valid = Signal(2)
+        m.d.sync += [
+            odd_first.eq(i[0]),
+            frac.eq(position[FRAC_BITS - INTERP_BITS:FRAC_BITS]),
+            valid.eq(Cat(running, valid[0])),
+        ]
+        a = Mux(odd_first, odd_r.data, even_r.data)
+        b = Mux(odd_first, even_r.data, odd_r.data)
+        base = Signal(w)
+        ramp = Signal(signed(w + INTERP_BITS + 1))
+        m.d.sync += [
+            base.eq(a),
+            ramp.eq((b - a).as_signed() * frac),
+        ]
+        m.d.sync += self.out.eq(Mux(valid[1], base + (ramp >> INTERP_BITS), 1 << (w - 1)))
+
+        return m
+
+class SourceSelect(Elaboratable):
+    """
+    The signal for one DAC: ``nco``, ``awg`` or, for amplitude modulation, their product, as ``select`` is
+    ``NCO_SOURCE``, ``AWG_SOURCE`` or ``PRODUCT_SOURCE``. All inputs and ``out`` are ``width``-bit offset
+    binary; the product is scaled so full scale times full scale stays full scale. ``out`` follows the
+    inputs by ``latency`` cycles whichever is selected.
+    """
+    latency = 2
+
+    def __init__(self, width: int):
+        self.width = width
+
+        self.nco = Signal(width)
+        self.awg = Signal(width)
+        self.select = Signal(2)
+        self.out = Signal(width)
+
+    def elaborate(self, platform):
+        m = Module()
+        w = self.width
+
+        def signed_value(value):
+            return Cat(value[:-1], ~value[-1]).as_signed()
+
+        product = Signal(signed(2 * w))
+        nco = Signal(w)
+        awg = Signal(w)
+        m.d.sync += [
+            product.eq(signed_value(self.nco) * signed_value(self.awg)),
+            nco.eq(self.nco),
+            awg.eq(self.awg),
+        ]
+        # only -1 times -1 overflows
+        scaled = Signal(w)
+        m.d.comb += scaled.eq(Mux(product[-1] != product[-2], (1 << (w - 1)) - 1, product[w - 1:2 * w - 1]))
+        with m.Switch(self.select):
+            with m.Case(NCO_SOURCE):
+                m.d.sync += self.out.eq(nco)
+            with m.Case(AWG_SOURCE):
+                m.d.sync += self.out.eq(awg)
+            with m.Case(PRODUCT_SOURCE):
+                m.d.sync += self.out.eq(Cat(scaled[:-1], ~scaled[-1]))
+
+        return m
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    p_action = parser.add_subparsers(dest="action")
+    p_check = p_action.add_parser("check", help="load tables by CSR and DMA and play them back in simulation")
+    p_check.add_argument("--samples", type=int, default=64)
+    p_check.add_argument("--cycles", type=int, default=500)
+    p_check.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.action == "check":
+        import random
+        from nmigen.sim import Simulator, Passive, Settle
+        from csr import CSRBridge, CSRMap, wishbone_access
+
+        rng = random.Random(args.seed)
+        width = 12
+        m = Module()
+        m.submodules.awg = awg = AWG(width=width, samples=args.samples)
+        m.submodules.select = select = SourceSelect(width)
+        m.submodules.bridge = bridge = CSRBridge(CSRMap([awg.csr_bank()]))
+        sim = Simulator(m)
+        sim.add_clock(1e-6)
+
+        def table(n):
+            return [rng.randrange(1 << width) for _ in range(n)]
+        def words(samples):
+            return [samples[i] | samples[i + 1] << 16 for i in range(0, len(samples), 2)]
+
+        # the CPU's RAM, behind the DMA port; only granted every other cycle
+        ram = words(table(args.samples))
+        def dma_responder():
+            yield Passive()
+            cycle = 0
+            while True:
+                cycle += 1
+                yield Settle()
+                grant = (yield awg.dma.req) and cycle % 2
+                yield awg.dma.grant.eq(grant)
+                adr = yield awg.dma.adr
+                yield
+                if grant:
+                    yield awg.dma.dat_r.eq(ram[adr])
+        sim.add_sync_process(dma_responder)
+
+        def access(register, data=None):
+            return (yield from wishbone_access(bridge.bus, register, data))
+
+        def capture(cycles):
+            values = []
+            for _ in range(cycles):
+                yield
+                yield Settle()
+                values.append((yield awg.out))
+            return values
+
+        def play(step, loop, cycles):
+            # `ctrl` is written in the cycle the bridge acknowledges, and the first sample comes out
+            # `latency` cycles later, one of them the idle cycle after the access
+            yield from access(r["step"], step)
+            yield from access(r["ctrl"], 1 | int(loop) << 1)
+            for _ in range(AWG.latency - 2):
+                yield
+            return (yield from capture(cycles))
+
+        r = awg.registers
+        def proc():
+            # a table written through `data` into the back buffer, then swapped to the front
+            first = table(args.samples - 2)
+            yield from access(r["addr"], 0)
+            for word in words(first):
+                yield from access(r["data"], word)
+            yield from access(r["length"], len(first))
+            yield from access(r["swap"], 1)
+            for step, loop in [(0x4000, True), (0x1_0000, True), (0x2_8000, True), (0x6000, False)]:
+                got = yield from play(step, loop, args.cycles)
+                expected = playback(first, step, args.cycles, width, loop=loop)
+                assert got == expected, f"step {step:#x}: HDL {got[:8]}..., model {expected[:8]}..."
+            assert not (yield awg.status.running)
+
+            # a second table by DMA into the back buffer, swapped in where the looping first one starts over
+            yield from access(r["addr"], 0)
+            yield from access(r["dma_addr"], 0)
+            yield from access(r["dma_len"], len(ram))
+            while (yield from access(r["dma_remaining"])):
+                pass
+            second = [sample for word in ram for sample in (word & 0xffff, word >> 16)]
+            yield from access(r["length"], len(second))
+            step = 0x8000
+            yield from access(r["step"], step)
+            yield from access(r["ctrl"], 0b11)
+            yield from access(r["swap"], 1)
+            yield
+            assert (yield awg.status.swap_pending)
+            got = yield from capture(2 * args.cycles)
+            # once the first table wraps, the second plays from its start
+            period = (len(first) << 16) // step
+            switch = next(i for i in range(len(got)) if got[i:i + 8] == playback(second, step, 8, width))
+            assert switch <= period + AWG.latency + 8, switch
+            assert got[switch:] == playback(second, step, len(got) - switch, width)
+            assert not (yield awg.status.swap_pending)
+
+            # `data` writes in the middle of a copy into the back buffer, some on the cycles a DMA word lands;
+            # each goes in between two DMA words, and none of either is lost
+            extra = [rng.randrange(1 << 32) & 0x0fff_0fff for _ in range(8)]
+            copied = len(ram) - len(extra)
+            yield from access(r["addr"], 0)
+            yield from access(r["dma_addr"], 0)
+            yield from access(r["dma_len"], copied)
+            for word in extra:
+                for _ in range(rng.randrange(3)):
+                    yield
+                yield from access(r["data"], word)
+            while (yield from access(r["dma_remaining"])):
+                pass
+            back = (1 - (yield awg.status.front)) << (awg.index_bits - 1)
+            stored = []
+            for i in range(len(ram)):
+                stored.append((yield awg.even[back + i]) | (yield awg.odd[back + i]) << 16)
+            assert [word for word in stored if word not in extra] == ram[:copied]
+            assert [word for word in stored if word in extra] == extra
+
+            # the sources of a DAC
+            for source in [NCO_SOURCE, AWG_SOURCE, PRODUCT_SOURCE]:
+                yield select.select.eq(source)
+                for a, b in [(0, 0), (4095, 4095), (0, 4095), (2048, 3000), (1000, 2048), (3000, 1000)]:
+                    yield select.nco.eq(a)
+                    yield select.awg.eq(b)
+                    for _ in range(SourceSelect.latency):
+                        yield
+                    yield Settle()
+                    out = yield select.out
+                    product = ((a - 2048) * (b - 2048)) >> 11
+                    expected = {NCO_SOURCE: a, AWG_SOURCE: b, PRODUCT_SOURCE: min(product, 2047) + 2048}[source]
+                    assert out == expected, (source, a, b, out, expected)
+            print(f"AWG matches the model at 4 rates and swaps {switch} cycles into a {period}-cycle loop; "
+                f"the DAC sources select and multiply as expected")
+        sim.add_sync_process(proc)
+        sim.run()
+    else:
+        parser.print_usage()
@@ -0,0 +1,332 @@
+import json, os, platform, shutil, subprocess, sys, time
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional
+
+from nmigen import Elaboratable, Module, Signal
+from nmigen.back import rtlil
+
+# Performance regression benchmarks for the gateware and its tooling.
+#
+# Every run measures, for `Top` and for the NCO, the UART and the CPU on their own:
+#
+# * `elaborate.<design>.seconds`: elaborating the design and converting it to RTLIL, the best of a few runs.
+#   The firmware is built (or taken from the cache) once up front, so cargo never counts;
+# * `simulate.<design>.<engine>.cycles_per_second` on nMigen's Python simulator and on CXXRTL, with the
+#   inputs driven so the design is busy, and `simulate.<design>.cxxsim.build_seconds` for compiling CXXRTL;
+# * `synth.top.*`: logic cells, block RAMs and Fmax of the TinyFPGA BX build, and the time each toolchain
+#   stage took.
+#
+# Results go to `build/bench/<commit>.json` (`<commit>-dirty.json` for uncommitted changes) and are compared
+# with the results of the nearest ancestor commit benchmarked on the same host. A metric that got worse by
+# more than its threshold is a regression, and the run then exits with status 1. Steps whose tools are
+# missing (yosys for CXXRTL, the whole toolchain for synthesis) are skipped and their metrics left out.
+
+DEFAULT_RESULTS = "build/bench"
+
+# the metrics where more is better; for all others (times, resources) less is
+HIGHER_IS_BETTER = {"cycles_per_second", "fmax_mhz"}
+
+# how much worse a metric may get, as a fraction, by kind; timings are noisy, resource counts are not
+DEFAULT_THRESHOLDS = {
+    "seconds": 0.25,
+    "cycles_per_second": 0.25,
+    "lc": 0.02,
+    "ram": 0.0,
+    "fmax_mhz": 0.05,
+}
+
+Design = namedtuple('Design', 'design outputs')
+
+# the engines that can run each design; pysim skips the picorv32 core, so the CPU on its own only runs under CXXRTL
+DESIGN_ENGINES = {
+    "top": ["pysim", "cxxsim"],
+    "nco": ["pysim", "cxxsim"],
+    "uart": ["pysim", "cxxsim"],
+    "picorv32": ["cxxsim"],
+}
+
+def metric_kind(name: str) -> str:
+    kind = name.rsplit(".", 1)[-1]
+    return "seconds" if kind.endswith("seconds") else kind
+
+NCO_PHASE_STEP = 0x0123_4567
+
+class NCOBench(Elaboratable):
+    # the NCO stepping at a fixed rate, so its accumulator and table lookups switch every cycle
+    def __init__(self):
+        from nco import NCO
+        self.nco = NCO(width=12, samples=1024)
+        self.sin = Signal(12)
+        self.cos = Signal(12)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.nco = nco = self.nco
+        m.d.comb += [
+            nco.phase_step.eq(NCO_PHASE_STEP),
+            nco.enable.eq(1),
+            self.sin.eq(nco.sin),
+            self.cos.eq(nco.cos),
+        ]
+        return m
+
+class UARTBench(Elaboratable):
+    # the UART in loopback, sending a counting byte sequence back to back
+    def __init__(self):
+        from uart import UART
+        self.uart = UART(clk_freq=16e6, baud_rate=1e6)
+        self.rx_data = Signal(8)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.uart = uart = self.uart
+        m.d.comb += [
+            uart.rx_i.eq(uart.tx_o),
+            uart.tx_rdy.eq(1),
+            uart.rx_ack.eq(1),
+            self.rx_data.eq(uart.rx_data),
+        ]
+        with m.If(uart.tx_ack):
+            m.d.sync += uart.tx_data.eq(uart.tx_data + 1)
+        return m
+
+def make_designs(firmware: str) -> Dict[str, Callable[[], Design]]:
+    """
+    A fresh instance of each benchmarked design, by name, with the outputs to report; they are only built
+    to be elaborated, so each run makes its own.
+    """
+    from picorv32 import PicoRV32
+    from top import Top
+
+    def top():
+        top = Top(firmware=firmware, cache_dir=None)
+        cpu = top.picorv32
+        return Design(top, [top.led, cpu.cycles, cpu.fetches])
+    def nco():
+        bench = NCOBench()
+        return Design(bench, [bench.sin, bench.cos])
+    def uart():
+        bench = UARTBench()
+        return Design(bench, [bench.rx_data])
+    def picorv32():
+        cpu = PicoRV32([], firmware=firmware)
+        return Design(cpu, [cpu.cycles, cpu.fetches, cpu.wait_states])
+    return {"top": top, "nco": nco, "uart": uart, "picorv32": picorv32}
+
+def prepare_firmware(firmware: Optional[str], results_dir: str) -> str:
+    # the app as it stands, whose default `csr.rs` `top.py csr` keeps in step with the default `Top`, written out so
+    # every design loads it as a prebuilt image
+    import numpy as np
+    from firmware import load_firmware
+
+    if firmware is not None:
+        return firmware
+    words = load_firmware()
+    path = os.path.join(results_dir, "app.bin")
+    np.asarray(words, dtype="<u4").tofile(path)
+    return path
+
+def bench_elaboration(designs: Dict[str, Callable[[], Design]], repeat: int) -> dict:
+    results = {}
+    for name, make in designs.items():
+        best = None
+        for _ in range(repeat):
+            design = make()
+            start = time.perf_counter()
+            rtlil.convert(design.design, ports=design.outputs)
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        results[f"elaborate.{name}.seconds"] = best
+    return results
+
+def bench_simulation(designs: Dict[str, Callable[[], Design]], engines: List[str], cycles: Dict[str, int],
+        results_dir: str) -> dict:
+    from cxxsim import CxxrtlSimulation, run_pysim
+
+    results = {}
+    for name, make in designs.items():
+        for engine in engines:
+            if engine not in DESIGN_ENGINES[name]:
+                continue
+            design = make()
+            if engine == "pysim":
+                seconds, _ = run_pysim(design.design, design.outputs, cycles=cycles[engine], clk_freq=16e6)
+            else:
+                sim = CxxrtlSimulation(design.design, design.outputs, verilog_files=["picorv32.v"],
+                    build_dir=os.path.join(results_dir, "cxxsim", name))
+                start = time.perf_counter()
+                sim.build()
+                results[f"simulate.{name}.cxxsim.build_seconds"] = time.perf_counter() - start
+                seconds, _ = sim.run(cycles=cycles[engine])
+            results[f"simulate.{name}.{engine}.cycles_per_second"] = cycles[engine] / seconds
+    return results
+
+def bench_synthesis(firmware: str, results_dir: str) -> dict:
+    from nmigen_boards.tinyfpga_bx import TinyFPGABXPlatform
+    from build_cache import StageTimer, build
+    from sweep import parse_nextpnr_log
+    from top import Top
+
+    build_dir = os.path.join(results_dir, "synth")
+    timer = StageTimer()
+    build(TinyFPGABXPlatform(), Top(firmware=firmware, cache_dir=None), build_dir=build_dir, force=True, timer=timer)
+    report = parse_nextpnr_log(os.path.join(build_dir, "top.tim"))
+    results = {
+        "synth.top.lc": report["lc"],
+        "synth.top.ram": report["ram"],
+        "synth.top.fmax_mhz": min(report["fmax_mhz"].values()),
+    }
+    for stage, seconds in timer.stages:
+        if seconds is not None:
+            results[f"synth.top.{stage.replace('-', '_').replace(' ', '_')}_seconds"] = seconds
+    return results
+
+def _git(*args) -> str:
+    return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+
+def revision() -> dict:
+    """
+    The commit being benchmarked, and whether the gateware has uncommitted changes on top of it; outside a git
+    checkout the commit is "unknown".
+    """
+    try:
+        return {
+            "commit": _git("rev-parse", "HEAD"),
+            "dirty": bool(_git("status", "--porcelain", "--", ".")),
+        }
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return {"commit": "unknown", "dirty": False}
+
+def host() -> str:
+    return f"{platform.node()} {platform.machine()} Python {platform.python_version()}"
+
+def results_path(results_dir: str, rev: dict) -> str:
+    return os.path.join(results_dir, f"{rev['commit']}{'-dirty' if rev['dirty'] else ''}.json")
+
+def find_baseline(results_dir: str, rev: dict, host_name: str, depth: int = 100) -> Optional[str]:
+    """
+    The results of the nearest commit before ``rev`` (or of ``rev`` itself, for uncommitted changes) that
+    was benchmarked on ``host_name``, whose timings are the only ones comparable.
+    """
+    if rev["commit"] == "unknown":
+        return None
+    commits = _git("rev-list", f"--max-count={depth}", rev["commit"]).split()
+    if not rev["dirty"]:
+        commits = commits[1:]
+    for commit in commits:
+        path = os.path.join(results_dir, f"{commit}.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                if json.load(f)["host"] == host_name:
+                    return path
+    return None
+
+Change = namedtuple('Change', 'name baseline current change regression')
+
+def compare(baseline: dict, current: dict, thresholds: Dict[str, float] = DEFAULT_THRESHOLDS) -> List[Change]:
+    """
+    The metrics in both ``baseline`` and ``current``, with the relative change of each, positive when it got
+    worse, and whether that is beyond its kind's threshold.
+    """
+    changes = []
+    for name in sorted(set(baseline) & set(current)):
+        old, new = baseline[name], current[name]
+        if old == new:
+            change = 0.0
+        elif old == 0:
+            change = float("inf")
+        else:
+            change = (new - old) / abs(old)
+        kind = metric_kind(name)
+        if kind in HIGHER_IS_BETTER:
+            change = -change
+        changes.append(Change(name, old, new, change, change > thresholds.get(kind, 0.0)))
+    return changes
+
+def format_changes(changes: List[Change]) -> str:
+    def cell(value):
+        return f"{value:.4g}" if isinstance(value, float) else str(value)
+    header = ["metric", "baseline", "current", "worse by", ""]
+    lines = [header] + [[change.name, cell(change.baseline), cell(change.current), f"{change.change:+.1%}",
+        "REGRESSION" if change.regression else ""] for change in changes]
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    return "\n".join("  ".join(c.ljust(w) if i == 0 else c.rjust(w) for i, (c, w) in enumerate(zip(line, widths)))
+        .rstrip() for line in lines)
+
+if __name__ == "__main__":
+    import argparse
+
+    def threshold(text):
+        kind, _, fraction = text.partition("=")
+        if kind not in DEFAULT_THRESHOLDS:
+            raise argparse.ArgumentTypeError(f"unknown metric kind {kind!r}")
+        return kind, float(fraction)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threshold", type=threshold, action="append", default=[], metavar="KIND=FRACTION",
+        help=f"allowed worsening of a kind of metric (default {DEFAULT_THRESHOLDS})")
+    p_action = parser.add_subparsers(dest="action")
+    p_run = p_action.add_parser("run", help="benchmark the working tree and compare with an earlier commit")
+    p_run.add_argument("--firmware", metavar="APP_BIN", help="use a prebuilt firmware image instead of running cargo")
+    p_run.add_argument("--engine", nargs="+", choices=["pysim", "cxxsim"], default=["pysim", "cxxsim"])
+    p_run.add_argument("--pysim-cycles", type=int, default=20_000)
+    p_run.add_argument("--cxxsim-cycles", type=int, default=2_000_000)
+    p_run.add_argument("--repeat", type=int, default=3, help="elaborations per design, the fastest counts")
+    p_run.add_argument("--no-synth", action="store_true", help="skip the yosys/nextpnr build")
+    p_run.add_argument("--results", default=DEFAULT_RESULTS, metavar="DIR")
+    p_run.add_argument("--baseline", metavar="FILE", help="compare with these results instead of an earlier commit's")
+    p_compare = p_action.add_parser("compare", help="compare two result files")
+    p_compare.add_argument("baseline")
+    p_compare.add_argument("current")
+
+    args = parser.parse_args()
+    thresholds = dict(DEFAULT_THRESHOLDS, **dict(args.threshold))
+
+    if args.action == "run":
+        os.makedirs(args.results, exist_ok=True)
+        rev = revision()
+        host_name = host()
+        firmware = prepare_firmware(args.firmware, args.results)
+        designs = make_designs(firmware)
+
+        metrics = bench_elaboration(designs, repeat=args.repeat)
+        engines = list(args.engine)
+        if "cxxsim" in engines and shutil.which("yosys") is None:
+            print("skipping cxxsim: yosys not found")
+            engines.remove("cxxsim")
+        metrics.update(bench_simulation(designs, engines, {"pysim": args.pysim_cycles, "cxxsim": args.cxxsim_cycles},
+            args.results))
+        if not args.no_synth:
+            missing = [tool for tool in ["yosys", "nextpnr-ice40", "icepack"] if shutil.which(tool) is None]
+            if missing:
+                print(f"skipping synthesis: {', '.join(missing)} not found")
+            else:
+                metrics.update(bench_synthesis(firmware, args.results))
+
+        path = results_path(args.results, rev)
+        with open(path, "w") as f:
+            json.dump(dict(rev, host=host_name, time=time.time(), metrics=metrics), f, indent=2)
+        print(f"results written to {path}")
+
+        baseline = args.baseline or find_baseline(args.results, rev, host_name)
+        if baseline is None:
+            for name, value in sorted(metrics.items()):
+                print(f"  {name} = {value:.4g}")
+            print("no earlier results from this host to compare with")
+            sys.exit(0)
+        with open(baseline) as f:
+            changes = compare(json.load(f)["metrics"], metrics, thresholds)
+    elif args.action == "compare":
+        with open(args.baseline) as f:
+            old = json.load(f)["metrics"]
+        with open(args.current) as f:
+            changes = compare(old, json.load(f)["metrics"], thresholds)
+    else:
+        parser.print_usage()
+        sys.exit(2)
+
+    print(format_changes(changes))
+    regressions = [change for change in changes if change.regression]
+    if regressions:
+        print(f"{len(regressions)} regression(s)")
+        sys.exit(1)
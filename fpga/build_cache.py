@@ -0,0 +1,283 @@
+import hashlib, inspect, json, os, re, subprocess, sys, time, warnings
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+from nmigen import Elaboratable, Module, Instance, Signal, Memory, Record, ClockSignal, ResetSignal
+from nmigen.hdl.ast import SignalDict
+from nmigen.hdl.ir import Fragment
+from nmigen.back import rtlil
+
+# A faster edit-build loop for `top.py build`, `program` and `generate`.
+#
+# Each step is skipped when a hash of what goes into it is unchanged:
+#
+# * `Cached` converts a leaf of the design (an NCO, a DAC) to RTLIL on its own and stores it under a fingerprint
+#   of its class, the sources it is built from and its constructor parameters; later builds instantiate the
+#   stored module instead of elaborating it again.
+# * `build` hashes the netlist, constraints and scripts handed to the toolchain, without the `src` attributes
+#   that shift whenever a line moves, and only runs yosys, nextpnr and icepack when that hash differs from the
+#   last successful build in the directory. The toolchain runs one command at a time, and the time spent in
+#   each stage is reported.
+# * `generate_verilog` keeps the Verilog for every netlist it has converted.
+
+DEFAULT_CACHE_DIR = "build/cache"
+
+_SRC_ATTRIBUTE = re.compile(rb"^\s*attribute \\src .*\n", re.MULTILINE)
+
+def _write_atomic(path: str, content: str):
+    # parallel builds (see sweep.py) may fill the same cache entry at once
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+class StageTimer:
+    """
+    Wall-clock time per named stage of a build, in the order the stages ran.
+    """
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    def skipped(self, name: str):
+        self.stages.append((name, None))
+
+    def summary(self) -> str:
+        width = max(len(name) for name, _ in self.stages)
+        lines = [f"{name:<{width}}  " + ("cached" if seconds is None else f"{seconds:7.2f} s")
+            for name, seconds in self.stages]
+        total = sum(seconds for _, seconds in self.stages if seconds is not None)
+        return "\n".join(lines + [f"{'total':<{width}}  {total:7.2f} s"])
+
+def _local_modules(module, seen: dict):
+    # the module and every module it uses from the same directory, i.e. the gateware sources it depends on
+    path = getattr(module, "__file__", None)
+    if path is None or module.__name__ in seen:
+        return
+    seen[module.__name__] = path
+    root = os.path.dirname(os.path.abspath(path))
+    for value in list(vars(module).values()):
+        dependency = value if inspect.ismodule(value) else inspect.getmodule(value)
+        dependency_path = getattr(dependency, "__file__", None)
+        if dependency_path is not None and os.path.dirname(os.path.abspath(dependency_path)) == root:
+            _local_modules(dependency, seen)
+
+def _parameter(value, path: str):
+    # a JSON-able description of a constructor parameter or of something derived from one
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_parameter(v, f"{path}[{i}]") for i, v in enumerate(value)]
+    if isinstance(value, dict):
+        return {str(k): _parameter(v, f"{path}.{k}") for k, v in value.items()}
+    if isinstance(value, Signal):
+        return ["Signal", value.name, value.width, value.signed, value.reset]
+    if isinstance(value, Record):
+        return ["Record", [_parameter(field, f"{path}.{name}") for name, field in value.fields.items()]]
+    if isinstance(value, Memory):
+        return ["Memory", value.width, value.depth,
+            hashlib.sha256(json.dumps([int(v) for v in value.init]).encode()).hexdigest()]
+    if isinstance(value, Elaboratable):
+        return ["Elaboratable", fingerprint(value)]
+    if hasattr(value, "tolist"):
+        # NumPy scalars and arrays
+        return _parameter(value.tolist(), path)
+    raise TypeError(f"cannot fingerprint {path} of type {type(value).__name__}")
+
+def fingerprint(elaboratable: Elaboratable) -> str:
+    """
+    A hash of ``elaboratable``'s class, the sources of its module and of the local modules that one uses, and
+    its public attributes, which hold its constructor parameters, its port signals and its memories' contents.
+    """
+    cls = type(elaboratable)
+    modules = {}
+    _local_modules(sys.modules[cls.__module__], modules)
+    h = hashlib.sha256(f"{cls.__module__}.{cls.__qualname__}".encode())
+    for name in sorted(modules):
+        with open(modules[name], "rb") as f:
+            h.update(name.encode())
+            h.update(hashlib.sha256(f.read()).digest())
+    # private attributes include nMigen's own bookkeeping, which refers back to the object
+    params = {name: _parameter(value, name) for name, value in vars(elaboratable).items() if not name.startswith("_")}
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()
+
+def _prefix_modules(text: str, name: str) -> str:
+    # submodules are named after their attribute alone, which would clash between separately converted netlists
+    # read into one yosys session
+    renames = {module: f"{name}.{module}" for module in re.findall(r"^module \\(\S+)$", text, re.MULTILINE)
+        if module != name}
+    def rename(match):
+        return match.group(1) + "\\" + renames.get(match.group(2), match.group(2))
+    return re.sub(r"^(module |\s*cell )\\(\S+)", rename, text, flags=re.MULTILINE)
+
+class Cached(Elaboratable):
+    """
+    ``elaboratable``, built from RTLIL cached under ``cache_dir`` when the design is built for a platform.
+
+    The cached module is instantiated with ``ports`` (which must have distinct names) and the clock and reset
+    of every domain it uses, so it can still be wrapped in a ``DomainRenamer``. Without a platform, as in
+    simulation, ``elaboratable`` is used as it is. Only leaves of the design should be cached: anything that
+    reaches into the internals of the wrapped module from outside is lost.
+    """
+    def __init__(self, elaboratable: Elaboratable, ports: Iterable[Signal], cache_dir: str = DEFAULT_CACHE_DIR):
+        self.elaboratable = elaboratable
+        self.ports = list(ports)
+        self.cache_dir = cache_dir
+        assert len({port.name for port in self.ports}) == len(self.ports), "port names must be distinct"
+
+    def _convert(self, key: str, name: str) -> dict:
+        fragment = Fragment.get(self.elaboratable, None).prepare(ports=self.ports)
+        text, name_map = rtlil.convert_fragment(fragment, name=name)
+        text = _prefix_modules(text, name)
+        roles = SignalDict()
+        for domain in fragment.domains.values():
+            roles[domain.clk] = ["clk", domain.name]
+            if domain.rst is not None:
+                roles[domain.rst] = ["rst", domain.name]
+        ports = [[name_map[signal][-1], direction, *roles.get(signal, ["port", signal.name])]
+            for signal, direction in fragment.ports.items()]
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for ext, content in [("il", text), ("json", json.dumps({"name": name, "ports": ports}))]:
+            _write_atomic(os.path.join(self.cache_dir, f"{key}.{ext}"), content)
+        return {"name": name, "ports": ports}
+
+    def elaborate(self, platform):
+        if platform is None:
+            return self.elaboratable
+
+        try:
+            key = fingerprint(self.elaboratable)[:16]
+        except TypeError as e:
+            warnings.warn(f"not caching {type(self.elaboratable).__name__}: {e}")
+            return self.elaboratable
+        name = f"{type(self.elaboratable).__name__.lower()}_{key}"
+        try:
+            with open(os.path.join(self.cache_dir, f"{key}.json")) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            meta = self._convert(key, name)
+        with open(os.path.join(self.cache_dir, f"{key}.il")) as f:
+            platform.add_file(f"{name}.il", f.read())
+
+        by_name = {port.name: port for port in self.ports}
+        connections = {}
+        for port, direction, role, target in meta["ports"]:
+            if role == "clk":
+                value = ClockSignal(target)
+            elif role == "rst":
+                value = ResetSignal(target)
+            else:
+                value = by_name[target]
+            connections[f"{direction}_{port}"] = value
+
+        m = Module()
+        m.submodules.cached = Instance(meta["name"], **connections)
+        return m
+
+def netlist_digest(files: dict) -> str:
+    """
+    A hash of a build plan's ``files`` that ignores ``src`` attributes in RTLIL and the debug Verilog, which is
+    not built from.
+    """
+    h = hashlib.sha256()
+    for filename in sorted(files):
+        if filename.endswith(".debug.v"):
+            continue
+        content = files[filename]
+        if isinstance(content, str):
+            content = content.encode()
+        if filename.endswith(".il"):
+            content = _SRC_ATTRIBUTE.sub(b"", content)
+        h.update(filename.encode())
+        h.update(hashlib.sha256(content).digest())
+    return h.hexdigest()
+
+def _script_commands(script: str, count: int):
+    # the build script's setup lines, and its last `count` lines, which are the toolchain commands
+    lines = [line for line in script.splitlines() if line.strip()]
+    return "\n".join(lines[:-count]), lines[-count:]
+
+def _stage_name(command: str) -> str:
+    # commands start with the tool's environment variable, e.g. "$NEXTPNR_ICE40"
+    return command.split()[0].strip('"$').lower().replace("_", "-")
+
+def build(platform, top: Elaboratable, name: str = "top", build_dir: str = "build", do_program: bool = False,
+        force: bool = False, timer: Optional[StageTimer] = None, **kwargs):
+    """
+    ``platform.build``, skipping the toolchain when the netlist is the same as in the last build in
+    ``build_dir``, with the time of each stage recorded in ``timer``. Returns the build products.
+    """
+    from nmigen.build.run import LocalBuildProducts
+
+    timer = timer if timer is not None else StageTimer()
+    with timer.stage("elaborate"):
+        plan = platform.build(top, name=name, build_dir=build_dir, do_build=False, **kwargs)
+
+    digest = netlist_digest(plan.files)
+    stamp = os.path.join(build_dir, f"{name}.netlist")
+    previous = None
+    if os.path.exists(stamp) and os.path.exists(os.path.join(build_dir, f"{name}.bin")):
+        with open(stamp) as f:
+            previous = f.read().strip()
+
+    setup, commands = _script_commands(plan.files[f"{plan.script}.sh"], len(platform.command_templates))
+    if digest == previous and not force:
+        for command in commands:
+            timer.skipped(_stage_name(command))
+    else:
+        with timer.stage("write files"):
+            plan.execute_local(build_dir, run_script=False)
+        if os.path.exists(stamp):
+            os.remove(stamp)
+        for command in commands:
+            with timer.stage(_stage_name(command)):
+                subprocess.run(["sh", "-c", f"{setup}\n{command}"], cwd=build_dir, check=True)
+        with open(stamp, "w") as f:
+            f.write(digest)
+
+    products = LocalBuildProducts(os.path.abspath(build_dir))
+    if do_program:
+        with timer.stage("program"):
+            platform.toolchain_program(products, name)
+    return products
+
+def generate_verilog(top: Elaboratable, ports: List[Signal], name: str = "top",
+        cache_dir: str = DEFAULT_CACHE_DIR, timer: Optional[StageTimer] = None) -> str:
+    """
+    ``verilog.convert(top, name=name, ports=ports)``, with yosys only run for a netlist not converted before.
+    The netlist is hashed with its ``src`` attributes, which end up in the Verilog too.
+    """
+    timer = timer if timer is not None else StageTimer()
+    with timer.stage("elaborate"):
+        text = rtlil.convert(top, name=name, ports=ports)
+    key = hashlib.sha256(text.encode()).hexdigest()[:16]
+    path = os.path.join(cache_dir, f"{name}-{key}.v")
+    if os.path.exists(path):
+        timer.skipped("yosys")
+        with open(path) as f:
+            return f.read()
+
+    # the netlist just elaborated goes to yosys as it is, with the passes `verilog.convert` runs
+    os.makedirs(cache_dir, exist_ok=True)
+    stem = f"{name}-{key}.{os.getpid()}"
+    with open(os.path.join(cache_dir, f"{stem}.il"), "w") as f:
+        f.write(text)
+    script = f"read_rtlil {stem}.il\nproc -nomux\nmemory_collect\nwrite_verilog -norename {stem}.v\n"
+    with open(os.path.join(cache_dir, f"{stem}.ys"), "w") as f:
+        f.write(script)
+    with timer.stage("yosys"):
+        subprocess.run(["yosys", "-q", f"{stem}.ys"], cwd=cache_dir).check_returncode()
+    for ext in ["il", "ys"]:
+        os.remove(os.path.join(cache_dir, f"{stem}.{ext}"))
+    os.replace(os.path.join(cache_dir, f"{stem}.v"), path)
+    with open(path) as f:
+        return f.read()
@@ -0,0 +1,303 @@
+from typing import Dict
+
+from nmigen import Elaboratable, Module, Signal, Memory, Record, Value, Mux, Cat
+
+from csr import Bank, Register
+
+# On-chip logic analyzer.
+#
+# `LogicAnalyzer` samples a set of probes into a block RAM ring buffer until a trigger fires, then fills the
+# rest of the buffer, so a capture holds a chosen number of entries from before the trigger and the remainder
+# from after it. The firmware reads the buffer back through CSRs and sends it over the UART (see
+# `app/src/capture.rs`), and `capture_dump.py` turns it into traces or a VCD on the host.
+#
+# Each entry is the probes' values followed by `run_bits` of run length. With run-length compression on, a
+# sample equal to the one before only bumps the run length of the last entry, so slow signals and the DACs'
+# bitstreams, which sit at one level for several cycles at a time, cover far more cycles per entry.
+
+class LogicAnalyzer(Elaboratable):
+    """
+    Captures ``probes``, a dict of named values of up to 32 bits in all, into ``depth`` entries of block RAM.
+    The probes are sampled one cycle late, on one cycle in every ``decimation + 1``.
+
+    Writing ``arm`` starts a capture. The trigger fires on the first sample whose bits in ``trigger_mask``
+    equal those of ``trigger_value`` (so a zero mask triggers at once), or with ``ctrl.edge`` on the first such
+    sample after one that did not match; writing ``force`` makes the next sample trigger regardless. Either
+    waits until ``pretrigger`` entries have been captured. The capture ends ``depth - pretrigger`` entries after
+    the trigger, where ``event`` pulses. With ``ctrl.rle``, a sample equal to the last one adds to that entry's
+    run length instead of taking an entry, until the run length reaches its maximum.
+
+    The buffer is read oldest entry first, the trigger's at index ``pretrigger``: writing an index to
+    ``read_addr`` selects that entry, and each read of ``read_data`` returns the next of its ``entry_words``
+    words, least significant first, moving on to the next entry after the last. ``layout`` describes the
+    entries for ``capture_dump.py``.
+    """
+    def __init__(self, probes: Dict[str, Value], depth: int = 512, run_bits: int = 8, clk_freq: float = 16e6):
+        assert depth >= 2 and depth & (depth - 1) == 0, "the buffer must hold a power of two of entries"
+        self.probes = {name: Value.cast(probe) for name, probe in probes.items()}
+        self.width = sum(len(probe) for probe in self.probes.values())
+        assert 0 < self.width <= 32, "the trigger registers cover at most 32 bits of probes"
+        self.depth = depth
+        self.run_bits = run_bits
+        self.clk_freq = clk_freq
+        self.entry_words = (self.width + run_bits + 31) // 32
+        self.mem = Memory(width=self.width + run_bits, depth=depth, name="capture")
+
+        self.event = Signal()
+
+        self.ctrl = Record([
+            ("edge", 1),
+            ("rle", 1),
+        ])
+        self.arm = Signal()
+        self.force = Signal()
+        self.status = Record([
+            ("armed", 1),
+            ("triggered", 1),
+            ("done", 1),
+        ])
+        self.trigger_mask = Signal(self.width)
+        self.trigger_value = Signal(self.width)
+        self.pretrigger = Signal(range(depth))
+        self.decimation = Signal(16)
+        # constants, so the firmware can dump any configuration
+        self.depth_reg = Signal(range(depth + 1), reset=depth)
+        self.entry_words_reg = Signal(range(self.entry_words + 1), reset=self.entry_words)
+        self.read_addr = Signal(range(depth))
+        self.read_data = Signal(32)
+
+        self.registers = {register.name: register for register in [
+            Register("ctrl", self.ctrl),
+            Register("arm", self.arm, access="w", desc="Starts a capture."),
+            Register("force", self.force, access="w", desc="Triggers the armed capture on its next sample."),
+            Register("status", self.status, access="r"),
+            Register("trigger_mask", self.trigger_mask, desc="Probe bits the trigger looks at."),
+            Register("trigger_value", self.trigger_value),
+            Register("pretrigger", self.pretrigger, desc="Entries kept from before the trigger."),
+            Register("decimation", self.decimation, desc="Cycles skipped between samples."),
+            Register("depth", self.depth_reg, access="r"),
+            Register("entry_words", self.entry_words_reg, access="r"),
+            Register("read_addr", self.read_addr, desc="Entry read next, counted from the oldest.", hw_write=True),
+            Register("read_data", self.read_data, access="r", desc="Next word of the entry at `read_addr`."),
+        ]}
+
+    def csr_bank(self, name: str = "capture") -> Bank:
+        return Bank(name, self.registers.values(), desc="Logic analyzer.")
+
+    def layout(self) -> dict:
+        offsets, offset = [], 0
+        for name, probe in self.probes.items():
+            offsets.append({"name": name, "offset": offset, "width": len(probe)})
+            offset += len(probe)
+        return {
+            "probes": offsets,
+            "depth": self.depth,
+            "run_bits": self.run_bits,
+            "entry_words": self.entry_words,
+            "clk_freq": self.clk_freq,
+        }
+
+    def elaborate(self, platform):
+        m = Module()
+        registers = self.registers
+        status = self.status
+        index_bits = self.depth.bit_length() - 1
+
+        sample = Signal(self.width)
+        m.d.sync += sample.eq(Cat(*self.probes.values()))
+
+        # one sample every `decimation + 1` cycles, the first as soon as the capture is armed
+        countdown = Signal.like(self.decimation)
+        tick = status.armed & (countdown == 0)
+        with m.If(registers["arm"].w_stb):
+            m.d.sync += countdown.eq(0)
+        with m.Elif(tick):
+            m.d.sync += countdown.eq(self.decimation)
+        with m.Elif(countdown != 0):
+            m.d.sync += countdown.eq(countdown - 1)
+
+        # the open entry, whose run length may still grow
+        addr = Signal(index_bits)
+        value = Signal(self.width)
+        run = Signal(self.run_bits)
+        fresh = Signal()
+        # entries taken in all and since the trigger, and where the oldest one to keep is
+        filled = Signal(range(self.depth + 1))
+        post = Signal(range(self.depth + 1))
+        oldest = Signal(index_bits)
+
+        match = ((sample ^ self.trigger_value) & self.trigger_mask) == 0
+        last_match = Signal()
+        force_pending = Signal()
+        hit = (~status.triggered & (filled >= self.pretrigger)
+            & (force_pending | Mux(self.ctrl.edge, match & ~last_match, match)))
+        extend = self.ctrl.rle & ~fresh & (sample == value) & (run != (1 << self.run_bits) - 1) & ~hit
+        next_addr = Mux(fresh, addr, addr + 1)[:index_bits]
+
+        m.submodules.write = write = self.mem.write_port()
+        with m.If(registers["force"].w_stb):
+            m.d.sync += force_pending.eq(1)
+        with m.If(registers["arm"].w_stb):
+            m.d.sync += [
+                status.armed.eq(1),
+                status.triggered.eq(0),
+                status.done.eq(0),
+                fresh.eq(1),
+                filled.eq(0),
+                post.eq(0),
+                force_pending.eq(0),
+                # an edge needs a sample that does not match first
+                last_match.eq(1),
+            ]
+        with m.Elif(tick):
+            m.d.sync += last_match.eq(match)
+            # a full buffer ends the capture before a repeated sample can extend the last entry, which with a
+            # constant input would keep it open for up to `2**run_bits` more samples
+            with m.If(status.triggered & (post == self.depth - self.pretrigger)):
+                m.d.sync += [
+                    status.armed.eq(0),
+                    status.done.eq(1),
+                ]
+                m.d.comb += self.event.eq(1)
+            with m.Elif(extend):
+                m.d.comb += [
+                    write.addr.eq(addr),
+                    write.data.eq(Cat(value, run + 1)),
+                    write.en.eq(1),
+                ]
+                m.d.sync += run.eq(run + 1)
+            with m.Else():
+                m.d.comb += [
+                    write.addr.eq(next_addr),
+                    write.data.eq(Cat(sample, Signal(self.run_bits))),
+                    write.en.eq(1),
+                ]
+                m.d.sync += [
+                    addr.eq(next_addr),
+                    value.eq(sample),
+                    run.eq(0),
+                    fresh.eq(0),
+                    filled.eq(Mux(filled == self.depth, filled, filled + 1)),
+                ]
+                with m.If(status.triggered | hit):
+                    m.d.sync += post.eq(post + 1)
+                with m.If(hit):
+                    m.d.sync += [
+                        status.triggered.eq(1),
+                        force_pending.eq(0),
+                        oldest.eq(next_addr - self.pretrigger),
+                    ]
+
+        # reading back, a word at a time
+        m.submodules.read = read = self.mem.read_port(transparent=False)
+        word = Signal(range(self.entry_words))
+        m.d.comb += read.addr.eq(oldest + self.read_addr)
+        padded = Cat(read.data, Signal(32 * self.entry_words - len(read.data)))
+        m.d.comb += self.read_data.eq(padded.word_select(word, 32))
+        with m.If(registers["read_addr"].w_stb):
+            m.d.sync += word.eq(0)
+        with m.Elif(registers["read_data"].r_stb):
+            with m.If(word == self.entry_words - 1):
+                m.d.sync += word.eq(0)
+                m.d.comb += [
+                    registers["read_addr"].we.eq(1),
+                    registers["read_addr"].w_data.eq(self.read_addr + 1),
+                ]
+            with m.Else():
+                m.d.sync += word.eq(word + 1)
+
+        return m
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    p_action = parser.add_subparsers(dest="action")
+    p_check = p_action.add_parser("check", help="capture known signals in simulation and decode the dump")
+    p_check.add_argument("--depth", type=int, default=64)
+
+    args = parser.parse_args()
+    if args.action == "check":
+        import struct
+        from nmigen.sim import Simulator
+        from csr import CSRBridge, CSRMap, wishbone_access
+        from capture_dump import read_dump, traces
+
+        # probes that are functions of the cycle count, so every sample says when it was taken: a slow
+        # counter, and a bit that toggles every few cycles like a DAC's output
+        m = Module()
+        cycle = Signal(16)
+        m.d.sync += cycle.eq(cycle + 1)
+        probes = {"slow": cycle[4:14], "bit": cycle[1] & cycle[3]}
+        m.submodules.analyzer = analyzer = LogicAnalyzer(probes, depth=args.depth)
+        m.submodules.bridge = bridge = CSRBridge(CSRMap([analyzer.csr_bank()]))
+        sim = Simulator(m)
+        sim.add_clock(1 / analyzer.clk_freq)
+
+        def expected(at):
+            return {"slow": (at >> 4) & 0x3ff, "bit": (at >> 1) & (at >> 3) & 1}
+
+        def access(register, data=None):
+            return (yield from wishbone_access(bridge.bus, register, data))
+
+        def dump():
+            # what `app/src/capture.rs` sends
+            words = []
+            for name in ["ctrl", "pretrigger", "decimation", "depth", "entry_words"]:
+                words.append((yield from access(r[name])))
+            yield from access(r["read_addr"], 0)
+            for _ in range(words[3] * words[4]):
+                words.append((yield from access(r["read_data"])))
+            return b"LA01" + struct.pack(f"<{len(words)}I", *words)
+
+        def capture(ctrl, mask, value, pretrigger, decimation, force=False):
+            for name, data in [("ctrl", ctrl), ("trigger_mask", mask), ("trigger_value", value),
+                    ("pretrigger", pretrigger), ("decimation", decimation)]:
+                yield from access(r[name], data)
+            yield from access(r["arm"], 1)
+            if force:
+                yield from access(r["force"], 1)
+            while not (yield from access(r["status"])) & 0b100:
+                pass
+            return read_dump((yield from dump()), analyzer.layout())
+
+        def check(dumped, name):
+            # the samples agree with one start cycle, `decimation + 1` cycles apart, and the trigger is where
+            # the dump says
+            signals = traces(dumped, analyzer.layout())
+            period = 1 / analyzer.clk_freq
+            ticks = [round(t / period) for t in signals["slow"].times]
+            start = next((start for start in range(1 << 14) if all(
+                {n: int(signals[n].values[i]) for n in probes} == expected(start + ticks[i]) for i in range(len(ticks)))),
+                None)
+            assert start is not None, f"{name}: the samples are not the probes at any one start cycle"
+            assert len(ticks) == args.depth
+            return start, ticks, {n: [int(v) for v in signals[n].values] for n in probes}
+
+        r = analyzer.registers
+        def proc():
+            # a value match with half the buffer before it, no compression
+            dumped = yield from capture(0, 0x3ff, 0x23, args.depth // 2, 0)
+            start, ticks, values = check(dumped, "value")
+            assert values["slow"][args.depth // 2] == 0x23 and values["slow"][args.depth // 2 - 1] == 0x22
+            assert ticks[-1] == args.depth - 1
+
+            # decimated by 3, and forced
+            dumped = yield from capture(0, 0x3ff, 0x3ff, 4, 2, force=True)
+            start, ticks, values = check(dumped, "forced")
+            assert ticks[1] - ticks[0] == 3
+
+            # a rising edge of `bit` with compression, where each entry covers a whole run
+            dumped = yield from capture(0b11, 0x400, 0x400, 8, 0)
+            start, ticks, values = check(dumped, "edge")
+            assert values["bit"][8] == 1 and values["bit"][7] == 0
+            covered = ticks[-1] + 1
+            assert covered > 2 * args.depth
+            # the capture ends with the sample that filled the buffer, even though the next one repeats it
+            assert dumped.entries[-1] >> analyzer.width == 0
+            print(f"value, forced and edge triggers captured {args.depth} entries each; "
+                f"run-length compression covered {covered} cycles")
+        sim.add_sync_process(proc)
+        sim.run()
+    else:
+        parser.print_usage()
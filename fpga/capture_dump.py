@@ -0,0 +1,149 @@
+import struct
+from collections import namedtuple
+from typing import Dict
+import numpy as np
+
+from vcd_reader import Trace
+
+# Host side of the logic analyzer (`capture.py`): arms a capture through the firmware over the UART, and
+# turns the dump it sends back into the same `Trace`s that `vcd_reader.read_vcd` returns, or into a VCD
+# that `plot_vcd.py` plots like a simulation's.
+#
+# A dump is `MAGIC`, five little-endian words (`ctrl`, `pretrigger`, `decimation`, `depth` and
+# `entry_words`) and then `depth` entries of `entry_words` words, oldest first. What the bits of an entry
+# mean comes from the analyzer's `layout()`, which `top.py csr` writes next to the register map.
+
+MAGIC = b"LA01"
+
+CTRL_EDGE = 0x1
+CTRL_RLE = 0x2
+
+Capture = namedtuple('Capture', 'ctrl pretrigger decimation entries')
+
+def arm_command(mask: int, value: int, pretrigger: int, decimation: int = 0, edge: bool = False,
+        rle: bool = False) -> bytes:
+    """
+    The bytes that make the firmware configure the analyzer and arm it.
+    """
+    ctrl = (CTRL_EDGE if edge else 0) | (CTRL_RLE if rle else 0)
+    return b"c" + struct.pack("<5I", ctrl, mask, value, pretrigger, decimation)
+
+def read_dump(data: bytes, layout: dict) -> Capture:
+    """
+    Decode a dump, ignoring anything before its ``MAGIC``. Entries come out as unsigned integers.
+    """
+    start = data.find(MAGIC)
+    if start < 0:
+        raise ValueError("no capture in the dump")
+    header = data[start + len(MAGIC):start + len(MAGIC) + 20]
+    if len(header) < 20:
+        raise ValueError("the dump ends in its header")
+    ctrl, pretrigger, decimation, depth, entry_words = struct.unpack("<5I", header)
+    if (depth, entry_words) != (layout["depth"], layout["entry_words"]):
+        raise ValueError(f"the dump has {depth} entries of {entry_words} words, the layout "
+            f"{layout['depth']} of {layout['entry_words']}; is it from another bitstream?")
+    assert entry_words <= 2
+
+    words = np.frombuffer(data, dtype='<u4', count=depth * entry_words, offset=start + len(MAGIC) + 20)
+    words = words.astype(np.uint64).reshape(depth, entry_words)
+    entries = words[:, 0]
+    if entry_words > 1:
+        entries = entries | words[:, 1] << np.uint64(32)
+    return Capture(ctrl, pretrigger, decimation, entries)
+
+def traces(capture: Capture, layout: dict) -> Dict[str, Trace]:
+    """
+    A ``Trace`` per probe, one sample per entry, with times in seconds from the oldest entry; the trigger's
+    entry is number ``capture.pretrigger``.
+    """
+    width = sum(probe["width"] for probe in layout["probes"])
+    runs = (capture.entries >> np.uint64(width)) & np.uint64((1 << layout["run_bits"]) - 1)
+    cycles = (runs.astype(np.int64) + 1) * (capture.decimation + 1)
+    times = np.concatenate(([0], np.cumsum(cycles)[:-1])) / layout["clk_freq"]
+
+    result = {}
+    for probe in layout["probes"]:
+        mask = np.uint64((1 << probe["width"]) - 1)
+        values = (capture.entries >> np.uint64(probe["offset"])) & mask
+        result[probe["name"]] = Trace(times=times, values=values.astype(np.int64))
+    return result
+
+def write_vcd(path: str, signals: Dict[str, Trace], widths: Dict[str, int], timescale: float = 1e-9,
+        scope: str = "top"):
+    """
+    Write ``signals`` as a VCD under ``scope``, so ``plot_vcd.py`` finds them as ``top.<name>``.
+    """
+    idents = {name: chr(33 + i) for i, name in enumerate(signals)}
+    changes = []
+    for name, trace in signals.items():
+        ticks = np.round(trace.times / timescale).astype(np.int64)
+        keep = np.concatenate(([True], trace.values[1:] != trace.values[:-1]))
+        for tick, value in zip(ticks[keep], trace.values[keep]):
+            if widths[name] == 1:
+                changes.append((int(tick), f"{value}{idents[name]}"))
+            else:
+                changes.append((int(tick), f"b{value:b} {idents[name]}"))
+    changes.sort(key=lambda change: change[0])
+
+    with open(path, "w") as f:
+        f.write(f"$timescale {round(timescale / 1e-9)}ns $end\n$scope module {scope} $end\n")
+        for name in signals:
+            f.write(f"$var wire {widths[name]} {idents[name]} {name} $end\n")
+        f.write("$upscope $end\n$enddefinitions $end\n")
+        time = None
+        for tick, change in changes:
+            if tick != time:
+                f.write(f"#{tick}\n")
+                time = tick
+            f.write(change + "\n")
+
+if __name__ == "__main__":
+    import argparse, json
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("layout", help="analyzer layout written by `top.py csr`")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--port", help="arm a capture on the board at this serial port and wait for it")
+    source.add_argument("--input", metavar="FILE", help="decode a dump saved earlier with --save")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--mask", type=lambda text: int(text, 0), default=0,
+        help="probe bits the trigger looks at; 0 triggers at once")
+    parser.add_argument("--value", type=lambda text: int(text, 0), default=0)
+    parser.add_argument("--edge", action="store_true", help="trigger when the probes start to match")
+    parser.add_argument("--pretrigger", type=int, default=0, help="entries to keep from before the trigger")
+    parser.add_argument("--decimate", type=int, default=1, metavar="N", help="sample one cycle in every N")
+    parser.add_argument("--rle", action="store_true", help="run-length compress repeated samples")
+    parser.add_argument("--save", metavar="FILE", help="keep the raw dump")
+    parser.add_argument("--vcd", metavar="FILE", help="write the capture as a VCD for plot_vcd.py")
+    parser.add_argument("--npz", metavar="FILE", help="write <probe>_times and <probe>_values arrays")
+
+    args = parser.parse_args()
+    with open(args.layout) as f:
+        layout = json.load(f)
+
+    if args.port is not None:
+        import serial
+        entry_bytes = 4 * layout["entry_words"]
+        size = len(MAGIC) + 20 + layout["depth"] * entry_bytes
+        with serial.Serial(args.port, args.baud) as port:
+            port.write(arm_command(args.mask, args.value, args.pretrigger, args.decimate - 1, edge=args.edge,
+                rle=args.rle))
+            data = port.read_until(MAGIC)
+            data = MAGIC + port.read(size - len(MAGIC))
+    else:
+        with open(args.input, "rb") as f:
+            data = f.read()
+    if args.save is not None:
+        with open(args.save, "wb") as f:
+            f.write(data)
+
+    capture = read_dump(data, layout)
+    signals = traces(capture, layout)
+    trigger = next(iter(signals.values())).times[capture.pretrigger]
+    print(f"{len(capture.entries)} entries over {next(iter(signals.values())).times[-1]:.6f} s, "
+        f"triggered at {trigger:.6f} s")
+    if args.vcd is not None:
+        write_vcd(args.vcd, signals, {probe["name"]: probe["width"] for probe in layout["probes"]})
+    if args.npz is not None:
+        np.savez(args.npz, **{f"{name}_{field}": getattr(trace, field) for name, trace in signals.items()
+            for field in Trace._fields})
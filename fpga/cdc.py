@@ -0,0 +1,124 @@
+from nmigen import Elaboratable, Module, Signal, Value
+from nmigen.lib.cdc import FFSynchronizer
+
+# Clock domain crossing for control registers.
+#
+# nMigen's `FFSynchronizer` is only safe for single bits: the bits of a wider value can each land a cycle
+# apart, so the far side may see a mix of the old and the new value for a cycle. `BusSynchronizer` instead
+# moves a whole value with a toggle handshake, so every value seen on the far side is one that was on the
+# input.
+
+class BusSynchronizer(Elaboratable):
+    """
+    Copies ``i``, a multi-bit value in ``i_domain``, to ``o`` in ``o_domain``.
+
+    The input is sampled into a holding register, which only changes once the far side has acknowledged the
+    previous value, and a request toggle is sent across; when it arrives ``o`` takes the held value. Transfers
+    run back to back, so ``o`` follows ``i`` within one round trip of ``stages`` flip-flops each way, but
+    values that last shorter than that can be skipped. It suits registers like a phase step, not data streams;
+    use an ``AsyncFIFO`` for those.
+
+    ``o`` keeps its reset value until the first transfer. It can be any assignable value, for example a
+    ``Cat`` of the signals a register drives on the far side.
+    """
+    def __init__(self, i, o, *, i_domain: str = "sync", o_domain: str = "sync", stages: int = 2):
+        i, o = Value.cast(i), Value.cast(o)
+        assert len(i) == len(o)
+        self.i = i
+        self.o = o
+        self.i_domain = i_domain
+        self.o_domain = o_domain
+        self.stages = stages
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # the holding register is only read on the far side once its toggle has crossed, so it needs no
+        # synchronizer of its own
+        hold = Signal(len(self.i))
+        req = Signal()
+        ack = Signal()
+        req_o = Signal()
+        ack_i = Signal()
+        m.submodules.req_sync = FFSynchronizer(req, req_o, o_domain=self.o_domain, stages=self.stages)
+        m.submodules.ack_sync = FFSynchronizer(ack, ack_i, o_domain=self.i_domain, stages=self.stages)
+
+        with m.If(req == ack_i):
+            m.d[self.i_domain] += [
+                hold.eq(self.i),
+                req.eq(~req),
+            ]
+
+        with m.If(req_o != ack):
+            m.d[self.o_domain] += [
+                self.o.eq(hold),
+                ack.eq(req_o),
+            ]
+
+        return m
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    p_action = parser.add_subparsers(dest="action")
+    p_check = p_action.add_parser("check", help="cross random values between unrelated clocks in simulation")
+    p_check.add_argument("--i-period", type=float, default=62.5, help="input clock period in ns")
+    p_check.add_argument("--o-period", type=float, default=13.3, help="output clock period in ns")
+    p_check.add_argument("--values", type=int, default=200)
+    p_check.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.action == "check":
+        import random
+        from nmigen import ClockDomain
+        from nmigen.sim import Simulator, Passive
+
+        rng = random.Random(args.seed)
+        values = [rng.getrandbits(32) for _ in range(args.values)]
+
+        m = Module()
+        m.domains.src = ClockDomain()
+        m.domains.dst = ClockDomain()
+        i = Signal(32)
+        o = Signal(32, reset=0x1234_5678)
+        m.submodules.dut = dut = BusSynchronizer(i, o, i_domain="src", o_domain="dst")
+
+        sim = Simulator(m)
+        sim.add_clock(args.i_period * 1e-9, domain="src")
+        sim.add_clock(args.o_period * 1e-9, domain="dst")
+
+        # the input changes every few of its cycles, sometimes faster than a round trip
+        def source():
+            for value in values:
+                yield i.eq(value)
+                for _ in range(rng.randint(1, 8)):
+                    yield
+            # hold the last value for a few round trips
+            round_trip = 2 * (dut.stages + 1) * max(args.i_period, args.o_period) / args.i_period
+            for _ in range(4 * int(round_trip)):
+                yield
+        sim.add_sync_process(source, domain="src")
+
+        seen = [o.reset]
+        def sink():
+            yield Passive()
+            while True:
+                yield
+                value = yield o
+                if value != seen[-1]:
+                    seen.append(value)
+        sim.add_sync_process(sink, domain="dst")
+        sim.run()
+
+        # every value seen must have been on the input, in order, and the last one must get through; the
+        # input is 0 until the source process first sets it
+        values.insert(0, 0)
+        assert seen[-1] == values[-1], f"last value {seen[-1]:#x} never became {values[-1]:#x}"
+        position = 0
+        for value in seen[1:]:
+            assert value in values[position:], f"{value:#x} was never sent, or arrived out of order"
+            position = values.index(value, position)
+        print(f"{len(seen) - 1} changes crossed intact for {args.values} input values")
+    else:
+        parser.print_usage()
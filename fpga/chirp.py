@@ -0,0 +1,298 @@
+from collections import namedtuple
+from typing import List
+
+from nmigen import Elaboratable, Module, Signal, Memory, Record, Mux, Cat
+from nmigen.hdl.rec import Layout
+
+from csr import Bank, Register
+
+# Frequency sweeps without the CPU.
+#
+# `ChirpEngine` sits in front of an NCO's `phase_step` and plays a list of segments from block RAM, each
+# holding the step for a number of cycles while ramping it linearly or exponentially. Only the step changes,
+# never the NCO's accumulator, so the output stays phase-continuous, and the next segment is fetched while
+# the current one plays, so segments follow each other on the exact cycle.
+
+HOLD, LINEAR, EXP_UP, EXP_DOWN = range(4)
+
+def segment_layout() -> Layout:
+    return Layout([
+        ("step", 32),      # phase step at the start of the segment
+        ("delta", 32),     # signed increment for LINEAR
+        ("duration", 32),  # cycles, at least 2
+        ("interval", 16),  # the ramp is applied every `interval + 1` cycles
+        ("shift", 5),      # EXP_UP/EXP_DOWN multiply the step by `1 +/- 2**-shift`
+        ("mode", 2),
+        ("last", 1),       # end of the list: stop, or start over with `ctrl.loop`
+    ])
+
+Segment = namedtuple('Segment', 'step duration delta interval shift mode last', defaults=(0, 0, 0, HOLD, False))
+
+def linear_segment(start: int, stop: int, duration: int, interval: int = 0, last: bool = False) -> Segment:
+    """
+    A segment ramping from phase step ``start`` towards ``stop`` over ``duration`` cycles, in as equal steps
+    as the integer ``delta`` allows.
+    """
+    updates = max((duration - 1) // (interval + 1), 1)
+    return Segment(start, duration, delta=(stop - start) // updates, interval=interval, mode=LINEAR, last=last)
+
+def encode_segment(segment: Segment) -> int:
+    # the memory word for `segment`, fields packed as in `segment_layout`
+    value, offset = 0, 0
+    for name, width in [(name, shape[0] if isinstance(shape, tuple) else shape.width)
+            for name, shape in segment_layout().fields.items()]:
+        value |= (int(getattr(segment, name)) & ((1 << width) - 1)) << offset
+        offset += width
+    return value
+
+def sweep_steps(segments: List[Segment], start: int, cycles: int, loop: bool = False) -> List[int]:
+    """
+    Reference model: the phase step on each of ``cycles`` cycles from the first cycle of segment ``start``.
+    After the last segment the step holds.
+    """
+    steps = []
+    index = start
+    step = segments[index].step
+    while len(steps) < cycles:
+        segment = segments[index]
+        step = segment.step
+        countdown = segment.interval
+        for cycle in range(max(segment.duration, 2) - 1, -1, -1):
+            steps.append(step)
+            if cycle == 0:
+                break
+            if countdown == 0:
+                countdown = segment.interval
+                if segment.mode == LINEAR:
+                    step = (step + segment.delta) & 0xffff_ffff
+                elif segment.mode == EXP_UP:
+                    step = (step + (step >> segment.shift)) & 0xffff_ffff
+                elif segment.mode == EXP_DOWN:
+                    step = step - (step >> segment.shift)
+            else:
+                countdown -= 1
+        if segment.last:
+            if not loop:
+                break
+            index = start
+        else:
+            index += 1
+    return (steps + [step] * cycles)[:cycles]
+
+class ChirpEngine(Elaboratable):
+    """
+    Phase step generator playing up to ``segments`` sweep segments (see ``segment_layout``) from block RAM.
+
+    The firmware writes a segment's fields to ``seg_step``, ``seg_delta`` and ``seg_duration`` and commits it
+    at ``seg_addr`` by writing ``seg_config``, which also advances ``seg_addr``, so a list is loaded with
+    consecutive writes. Writing an index to ``start`` plays the list from that segment, two cycles later, until
+    a segment marked ``last``; ``stop`` ends it early. Either way ``phase_step`` then holds its last value, and
+    writing ``step`` sets it directly. ``done`` is raised when a list runs out and stays up until the next
+    ``start``.
+    """
+    def __init__(self, segments: int = 64):
+        self.segments = segments
+        self.memory = Memory(width=len(Record(segment_layout())), depth=segments, name="chirp_segments")
+
+        self.phase_step = Signal(32)
+        self.done = Signal()
+
+        self.ctrl = Record([("loop", 1)])
+        self.status = Record([
+            ("busy", 1),
+            ("done", 1),
+        ])
+        self.step = Signal(32)
+        self.start = Signal(range(segments))
+        self.stop = Signal()
+        self.seg_addr = Signal(range(segments))
+        self.seg_step = Signal(32)
+        self.seg_delta = Signal(32)
+        self.seg_duration = Signal(32)
+        self.seg_config = Record([
+            ("interval", 16),
+            ("shift", 5),
+            ("mode", 2),
+            ("last", 1),
+        ])
+
+        self.registers = {register.name: register for register in [
+            Register("ctrl", self.ctrl),
+            Register("status", self.status, access="r"),
+            Register("step", self.step, desc="Sets the phase step, 2**32 per turn per clock cycle."),
+            Register("phase_step", self.phase_step, access="r", desc="The phase step in use."),
+            Register("start", self.start, access="w", desc="Plays the segments from this index."),
+            Register("stop", self.stop, access="w"),
+            Register("seg_addr", self.seg_addr, hw_write=True),
+            Register("seg_step", self.seg_step),
+            Register("seg_delta", self.seg_delta),
+            Register("seg_duration", self.seg_duration),
+            Register("seg_config", self.seg_config, access="w",
+                desc="Stores the segment at `seg_addr` and moves on to the next one."),
+        ]}
+
+    def csr_bank(self, name: str = "chirp") -> Bank:
+        return Bank(name, self.registers.values(), desc="Frequency sweep engine in front of the NCO.")
+
+    def elaborate(self, platform):
+        m = Module()
+        registers = self.registers
+
+        m.submodules.write_port = write_port = self.memory.write_port()
+        m.submodules.read_port = read_port = self.memory.read_port(transparent=False)
+        m.d.comb += [
+            write_port.addr.eq(self.seg_addr),
+            write_port.data.eq(Cat(self.seg_step, self.seg_delta, self.seg_duration, self.seg_config)),
+            write_port.en.eq(registers["seg_config"].w_stb),
+        ]
+        m.d.comb += [
+            registers["seg_addr"].we.eq(registers["seg_config"].w_stb),
+            registers["seg_addr"].w_data.eq(self.seg_addr + 1),
+        ]
+
+        # the read port holds the prefetched segment until it is needed
+        m.d.comb += read_port.en.eq(0)
+        fetched = Record(segment_layout())
+        m.d.comb += fetched.eq(read_port.data)
+
+        # the segment playing, and the cycles left in it
+        segment = Record(segment_layout())
+        remaining = Signal(32)
+        countdown = Signal(16)
+        first = Signal(range(self.segments))
+        index = Signal(range(self.segments))
+        loading = Signal()
+        busy = self.status.busy
+
+        def enter(next_index):
+            # start the segment on the read port now, and fetch the one after it
+            m.d.sync += [
+                segment.eq(fetched),
+                self.phase_step.eq(fetched.step),
+                remaining.eq(Mux(fetched.duration < 2, 2, fetched.duration)),
+                countdown.eq(fetched.interval),
+                index.eq(next_index),
+                busy.eq(1),
+            ]
+            m.d.comb += [
+                read_port.addr.eq(Mux(fetched.last, first, next_index + 1)),
+                read_port.en.eq(1),
+            ]
+
+        with m.If(registers["start"].w_stb):
+            m.d.comb += [
+                read_port.addr.eq(self.start),
+                read_port.en.eq(1),
+            ]
+            m.d.sync += [
+                first.eq(self.start),
+                loading.eq(1),
+                busy.eq(0),
+                self.status.done.eq(0),
+            ]
+        with m.Elif(registers["stop"].w_stb):
+            m.d.sync += [
+                loading.eq(0),
+                busy.eq(0),
+            ]
+        with m.Elif(loading):
+            m.d.sync += loading.eq(0)
+            enter(first)
+        with m.Elif(busy):
+            with m.If(remaining == 1):
+                with m.If(segment.last & ~self.ctrl.loop):
+                    m.d.sync += [
+                        busy.eq(0),
+                        self.status.done.eq(1),
+                    ]
+                with m.Else():
+                    enter(Mux(segment.last, first, index + 1))
+            with m.Else():
+                m.d.sync += remaining.eq(remaining - 1)
+                with m.If(countdown == 0):
+                    m.d.sync += countdown.eq(segment.interval)
+                    with m.Switch(segment.mode):
+                        with m.Case(LINEAR):
+                            m.d.sync += self.phase_step.eq(self.phase_step + segment.delta)
+                        with m.Case(EXP_UP):
+                            m.d.sync += self.phase_step.eq(self.phase_step + (self.phase_step >> segment.shift))
+                        with m.Case(EXP_DOWN):
+                            m.d.sync += self.phase_step.eq(self.phase_step - (self.phase_step >> segment.shift))
+                with m.Else():
+                    m.d.sync += countdown.eq(countdown - 1)
+
+        with m.If(registers["step"].w_stb):
+            m.d.sync += self.phase_step.eq(self.step)
+
+        m.d.comb += self.done.eq(self.status.done)
+
+        return m
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    p_action = parser.add_subparsers(dest="action")
+    p_check = p_action.add_parser("check", help="load and play a list of segments through the CSRs in simulation")
+    p_check.add_argument("--cycles", type=int, default=600)
+
+    args = parser.parse_args()
+    if args.action == "check":
+        from nmigen.sim import Simulator
+        from csr import CSRBridge, CSRMap, wishbone_access
+
+        segments = [
+            Segment(0x1000_0000, duration=2),
+            linear_segment(0x1000_0000, 0x2000_0000, duration=40, interval=3),
+            Segment(0x0800_0000, duration=25, interval=0, shift=3, mode=EXP_UP),
+            Segment(0x4000_0000, duration=30, interval=1, shift=4, mode=EXP_DOWN),
+            Segment(0x0000_1234, delta=-0x10, duration=17, mode=LINEAR, last=True),
+        ]
+        # one list played once from its start, and the tail of it looped
+        runs = [(0, False), (2, True)]
+
+        dut = ChirpEngine(segments=8)
+        bridge = CSRBridge(CSRMap([dut.csr_bank()]))
+        registers = dut.registers
+        m = Module()
+        m.submodules.dut = dut
+        m.submodules.bridge = bridge
+
+        sim = Simulator(m)
+        sim.add_clock(1e-6)
+
+        def access(register, data=None):
+            return (yield from wishbone_access(bridge.bus, register, data))
+
+        def proc():
+            for segment in segments:
+                yield from access(registers["seg_step"], segment.step)
+                yield from access(registers["seg_delta"], segment.delta & 0xffff_ffff)
+                yield from access(registers["seg_duration"], segment.duration)
+                yield from access(registers["seg_config"], segment.interval | segment.shift << 16
+                    | segment.mode << 21 | int(segment.last) << 23)
+            yield
+            for i, segment in enumerate(segments):
+                assert (yield dut.memory[i]) == encode_segment(segment), f"segment {i} stored wrongly"
+
+            for start, loop in runs:
+                yield from access(registers["ctrl"], int(loop))
+                yield from access(registers["start"], start)
+                # `start` is strobed in the cycle the bridge acknowledges, and the first segment plays two
+                # cycles later, the first of them the idle cycle after the access
+                expected = sweep_steps(segments, start, args.cycles, loop=loop)
+                for i, step in enumerate(expected):
+                    yield
+                    got = yield dut.phase_step
+                    assert got == step, f"start {start}, cycle {i}: HDL {got:#x}, model {step:#x}"
+                assert (yield dut.done) == (not loop)
+                yield from access(registers["stop"], 1)
+
+            yield from access(registers["step"], 0x1234_5678)
+            yield
+            assert (yield from access(registers["phase_step"])) == 0x1234_5678
+            print(f"ChirpEngine matches the model for {len(runs)} runs of {args.cycles} cycles")
+        sim.add_sync_process(proc)
+        sim.run()
+    else:
+        parser.print_usage()
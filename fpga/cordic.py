@@ -0,0 +1,128 @@
+import math
+from typing import Optional
+
+from nmigen import Elaboratable, Module, Signal, Mux, Cat, signed
+
+# Sine and cosine without a table.
+#
+# `CORDIC` rotates the vector (A / K, 0) by the input phase in `iterations` shift-and-add steps, one pipeline
+# stage each, so it takes no block RAM at all and produces one result per clock; `CordicNCO` puts a phase
+# accumulator in front of it and can stand in for `NCO` wherever that is used.
+
+def cordic_angles(iterations: int, angle_bits: int) -> list:
+    # atan(2**-i) in units of 2**-angle_bits turns
+    return [int(round(math.atan(2.0 ** -i) / (2 * math.pi) * (1 << angle_bits))) for i in range(iterations)]
+
+def cordic_gain(iterations: int) -> float:
+    return math.prod(math.sqrt(1 + 2.0 ** (-2 * i)) for i in range(iterations))
+
+class CORDICParameters:
+    """
+    What ``CORDIC`` derives from its parameters: the stage count and widths, the angle of each stage and the
+    starting ``x0``. ``CordicNCOModel`` uses them without building the gateware.
+    """
+    def __init__(self, width: int, iterations: Optional[int] = None, angle_bits: Optional[int] = None):
+        self.width = width
+        self.iterations = iterations if iterations is not None else width + 1
+        self.angle_bits = angle_bits if angle_bits is not None else width + 4
+        self.guard_bits = (self.iterations - 1).bit_length() + 1
+        self.data_width = width + self.guard_bits + 1
+        self.angles = cordic_angles(self.iterations, self.angle_bits)
+        # the rotation scales the vector by the CORDIC gain; start short of full scale to end up just under it
+        self.x0 = int(round(((1 << (width - 1)) - 1) * (1 << self.guard_bits) / cordic_gain(self.iterations)))
+
+        self.latency = self.iterations + 2
+
+class CORDIC(CORDICParameters, Elaboratable):
+    """
+    Pipelined CORDIC rotator computing ``sin`` and ``cos`` of ``phase`` (a full turn is ``2**angle_bits``) as
+    ``width``-bit two's complement numbers, with a result every cycle, ``latency`` cycles after its phase.
+
+    The phase is first folded into [-90, 90) degrees, where the rotation converges, by turning it half a turn
+    and negating the result. ``iterations`` defaults to ``width + 1``, which leaves a residual angle below one
+    output LSB; ``angle_bits`` defaults to ``width + 4``. The datapath carries ``guard_bits`` extra bits to
+    absorb the rounding of the shifts.
+    """
+    def __init__(self, width: int, iterations: Optional[int] = None, angle_bits: Optional[int] = None):
+        super().__init__(width, iterations=iterations, angle_bits=angle_bits)
+
+        self.phase = Signal(self.angle_bits)
+        self.sin = Signal(signed(width))
+        self.cos = Signal(signed(width))
+
+    def elaborate(self, platform):
+        m = Module()
+        p = self.phase
+
+        # fold the phase into [-90, 90) degrees
+        x = Signal(signed(self.data_width), name="x0")
+        y = Signal(signed(self.data_width), name="y0")
+        z = Signal(signed(self.angle_bits), name="z0")
+        neg = Signal(name="neg0")
+        flip = p[-1] ^ p[-2]
+        m.d.sync += [
+            x.eq(self.x0),
+            y.eq(0),
+            z.eq(Cat(p[:-1], p[-1] ^ flip)),
+            neg.eq(flip),
+        ]
+
+        # one rotation per stage, towards z = 0
+        for i, angle in enumerate(self.angles):
+            x_next = Signal.like(x, name=f"x{i + 1}")
+            y_next = Signal.like(y, name=f"y{i + 1}")
+            z_next = Signal.like(z, name=f"z{i + 1}")
+            neg_next = Signal(name=f"neg{i + 1}")
+            up = z >= 0
+            m.d.sync += [
+                x_next.eq(Mux(up, x - (y >> i), x + (y >> i))),
+                y_next.eq(Mux(up, y + (x >> i), y - (x >> i))),
+                z_next.eq(Mux(up, z - angle, z + angle)),
+                neg_next.eq(neg),
+            ]
+            x, y, z, neg = x_next, y_next, z_next, neg_next
+
+        # undo the fold, round off the guard bits and saturate
+        hi, lo = (1 << (self.width - 1)) - 1, -(1 << (self.width - 1))
+        def output(value):
+            rounded = Signal(signed(self.data_width + 1))
+            m.d.comb += rounded.eq((Mux(neg, -value, value) + (1 << (self.guard_bits - 1))) >> self.guard_bits)
+            return Mux(rounded > hi, hi, Mux(rounded < lo, lo, rounded))
+        m.d.sync += [
+            self.sin.eq(output(y)),
+            self.cos.eq(output(x)),
+        ]
+
+        return m
+
+class CordicNCO(Elaboratable):
+    """
+    Drop-in replacement for ``NCO`` with a ``CORDIC`` in place of the lookup table. ``sin`` and ``cos`` are in
+    offset binary like ``NCO``'s and follow the phase accumulator by ``latency`` cycles.
+    """
+    def __init__(self, width: int, iterations: Optional[int] = None, angle_bits: Optional[int] = None):
+        self.width = width
+        self.cordic = CORDIC(width=width, iterations=iterations, angle_bits=angle_bits)
+        self.iterations = self.cordic.iterations
+        self.latency = self.cordic.latency
+
+        self.enable = Signal()
+        self.sin = Signal(width)
+        self.cos = Signal(width)
+        self.phase_step = Signal(32)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.cordic = cordic = self.cordic
+
+        phase_acc = Signal(32)
+        # with m.If(self.enable):
+        m.d.sync += phase_acc.eq(phase_acc + self.phase_step)
+
+        m.d.comb += [
+            cordic.phase.eq(phase_acc[-cordic.angle_bits:]),
+            self.sin.eq(Cat(cordic.sin[:-1], ~cordic.sin[-1])),
+            self.cos.eq(Cat(cordic.cos[:-1], ~cordic.cos[-1])),
+        ]
+
+        return m
@@ -0,0 +1,74 @@
+from typing import Optional, Tuple, Union
+import numpy as np
+
+from cordic import CORDICParameters
+from nco_model import PHASE_BITS
+
+def wrap(value: np.ndarray, bits: int) -> np.ndarray:
+    # two's complement wraparound of a `bits`-wide signed signal
+    return ((value + (1 << (bits - 1))) & ((1 << bits) - 1)) - (1 << (bits - 1))
+
+class CordicNCOModel:
+    """
+    Bit-exact NumPy model of ``CordicNCO``, with the same ``run`` contract as ``NCOModel``.
+
+    Like ``PipelinedNCOModel``, every pipeline register is a one-cycle shift of its input with the register's
+    reset value in front, so the start-up transient comes out exactly as in the HDL.
+    """
+
+    def __init__(self, width: int, iterations: Optional[int] = None, angle_bits: Optional[int] = None):
+        self.params = CORDICParameters(width=width, iterations=iterations, angle_bits=angle_bits)
+        self.reset()
+
+    @property
+    def phase_acc(self):
+        return int(self.regs['phase_acc'])
+
+    def reset(self):
+        self.regs = {}
+
+    def _register(self, name: str, d: np.ndarray) -> np.ndarray:
+        # values of a register at times 0..N, given its input at times 0..N-1
+        q = np.concatenate(([self.regs.get(name, 0)], d)).astype(np.int64)
+        self.regs[name] = q[-1]
+        return q
+
+    def run(self, phase_step: Union[int, np.ndarray], n: Union[None, int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        p = self.params
+        steps = np.asarray(phase_step, dtype=np.uint64)
+        if steps.ndim == 0:
+            steps = np.full(n, steps, dtype=np.uint64)
+        steps = (steps & np.uint64((1 << PHASE_BITS) - 1)).astype(np.int64)
+        mask = (1 << PHASE_BITS) - 1
+        if len(steps) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        phase_acc = (self.regs.get('phase_acc', 0) + np.concatenate(([0], np.cumsum(steps)))) & mask
+        self.regs['phase_acc'] = phase_acc[-1]
+
+        # fold into [-90, 90) degrees
+        phase = phase_acc[:-1] >> (PHASE_BITS - p.angle_bits)
+        flip = ((phase >> (p.angle_bits - 1)) ^ (phase >> (p.angle_bits - 2))) & 1
+        x = self._register('x0', np.full(len(steps), p.x0))
+        y = self._register('y0', np.zeros(len(steps)))
+        z = self._register('z0', wrap(phase ^ (flip << (p.angle_bits - 1)), p.angle_bits))
+        neg = self._register('neg0', flip)
+
+        for i, angle in enumerate(p.angles):
+            x_in, y_in, z_in = x[:-1], y[:-1], z[:-1]
+            up = z_in >= 0
+            x = self._register(f'x{i + 1}', wrap(np.where(up, x_in - (y_in >> i), x_in + (y_in >> i)), p.data_width))
+            y = self._register(f'y{i + 1}', wrap(np.where(up, y_in + (x_in >> i), y_in - (x_in >> i)), p.data_width))
+            z = self._register(f'z{i + 1}', wrap(np.where(up, z_in - angle, z_in + angle), p.angle_bits))
+            neg = self._register(f'neg{i + 1}', neg[:-1])
+
+        hi, lo = (1 << (p.width - 1)) - 1, -(1 << (p.width - 1))
+        def output(value):
+            value = np.where(neg[:-1], -value[:-1], value[:-1])
+            return np.clip((value + (1 << (p.guard_bits - 1))) >> p.guard_bits, lo, hi)
+        sin_out = self._register('sin_out', output(y))
+        cos_out = self._register('cos_out', output(x))
+
+        # values after each tick, back in offset binary
+        half = 1 << (p.width - 1)
+        return sin_out[1:] + half, cos_out[1:] + half
@@ -0,0 +1,335 @@
+import json
+from typing import Dict, Iterable, List, Optional
+
+from nmigen import Elaboratable, Module, Signal, Record, Cat, Mux, Value
+from nmigen.hdl.rec import Layout
+
+# Control/status registers (CSRs) for the PicoRV32 SoC.
+#
+# Peripherals declare their registers in `Bank`s, `CSRMap` gives every bank and register an address, and
+# `CSRBridge` implements them all behind one Wishbone slave that `PicoRV32` reaches through its `wishbone`
+# windows. The same map is written out as a Rust module for the firmware and as JSON, so adding a register
+# never means editing decode logic or addresses by hand.
+
+def wishbone_layout(addr_width: int = 30, data_width: int = 32) -> Layout:
+    # a Wishbone B4 pipelined interface with byte selects
+    return Layout([
+        ("adr", addr_width),
+        ("dat_w", data_width),
+        ("dat_r", data_width),
+        ("sel", data_width // 8),
+        ("cyc", 1),
+        ("stb", 1),
+        ("we", 1),
+        ("ack", 1),
+        ("stall", 1),
+    ])
+
+def wishbone_access(bus: Record, register: "Register", data: Optional[int] = None, sel: int = 0b1111):
+    # a simulator process step: one single-beat access to `register` through `bus`, as the only master,
+    # reading if `data` is None and writing it otherwise. Returns what the slave put on `dat_r` with its
+    # acknowledgement, and leaves the bus idle for a cycle after it
+    yield bus.adr.eq(register.addr >> 2)
+    yield bus.we.eq(data is not None)
+    yield bus.dat_w.eq(data or 0)
+    yield bus.sel.eq(sel)
+    yield bus.cyc.eq(1)
+    yield bus.stb.eq(1)
+    yield
+    yield bus.stb.eq(0)
+    while not (yield bus.ack):
+        yield
+    value = yield bus.dat_r
+    yield bus.cyc.eq(0)
+    yield
+    return value
+
+class Register:
+    """
+    A CSR of up to 32 bits. ``access`` is ``"r"``, ``"w"`` or ``"rw"``. If ``signal`` is a ``Record`` its
+    fields are exported to the firmware as bit masks.
+
+    ``r_stb`` pulses for a cycle after the register is read and ``w_stb`` once a write has landed in
+    ``signal``, for registers with side effects (popping a FIFO, starting a transfer). A read-only register
+    can be any value, such as a FIFO's output.
+
+    With ``hw_write``, the peripheral can update the register too (say, to advance an address after each
+    access): ``signal`` takes ``w_data`` on each cycle ``we`` is raised, unless the bus writes it on the same
+    cycle. The bridge then drives ``signal`` alone, so the peripheral never does.
+    """
+    def __init__(self, name: str, signal: Signal, access: str = "rw", desc: str = "", hw_write: bool = False):
+        assert access in ("r", "w", "rw")
+        assert len(signal) <= 32
+        self.name = name
+        self.signal = signal
+        self.access = access
+        self.desc = desc
+        self.r_stb = Signal(name=f"{name}_r_stb")
+        self.w_stb = Signal(name=f"{name}_w_stb")
+        self.hw_write = hw_write
+        self.we = Signal(name=f"{name}_we")
+        self.w_data = Signal(len(signal), name=f"{name}_w_data")
+        # assigned by `CSRMap`
+        self.addr = None
+
+    @property
+    def fields(self) -> List[tuple]:
+        if not isinstance(self.signal, Record):
+            return []
+        fields, offset = [], 0
+        for name, shape in self.signal.layout.fields.items():
+            width = shape[0] if isinstance(shape, tuple) else len(self.signal[name])
+            fields.append((name, offset, width))
+            offset += width
+        return fields
+
+class Bank:
+    """
+    The registers of one peripheral, laid out one word apart in the order given.
+    """
+    def __init__(self, name: str, registers: Iterable[Register], desc: str = ""):
+        self.name = name
+        self.registers = list(registers)
+        self.desc = desc
+        # assigned by `CSRMap`
+        self.base = None
+
+class CSRMap:
+    """
+    Address assignment for ``banks``: bank ``i`` starts at ``base + i * stride`` and its registers follow
+    one word apart, so adding a register or a bank leaves existing addresses alone.
+    """
+    def __init__(self, banks: Iterable[Bank], base: int = 0xf000_0000, stride: int = 0x100):
+        self.banks = list(banks)
+        self.base = base
+        self.stride = stride
+        self.size = 1 << max(2, (len(self.banks) * stride - 1).bit_length())
+        assert base % self.size == 0, "the CSR window must be aligned to its size"
+
+        names = [bank.name for bank in self.banks]
+        for i, bank in enumerate(self.banks):
+            assert names.count(bank.name) == 1, f"CSR bank {bank.name!r} is declared more than once"
+            assert len(bank.registers) * 4 <= stride, f"CSR bank {bank.name!r} does not fit in {stride} bytes"
+            bank.base = base + i * stride
+            for j, register in enumerate(bank.registers):
+                register.addr = bank.base + 4 * j
+
+    @property
+    def registers(self) -> List[Register]:
+        return [register for bank in self.banks for register in bank.registers]
+
+    def to_dict(self) -> dict:
+        return {
+            "base": self.base,
+            "size": self.size,
+            "banks": [{
+                "name": bank.name,
+                "desc": bank.desc,
+                "base": bank.base,
+                "registers": [{
+                    "name": register.name,
+                    "desc": register.desc,
+                    "addr": register.addr,
+                    "offset": register.addr - bank.base,
+                    "width": len(register.signal),
+                    "access": register.access,
+                    "fields": [{"name": n, "offset": o, "width": w} for n, o, w in register.fields],
+                } for register in bank.registers],
+            } for bank in self.banks],
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_rust(self, constants: Optional[Dict[str, float]] = None) -> str:
+        """
+        The map as Rust modules, one per bank, after ``constants`` (e.g. clock frequencies the firmware needs
+        to program the registers), which become ``f64`` constants at the top level.
+        """
+        lines = [
+            "// Generated from the gateware's CSR map (`python top.py csr`); do not edit.",
+            "",
+        ]
+        for name, value in (constants or {}).items():
+            lines.append(f"pub const {name}: f64 = {float(value)!r};")
+        if constants:
+            lines.append("")
+        for bank in self.banks:
+            if bank.desc:
+                lines.append(f"/// {bank.desc}")
+            lines += [f"pub mod {bank.name} {{", f"    pub const BASE: usize = {bank.base:#x};"]
+            for register in bank.registers:
+                lines.append("")
+                if register.desc:
+                    lines.append(f"    /// {register.desc}")
+                lines += [f"    pub mod {register.name} {{", f"        pub const ADDR: usize = {register.addr:#x};"]
+                lines.append(f"        pub const WIDTH: u32 = {len(register.signal)};")
+                for name, offset, width in register.fields:
+                    mask = ((1 << width) - 1) << offset
+                    lines.append(f"        pub const {name.upper()}: u32 = {mask:#x};")
+                    if width > 1:
+                        lines.append(f"        pub const {name.upper()}_SHIFT: u32 = {offset};")
+                if "r" in register.access:
+                    lines += [
+                        "        #[inline(always)]",
+                        "        pub fn read() -> u32 {",
+                        "            unsafe { (ADDR as *const u32).read_volatile() }",
+                        "        }",
+                    ]
+                if "w" in register.access:
+                    lines += [
+                        "        #[inline(always)]",
+                        "        pub fn write(value: u32) {",
+                        "            unsafe { (ADDR as *mut u32).write_volatile(value) }",
+                        "        }",
+                    ]
+                lines.append("    }")
+            lines += ["}", ""]
+        return "\n".join(lines)
+
+    def summary(self) -> str:
+        lines = []
+        for bank in self.banks:
+            lines.append(f"{bank.base:#010x}  {bank.name}")
+            for register in bank.registers:
+                lines.append(f"{register.addr:#010x}    {register.name:<16} {register.access:<2} {len(register.signal):>2} bits"
+                    + (f"  {register.desc}" if register.desc else ""))
+        return "\n".join(lines)
+
+class CSRBridge(Elaboratable):
+    """
+    Wishbone slave implementing every register in ``csr_map``.
+
+    Accesses go through two register stages: the request is latched on the cycle it is strobed, and the
+    register is written or its value latched into ``dat_r`` on the next, so ``ack`` follows ``stb`` by two
+    cycles and neither the CPU's address decode nor the CSR read mux sits on the other's path. The bridge
+    never stalls and accepts a new request every cycle.
+    """
+    def __init__(self, csr_map: CSRMap, name: str = "csr"):
+        self.map = csr_map
+        self.name = name
+        self.base = csr_map.base
+        self.size = csr_map.size
+        self.bus = Record(wishbone_layout(), name=name)
+
+    def elaborate(self, platform):
+        m = Module()
+        bus = self.bus
+
+        pending = Signal()
+        addr = Signal(range(self.size // 4))
+        we = Signal()
+        sel = Signal(4)
+        dat_w = Signal(32)
+
+        m.d.comb += bus.stall.eq(0)
+        m.d.sync += pending.eq(bus.cyc & bus.stb)
+        with m.If(bus.cyc & bus.stb):
+            m.d.sync += [
+                addr.eq(bus.adr),
+                we.eq(bus.we),
+                sel.eq(bus.sel),
+                dat_w.eq(bus.dat_w),
+            ]
+
+        m.d.sync += bus.ack.eq(0)
+        for register in self.map.registers:
+            m.d.sync += [
+                register.r_stb.eq(0),
+                register.w_stb.eq(0),
+            ]
+        for register in self.map.registers:
+            if register.hw_write:
+                with m.If(register.we):
+                    m.d.sync += register.signal.eq(register.w_data)
+        # a master that drops `cyc` abandons its request, and its writes take precedence over the peripherals'
+        with m.If(pending & bus.cyc):
+            m.d.sync += [
+                bus.ack.eq(1),
+                bus.dat_r.eq(0),
+            ]
+            with m.Switch(addr):
+                for register in self.map.registers:
+                    with m.Case((register.addr - self.base) >> 2):
+                        if "w" in register.access:
+                            current = Value.cast(register.signal)
+                            merged = Cat(Mux(sel[i], dat_w[8 * i:8 * i + 8], current[8 * i:8 * i + 8]) for i in range(4))
+                            with m.If(we):
+                                m.d.sync += [
+                                    register.signal.eq(merged),
+                                    register.w_stb.eq(1),
+                                ]
+                        if "r" in register.access:
+                            with m.If(~we):
+                                m.d.sync += [
+                                    bus.dat_r.eq(register.signal),
+                                    register.r_stb.eq(1),
+                                ]
+
+        return m
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    p_action = parser.add_subparsers(dest="action")
+    p_action.add_parser("check", help="run a few Wishbone accesses against a CSRBridge in simulation")
+
+    args = parser.parse_args()
+    if args.action == "check":
+        from nmigen.sim import Simulator, Passive
+
+        ctrl = Record([("enable", 1), ("mode", 3)])
+        step = Signal(32)
+        status = Signal(8, reset=0x5a)
+        csr_map = CSRMap([
+            Bank("nco", [Register("ctrl", ctrl), Register("phase_step", step)]),
+            Bank("misc", [Register("status", status, access="r")]),
+        ])
+        dut = CSRBridge(csr_map)
+        sim = Simulator(dut)
+        sim.add_clock(1e-6)
+
+        # the cycles from each strobe to its acknowledgement, and whether the register's strobes line up with it
+        acks = []
+        by_addr = {register.addr >> 2: register for register in csr_map.registers}
+        def monitor():
+            yield Passive()
+            start = None
+            while True:
+                yield
+                if (yield dut.bus.stb):
+                    start = 0
+                elif start is not None:
+                    start += 1
+                if (yield dut.bus.ack):
+                    write = yield dut.bus.we
+                    register = by_addr[(yield dut.bus.adr)]
+                    strobe = register.w_stb if write else register.r_stb
+                    assert (yield strobe) == (register.access != ("r" if write else "w"))
+                    acks.append(start + 1)
+        sim.add_sync_process(monitor)
+
+        def access(register, data=None, sel=0b1111):
+            return (yield from wishbone_access(dut.bus, register, data, sel))
+
+        def proc():
+            ctrl_reg, step_reg, status_reg = csr_map.registers
+            yield from access(step_reg, 0x12345678)
+            assert (yield step) == 0x12345678
+            yield from access(step_reg, 0xabcdef00, sel=0b0100)
+            value = yield from access(step_reg)
+            assert value == 0x12cd5678, hex(value)
+            yield from access(ctrl_reg, 0b1011)
+            assert (yield ctrl.enable) == 1 and (yield ctrl.mode) == 0b101
+            value = yield from access(status_reg)
+            assert value == 0x5a
+            # writes to read-only registers are ignored
+            yield from access(status_reg, 0)
+            assert (yield status) == 0x5a
+            assert len(set(acks)) == 1, acks
+            print(f"CSRBridge matches for {len(csr_map.registers)} registers, {acks[0]} cycles per access")
+        sim.add_sync_process(proc)
+        sim.run()
+    else:
+        parser.print_usage()
@@ -0,0 +1,202 @@
+import os, shutil, subprocess, time
+from typing import Dict, Iterable, Optional
+from nmigen import Elaboratable
+from nmigen.back import rtlil
+
+# Compiled simulation through Yosys' CXXRTL backend.
+#
+# nMigen's Python simulator skips `Instance`s, so it cannot run the picorv32 Verilog core. Here the design is
+# converted to RTLIL, read into Yosys together with the Verilog sources it instantiates, and compiled to a
+# native executable that steps the `sync` clock for a fixed number of cycles.
+
+DRIVER = """
+#include "{name}.cc"
+
+#if __has_include(<cxxrtl/cxxrtl_vcd.h>)
+#include <cxxrtl/cxxrtl_vcd.h>
+#else
+#include <backends/cxxrtl/cxxrtl_vcd.h>
+#endif
+
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <fstream>
+
+int main(int argc, char **argv) {{
+    unsigned long long cycles = std::strtoull(argv[1], nullptr, 10);
+    unsigned long long reset_cycles = std::strtoull(argv[2], nullptr, 10);
+    const char *vcd_path = argc > 3 ? argv[3] : nullptr;
+
+    cxxrtl_design::p_{name} top;
+
+    cxxrtl::debug_items items;
+    cxxrtl::vcd_writer vcd;
+    std::ofstream vcd_file;
+    top.debug_info(items);
+    if (vcd_path) {{
+        vcd.timescale(1, "ns");
+        vcd.add_without_memories(items);
+        vcd_file.open(vcd_path);
+    }}
+
+    auto start = std::chrono::steady_clock::now();
+    for (unsigned long long cycle = 0; cycle < cycles; cycle++) {{
+        top.p_rst.set<bool>(cycle < reset_cycles);
+        top.p_clk.set<bool>(false);
+        top.step();
+        if (vcd_path) vcd.sample(cycle * 2);
+        top.p_clk.set<bool>(true);
+        top.step();
+        if (vcd_path) {{
+            vcd.sample(cycle * 2 + 1);
+            vcd_file << vcd.buffer;
+            vcd.buffer.clear();
+        }}
+    }}
+    double seconds = std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count();
+
+    std::printf("seconds %f\\n", seconds);
+{outputs}
+{memories}
+    return 0;
+}}
+"""
+
+# memories are found by name among the debug items, whose names are prefixed with the path to their module
+MEMORY_DUMP = """
+    for (auto &entry : items.table) {{
+        const std::string &name = entry.first;
+        const cxxrtl::debug_item &item = entry.second.front();
+        if (item.type == cxxrtl::debug_item::MEMORY && (name == "{name}" || (name.size() > {length} &&
+                name.compare(name.size() - {length} - 1, std::string::npos, " {name}") == 0))) {{
+            for (size_t row = 0; row < item.depth; row++)
+                std::printf("{name}[%zu] %u\\n", row, (unsigned) item.curr[row]);
+            break;
+        }}
+    }}
+"""
+
+def _mangle(name: str) -> str:
+    # CXXRTL escapes `_` as `__` when it turns RTLIL names into C++ member names
+    return "p_" + name.replace("_", "__")
+
+def _cxxrtl_include_dirs():
+    datdir = subprocess.run(["yosys-config", "--datdir"], capture_output=True, text=True, check=True).stdout.strip()
+    return [os.path.join(datdir, "include", "backends", "cxxrtl", "runtime"), os.path.join(datdir, "include")]
+
+class CxxrtlSimulation:
+    """
+    Build and run a CXXRTL simulation of ``design``.
+
+    ``outputs`` are top-level ports (single-word, i.e. at most 32 bits) whose final values are reported
+    after the run, along with the final contents of ``memories`` (also at most 32 bits wide). The design must
+    use a single ``sync`` domain, which is driven through the ``clk`` and ``rst`` ports.
+    """
+
+    def __init__(self, design: Elaboratable, outputs: Iterable, name: str = "top",
+            verilog_files: Iterable[str] = (), build_dir: str = "build/cxxsim", memories: Iterable = ()):
+        self.design = design
+        self.outputs = list(outputs)
+        self.memories = list(memories)
+        self.name = name
+        self.verilog_files = list(verilog_files)
+        self.build_dir = build_dir
+        self.executable = os.path.join(build_dir, name)
+
+    def build(self):
+        os.makedirs(self.build_dir, exist_ok=True)
+
+        with open(os.path.join(self.build_dir, f"{self.name}.il"), "w") as f:
+            f.write(rtlil.convert(self.design, name=self.name, ports=self.outputs))
+
+        script = "".join(f"read_verilog {os.path.abspath(path)}\n" for path in self.verilog_files)
+        script += f"read_ilang {self.name}.il\n"
+        script += f"hierarchy -check -top {self.name}\n"
+        script += f"write_cxxrtl -O4 {self.name}.cc\n"
+        with open(os.path.join(self.build_dir, f"{self.name}.ys"), "w") as f:
+            f.write(script)
+        subprocess.run(["yosys", "-q", f"{self.name}.ys"], cwd=self.build_dir).check_returncode()
+
+        outputs = "".join(
+            f'    std::printf("{signal.name} %u\\n", (unsigned) top.{_mangle(signal.name)}.get<uint32_t>());\n'
+            for signal in self.outputs
+        )
+        with open(os.path.join(self.build_dir, "driver.cc"), "w") as f:
+            f.write(DRIVER.format(name=self.name, outputs=outputs, memories="".join(
+                MEMORY_DUMP.format(name=memory.name, length=len(memory.name)) for memory in self.memories)))
+
+        cxx = os.environ.get("CXX", shutil.which("clang++") or "g++")
+        subprocess.run(
+            [cxx, "-std=c++14", "-O2", *(f"-I{path}" for path in _cxxrtl_include_dirs()), "-o", self.name, "driver.cc"],
+            cwd=self.build_dir,
+        ).check_returncode()
+
+    def run(self, cycles: int, reset_cycles: int = 16, vcd_file: Optional[str] = None):
+        """
+        Run for ``cycles`` clock cycles and return ``(seconds, outputs)``, where ``seconds`` is the wall-clock
+        time spent stepping the design and ``outputs`` maps output names to their final values, and memory names
+        to lists of their rows.
+        """
+        args = [os.path.abspath(self.executable), str(cycles), str(reset_cycles)]
+        if vcd_file is not None:
+            args.append(os.path.abspath(vcd_file))
+        result = subprocess.run(args, capture_output=True, text=True, check=True)
+
+        values = {}
+        for line in result.stdout.splitlines():
+            name, value = line.split()
+            if "[" in name:
+                name, row = name.rstrip("]").split("[")
+                values.setdefault(name, {})[int(row)] = int(value)
+            else:
+                values[name] = value
+        seconds = float(values.pop("seconds"))
+        return seconds, {name: [value[row] for row in sorted(value)] if isinstance(value, dict) else int(value)
+            for name, value in values.items()}
+
+def run_pysim(design: Elaboratable, outputs: Iterable, cycles: int, clk_freq: float,
+        reset_cycles: int = 16, vcd_file: Optional[str] = None, memories: Iterable = (), clocks: Dict[str, float] = {}):
+    """
+    The same run as ``CxxrtlSimulation.run`` on nMigen's Python simulator. ``Instance``s are not simulated.
+    ``clocks`` gives the frequency of each of the design's domains other than ``sync``; ``cycles`` still
+    counts ``sync`` cycles.
+    """
+    from contextlib import nullcontext
+    from nmigen import Module, ClockDomain
+    from nmigen.sim import Simulator
+
+    outputs = list(outputs)
+
+    m = Module()
+    m.domains.sync = sync = ClockDomain("sync")
+    m.submodules.design = design
+
+    sim = Simulator(m)
+    sim.add_clock(1 / clk_freq)
+    for domain, freq in clocks.items():
+        sim.add_clock(1 / freq, domain=domain)
+
+    def reset_proc():
+        yield sync.rst.eq(1)
+        for _ in range(reset_cycles):
+            yield
+        yield sync.rst.eq(0)
+    sim.add_sync_process(reset_proc)
+
+    values = {}
+    def sample_proc():
+        for _ in range(cycles):
+            yield
+        for signal in outputs:
+            values[signal.name] = yield signal
+        for memory in memories:
+            values[memory.name] = []
+            for row in range(memory.depth):
+                values[memory.name].append((yield memory[row]))
+    sim.add_sync_process(sample_proc)
+
+    start = time.perf_counter()
+    with sim.write_vcd(vcd_file) if vcd_file is not None else nullcontext():
+        sim.run()
+    return time.perf_counter() - start, values
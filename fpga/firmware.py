@@ -0,0 +1,96 @@
+import hashlib, os, subprocess
+from typing import Dict, Optional
+import numpy as np
+
+# Files outside `src/` that change what `cargo objcopy` produces.
+APP_INPUTS = ["Cargo.toml", "Cargo.lock", "memory.x", "csr.rs", "build.rs", ".cargo/config.toml"]
+
+# the app's `build.rs` takes generated files from this directory instead of the checked-in defaults next to it
+GENERATED_DIR_VARIABLE = "APP_GENERATED_DIR"
+
+def read_image(path: str) -> np.ndarray:
+    """
+    Read a raw firmware binary as little-endian 32-bit words.
+    """
+    with open(path, "rb") as f:
+        b = bytearray(f.read())
+        b.extend([0] * (4 - (len(b) % 4)))
+        return np.frombuffer(b, dtype='<u4')
+
+def toolchain_version(app_dir: str) -> str:
+    # run inside the app so rust-toolchain overrides are respected
+    return subprocess.run(["rustc", "-vV"], cwd=app_dir, capture_output=True, text=True, check=True).stdout
+
+def source_hash(app_dir: str, sources: Optional[Dict[str, str]] = None) -> str:
+    h = hashlib.sha256()
+
+    paths = [os.path.join(app_dir, name) for name in APP_INPUTS]
+    for root, dirs, files in os.walk(os.path.join(app_dir, "src")):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in sorted(files))
+
+    for path in paths:
+        if os.path.exists(path):
+            h.update(os.path.relpath(path, app_dir).encode())
+            with open(path, "rb") as f:
+                h.update(hashlib.sha256(f.read()).digest())
+
+    for name, text in sorted((sources or {}).items()):
+        h.update(f"generated/{name}".encode())
+        h.update(hashlib.sha256(text.encode()).digest())
+
+    h.update(toolchain_version(app_dir).encode())
+    return h.hexdigest()
+
+def write_sources(directory: str, sources: Dict[str, str]):
+    # only touch files whose contents change, so cargo's own change tracking stays quiet
+    os.makedirs(directory, exist_ok=True)
+    for path, text in sources.items():
+        path = os.path.join(directory, path)
+        if os.path.exists(path):
+            with open(path) as f:
+                if f.read() == text:
+                    continue
+        with open(path, "w") as f:
+            f.write(text)
+
+def load_firmware(app_dir: str = "app", image: Optional[str] = None, cache_dir: str = "build/firmware",
+        binary: str = "build/app.bin", sources: Optional[Dict[str, str]] = None) -> list:
+    """
+    Return the firmware as a list of 32-bit words, ready to go into the CPU's ``Memory`` init.
+
+    If ``image`` is given it is used as-is and cargo is never started. Otherwise the image is cached in
+    ``cache_dir`` under a hash of the app sources, its build configuration and the Rust toolchain version,
+    and cargo only runs (writing ``binary``) when no cached image matches.
+
+    ``sources`` maps names the app's ``build.rs`` looks for (``csr.rs``, ``memory.x``) to generated files,
+    which replace the checked-in defaults of the same names and count towards the hash. They are written to
+    ``cache_dir``, never into the app, and are left alone when a prebuilt ``image`` is used.
+    """
+    if image is not None:
+        return read_image(image).tolist()
+
+    key = source_hash(app_dir, sources)
+    cached = os.path.join(cache_dir, f"app-{key[:16]}.npy")
+    if os.path.exists(cached):
+        return np.load(cached).tolist()
+
+    env = dict(os.environ)
+    env.pop(GENERATED_DIR_VARIABLE, None)
+    if sources:
+        generated = os.path.join(cache_dir, f"generated-{key[:16]}")
+        write_sources(generated, sources)
+        env[GENERATED_DIR_VARIABLE] = os.path.abspath(generated)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(binary), exist_ok=True)
+    subprocess.run(
+        ["cargo", "objcopy", "--release", "--", "-O", "binary", os.path.abspath(binary)],
+        cwd=app_dir,
+        env=env,
+    ).check_returncode()
+
+    words = read_image(binary)
+    np.save(cached + ".tmp.npy", words)
+    os.replace(cached + ".tmp.npy", cached)
+    return words.tolist()
@@ -0,0 +1,313 @@
+from nmigen import Elaboratable, Module, Signal, Record, Memory, Mux, Cat, Const
+
+from csr import Bank, Register, wishbone_layout
+from spi_flash import SPIFlashReader, FLASH_SIZE, FIRMWARE_OFFSET
+
+# Execute in place from the SPI flash.
+#
+# `InstructionCache` maps the flash into the CPU's address space at `FLASH_BASE`, as a Wishbone slave for
+# `PicoRV32`, and keeps recently used lines of it in block RAM. The firmware then lives in flash, where
+# `tinyprog -u` puts it, instead of in the bitstream: block RAM holds only the RAM and the cache, and a new
+# firmware needs no new bitstream. Hits take one wait state, like RAM on the registered bus; a miss reads the
+# whole line from the flash (about 300 cycles for 8 words over dual I/O, 150 over quad I/O).
+
+FLASH_BASE = 0x0100_0000
+
+def _log2(value: int, what: str) -> int:
+    if value < 1 or value & (value - 1):
+        raise ValueError(f"the {what} must be a power of two, not {value}")
+    return value.bit_length() - 1
+
+class InstructionCache(Elaboratable):
+    """
+    A read-only cache of ``sets`` lines of ``line_words`` words per way, direct-mapped or, with ``ways=2``,
+    2-way set associative with least recently used replacement, in front of a ``SPIFlashReader`` over
+    ``flash_width`` data lines (see ``flash``).
+
+    The whole flash appears at ``base``, and the firmware image sits ``image_offset`` bytes into it; ``name``,
+    ``base``, ``size`` and ``bus`` make it a slave for ``PicoRV32``'s ``wishbone``. Reads, data as well as
+    instructions, are served from the cache; writes are acknowledged and dropped. The ``hits``, ``misses`` and
+    ``stall_cycles`` (cycles spent filling lines) counters run from reset, and writing ``flush`` invalidates
+    every line, which takes ``sets`` cycles, as does the flush after reset.
+    """
+    def __init__(self, base: int = FLASH_BASE, flash_width: int = 2, continuous: bool = True, sets: int = 32,
+            line_words: int = 8, ways: int = 1, image_offset: int = FIRMWARE_OFFSET, name: str = "xip"):
+        if ways not in (1, 2):
+            raise ValueError(f"the cache is direct-mapped or 2-way set associative, not {ways}-way")
+        self.offset_bits = _log2(line_words, "line length")
+        self.index_bits = _log2(sets, "number of sets")
+        self.name = name
+        self.base = base
+        self.size = FLASH_SIZE
+        self.sets = sets
+        self.line_words = line_words
+        self.ways = ways
+        self.image_offset = image_offset
+        self.tag_bits = (self.size.bit_length() - 1) - 2 - self.offset_bits - self.index_bits
+        assert self.tag_bits >= 0
+
+        self.flash = SPIFlashReader(width=flash_width, burst=line_words, continuous=continuous)
+        self.bus = Record(wishbone_layout(), name=name)
+
+        self.hits = Signal(32)
+        self.misses = Signal(32)
+        self.stall_cycles = Signal(32)
+        self.flush = Signal()
+
+        self.registers = {register.name: register for register in [
+            Register("hits", self.hits, access="r"),
+            Register("misses", self.misses, access="r"),
+            Register("stall_cycles", self.stall_cycles, access="r", desc="Cycles spent filling lines."),
+            Register("flush", self.flush, access="w", desc="Write to invalidate every line."),
+        ]}
+
+    @property
+    def image_base(self) -> int:
+        # where the firmware starts in the CPU's address space
+        return self.base + self.image_offset
+
+    def csr_bank(self, name: str = "xip") -> Bank:
+        return Bank(name, self.registers.values(), desc="Flash instruction cache.")
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.flash = flash = self.flash
+        bus = self.bus
+
+        ob, ib = self.offset_bits, self.index_bits
+        def fields(adr):
+            # a word address' offset into its line, set and tag
+            return adr[:ob], adr[ob:ob + ib], adr[ob + ib:ob + ib + self.tag_bits]
+
+        # the request, latched when it is accepted
+        adr = Signal(30)
+        offset, index, tag = fields(adr)
+
+        tag_ports, data_ports = [], []
+        for way in range(self.ways):
+            # a tag with a valid bit on top
+            tags = Memory(width=self.tag_bits + 1, depth=self.sets, name=f"tags{way}")
+            data = Memory(width=32, depth=self.sets * self.line_words, name=f"data{way}")
+            ports = [tags.read_port(transparent=False), tags.write_port(), data.read_port(transparent=False),
+                data.write_port()]
+            m.submodules[f"tags{way}_r"], m.submodules[f"tags{way}_w"] = ports[:2]
+            m.submodules[f"data{way}_r"], m.submodules[f"data{way}_w"] = ports[2:]
+            tag_ports.append(ports[:2])
+            data_ports.append(ports[2:])
+
+        # the way each set replaces next
+        lru = Signal(self.sets)
+        victim = Signal(range(self.ways))
+        word = Signal(range(self.line_words))
+        fill_data = Signal(32)
+        flush_index = Signal(range(self.sets))
+        flush_pending = Signal()
+
+        with m.If(self.registers["flush"].w_stb):
+            m.d.sync += flush_pending.eq(1)
+
+        idle = Signal()
+        # the RAMs are read with the address on the bus, so the line is there the cycle after it is accepted
+        lookup_offset, lookup_index, _ = fields(Mux(idle, bus.adr, adr))
+        hit_way = Signal(range(self.ways))
+        hit = Signal()
+        for way, ((tag_r, _), (data_r, _)) in enumerate(zip(tag_ports, data_ports)):
+            m.d.comb += [
+                tag_r.addr.eq(lookup_index),
+                data_r.addr.eq(Cat(lookup_offset, lookup_index)),
+            ]
+            with m.If(tag_r.data == Cat(tag, Const(1, 1))):
+                m.d.comb += [
+                    hit.eq(1),
+                    hit_way.eq(way),
+                ]
+        m.d.comb += bus.dat_r.eq(Mux(hit_way, data_ports[-1][0].data, data_ports[0][0].data))
+
+        for way, ((_, tag_w), (_, data_w)) in enumerate(zip(tag_ports, data_ports)):
+            m.d.comb += [
+                data_w.addr.eq(Cat(word, index)),
+                data_w.data.eq(flash.data),
+                tag_w.addr.eq(index),
+                tag_w.data.eq(Cat(tag, Const(1, 1))),
+            ]
+
+        with m.FSM(reset="FLUSH"):
+            with m.State("FLUSH"):
+                m.d.comb += bus.stall.eq(1)
+                for tag_r, tag_w in tag_ports:
+                    m.d.comb += [
+                        tag_w.addr.eq(flush_index),
+                        tag_w.data.eq(0),
+                        tag_w.en.eq(1),
+                    ]
+                m.d.sync += [
+                    flush_index.eq(flush_index + 1),
+                    flush_pending.eq(0),
+                ]
+                with m.If(flush_index == self.sets - 1):
+                    m.next = "IDLE"
+
+            with m.State("IDLE"):
+                m.d.comb += idle.eq(1)
+                with m.If(flush_pending):
+                    m.d.comb += bus.stall.eq(1)
+                    m.d.sync += flush_index.eq(0)
+                    m.next = "FLUSH"
+                with m.Elif(bus.cyc & bus.stb):
+                    m.d.sync += adr.eq(bus.adr)
+                    with m.If(bus.we):
+                        m.next = "WRITE"
+                    with m.Else():
+                        m.next = "LOOKUP"
+
+            with m.State("WRITE"):
+                # the flash is read-only
+                m.d.comb += [
+                    bus.stall.eq(1),
+                    bus.ack.eq(bus.cyc),
+                ]
+                m.next = "IDLE"
+
+            with m.State("LOOKUP"):
+                m.d.comb += bus.stall.eq(1)
+                with m.If(hit):
+                    m.d.comb += bus.ack.eq(bus.cyc)
+                    m.d.sync += self.hits.eq(self.hits + 1)
+                    if self.ways == 2:
+                        m.d.sync += lru.bit_select(index, 1).eq(~hit_way)
+                    m.next = "IDLE"
+                with m.Elif(flash.ready):
+                    m.d.comb += [
+                        flash.start.eq(1),
+                        flash.addr.eq(Cat(Const(0, 2 + ob), index, tag)),
+                    ]
+                    m.d.sync += [
+                        self.misses.eq(self.misses + 1),
+                        victim.eq(lru.bit_select(index, 1) if self.ways == 2 else 0),
+                        word.eq(0),
+                    ]
+                    m.next = "FILL"
+
+            with m.State("FILL"):
+                m.d.comb += bus.stall.eq(1)
+                m.d.sync += self.stall_cycles.eq(self.stall_cycles + 1)
+                with m.If(flash.valid):
+                    for way, ((_, tag_w), (_, data_w)) in enumerate(zip(tag_ports, data_ports)):
+                        with m.If(victim == way):
+                            m.d.comb += [
+                                data_w.en.eq(1),
+                                tag_w.en.eq(word == self.line_words - 1),
+                            ]
+                    m.d.sync += word.eq(word + 1)
+                    with m.If(word == offset):
+                        m.d.sync += fill_data.eq(flash.data)
+                    with m.If(word == self.line_words - 1):
+                        if self.ways == 2:
+                            m.d.sync += lru.bit_select(index, 1).eq(~victim)
+                        m.next = "RESPOND"
+
+            with m.State("RESPOND"):
+                m.d.comb += [
+                    bus.stall.eq(1),
+                    bus.ack.eq(bus.cyc),
+                    bus.dat_r.eq(fill_data),
+                ]
+                m.next = "IDLE"
+
+        return m
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    p_action = parser.add_subparsers(dest="action")
+    p_check = p_action.add_parser("check", help="run fetch patterns through the cache and a flash model in simulation")
+    p_check.add_argument("--width", type=int, choices=[1, 2, 4], default=2, help="flash data lines")
+    p_check.add_argument("--ways", type=int, choices=[1, 2], default=1)
+    p_check.add_argument("--sets", type=int, default=8)
+    p_check.add_argument("--line-words", type=int, default=8)
+    p_check.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.action == "check":
+        import random
+        from nmigen.sim import Simulator, Settle
+        from spi_flash import flash_model
+
+        rng = random.Random(args.seed)
+        contents = bytes(rng.getrandbits(8) for _ in range(FLASH_SIZE))
+        cache = InstructionCache(flash_width=args.width, continuous=args.width > 1, sets=args.sets,
+            line_words=args.line_words, ways=args.ways)
+        sim = Simulator(cache)
+        sim.add_clock(1 / 16e6)
+        def flash():
+            yield from flash_model(cache.flash.pins, contents)
+        sim.add_sync_process(flash)
+
+        def read(addr):
+            # a read the way `PicoRV32.wishbone_master` makes it, returning the data and the cycles it took
+            bus = cache.bus
+            yield bus.adr.eq(addr >> 2)
+            yield bus.we.eq(0)
+            yield bus.cyc.eq(1)
+            yield bus.stb.eq(1)
+            yield Settle()
+            cycles = 0
+            while (yield bus.stall):
+                yield
+                yield Settle()
+                cycles += 1
+            yield
+            cycles += 1
+            yield bus.stb.eq(0)
+            yield Settle()
+            while not (yield bus.ack):
+                yield
+                yield Settle()
+                cycles += 1
+            value = yield bus.dat_r
+            yield
+            yield bus.cyc.eq(0)
+            flash_addr = addr - cache.base
+            assert value == int.from_bytes(contents[flash_addr:flash_addr + 4], "little"), f"wrong data at {addr:#x}"
+            return cycles
+
+        def counters():
+            yield Settle()
+            return [(yield cache.hits), (yield cache.misses), (yield cache.stall_cycles)]
+
+        def proc():
+            line = 4 * args.line_words
+            way_size = line * args.sets
+            # a loop over code that fits the cache: it misses once per line and then always hits
+            loop = [cache.image_base + 4 * i for i in range(way_size // 4)]
+            cycles = []
+            for addr in loop * 4:
+                cycles.append((yield from read(addr)))
+            hits, misses, stalls = yield from counters()
+            assert misses == args.sets and hits == len(cycles) - misses, (hits, misses)
+            # the first miss also waits for the flash to wake up
+            print(f"loop over {way_size} bytes: {hits / (hits + misses):.1%} hits, {stalls} stall cycles, "
+                f"{sum(cycles) / len(cycles):.2f} cycles per read; a hit takes {min(cycles)}, a miss "
+                f"{cycles[args.line_words]}")
+
+            # two lines one way apart share a set: a direct-mapped cache thrashes, a 2-way one keeps both
+            for addr in [cache.image_base + 4 * way_size, cache.image_base] * 4:
+                yield from read(addr)
+            hits2, misses2, _ = yield from counters()
+            expected = 1 if args.ways == 2 else 8
+            assert misses2 - misses == expected, f"{misses2 - misses} misses for two lines sharing a set"
+            print(f"two lines sharing a set: {misses2 - misses} misses in 8 reads")
+
+            # a flush empties the cache
+            yield cache.registers["flush"].w_stb.eq(1)
+            yield
+            yield cache.registers["flush"].w_stb.eq(0)
+            yield from read(cache.image_base)
+            _, misses3, _ = yield from counters()
+            assert misses3 == misses2 + 1
+            print("a flush invalidates every line")
+        sim.add_sync_process(proc)
+        sim.run()
+    else:
+        parser.print_usage()
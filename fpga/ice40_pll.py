@@ -1,7 +1,10 @@
 from collections import namedtuple
-from typing import Tuple
+from functools import lru_cache
+from typing import Sequence, Tuple
 import warnings
 
+import numpy as np
+
 from nmigen import Elaboratable, Module, Instance, Signal, ClockDomain, ClockSignal, Const
 from nmigen.hdl.ast import ResetSignal
 from nmigen.lib.cdc import ResetSynchronizer
@@ -9,6 +12,43 @@ from nmigen.cli import main
 
 # original code https://github.com/kbob/nmigen-examples/blob/master/lib/pll.py
 
+PLLCoefficients = namedtuple('PLLCoefficients', 'divr divf divq f_out error')
+
+@lru_cache(maxsize=None)
+def _pll_candidates(f_in: float):
+    # cribbed from Icestorm's icepll: every legal (divr, divf, divq), in the order icepll searches them,
+    # so that argmin breaks ties the same way its loops do.
+    divf_range = 128        # see comments in icepll.cc
+    divr, divf, divq = (a.ravel() for a in np.meshgrid(np.arange(16), np.arange(divf_range), np.arange(8), indexing='ij'))
+
+    pfd = f_in / (divr + 1)
+    vco = pfd * (divf + 1)
+    fout = vco * 2.0 ** -divq
+
+    legal = (10 <= pfd) & (pfd <= 133) & (533 <= vco) & (vco <= 1066)
+    return divr[legal], divf[legal], divq[legal], fout[legal]
+
+def calc_pll_coefficients_batch(f_in: float, f_reqs: Sequence[float]) -> Sequence[PLLCoefficients]:
+    """
+    Find the closest achievable output frequency for each of ``f_reqs`` (all in MHz) in one pass over
+    the whole (divr, divf, divq) grid.
+    """
+    assert 10 <= f_in <= 160
+    f_reqs = np.asarray(f_reqs, dtype=float)
+    assert ((16 <= f_reqs) & (f_reqs <= 275)).all()
+
+    divr, divf, divq, fout = _pll_candidates(f_in)
+    best = np.abs(fout[np.newaxis, :] - f_reqs[:, np.newaxis]).argmin(axis=1)
+
+    return [
+        PLLCoefficients(int(divr[i]), int(divf[i]), int(divq[i]), float(fout[i]), float(fout[i] - f_req))
+        for i, f_req in zip(best, f_reqs)
+    ]
+
+@lru_cache(maxsize=None)
+def calc_pll_coefficients(f_in: float, f_req: float) -> PLLCoefficients:
+    return calc_pll_coefficients_batch(f_in, [f_req])[0]
+
 class ICE40_PLL(Elaboratable):
 
     """
@@ -22,32 +62,11 @@ class ICE40_PLL(Elaboratable):
         # self.pll_domain = ClockDomain(domain_name)
 
     def _calc_freq_coefficients(self, f_in, f_req):
-        # cribbed from Icestorm's icepll.
-        # f_in, f_req = self.freq_in, self.freq_out
-        assert 10 <= f_in <= 160
-        assert 16 <= f_req <= 275
-        coefficients = namedtuple('coefficients', 'divr divf divq')
-        divf_range = 128        # see comments in icepll.cc
-        best_fout = float('inf')
-        fouts = []
-        best: coefficients = coefficients(0, 0, 0)
-        for divr in range(16):
-            pfd = f_in / (divr + 1)
-            if 10 <= pfd <= 133:
-                for divf in range(divf_range):
-                    vco = pfd * (divf + 1)
-                    if 533 <= vco <= 1066:
-                        for divq in range(0, 8):
-                            fout = vco * 2**-divq
-                            fouts.append(fout)
-                            if abs(fout - f_req) < abs(best_fout - f_req):
-                                best_fout = fout
-                                best = coefficients(divr, divf, divq)
-        if best_fout != f_req:
+        best = calc_pll_coefficients(f_in, f_req)
+        if best.f_out != f_req:
             warnings.warn(
-                f'PLL: requested {f_req} MHz, got {best_fout} MHz)',
+                f'PLL: requested {f_req} MHz, got {best.f_out} MHz)',
                 stacklevel=3)
-        #print(sorted(fouts, key=lambda v: -abs(v-f_req)))
         return best
 
     def elaborate(self, platform):
@@ -76,7 +95,7 @@ class ICE40_PLL(Elaboratable):
 
                 i_REFERENCECLK=ClockSignal(),
                 o_PLLOUTCORE=ClockSignal(self.domain_name),
-                i_RESETB=ResetSignal(),
+                i_RESETB=~ResetSignal(),
                 i_BYPASS=Const(0),
                 o_LOCK=lock,
             )
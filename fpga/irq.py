@@ -0,0 +1,213 @@
+from collections import namedtuple
+from typing import Iterable
+
+from nmigen import Elaboratable, Module, Signal, Record
+
+from csr import Bank, Register
+
+# Interrupts for the PicoRV32 SoC.
+#
+# `InterruptController` gathers the interrupt lines of the peripherals into one line into the core, with a
+# pending and an enable bit per source, and `Timer` is a programmable cycle timer to raise one of them. The
+# controller's line reaches the core as IRQ `CORE_IRQ`, which the core does not latch, so it follows the
+# controller: firmware can sleep in `waitirq` with every core IRQ masked and look at `pending` when it wakes,
+# or unmask it and take it at `PROGADDR_IRQ`.
+#
+# Latency through the controller, measured by `python irq.py check`: an edge-triggered source (like the timer)
+# is pending and drives the core's line one cycle after its event, and a level-triggered one (like the UART) in
+# the same cycle. That is all these figures cover. The core then finishes the instruction in flight (a multiply
+# on its PCPI multiplier being the longest) before it jumps to `PROGADDR_IRQ` or leaves `waitirq`; pysim does
+# not simulate the core, so that part has not been measured here. The total is still bounded by the longest
+# instruction, where a polling loop's response time grows with everything else the loop does.
+
+CORE_IRQ = 3 # the first IRQ number PicoRV32 does not raise itself
+
+IRQLine = namedtuple('IRQLine', 'name signal edge', defaults=(False,))
+IRQLine.__doc__ = """
+An interrupt source. A level-triggered one is pending while ``signal`` is high and is acknowledged at the
+peripheral; an edge-triggered one (``edge``) becomes pending when ``signal`` rises and stays so until cleared in
+the controller.
+"""
+
+class InterruptController(Elaboratable):
+    """
+    Interrupt controller for ``sources``, a list of ``IRQLine``s, which become bits of the ``pending``,
+    ``enable`` and ``clear`` registers in order. ``irq`` is raised while any enabled source is pending.
+    """
+    def __init__(self, sources: Iterable[IRQLine]):
+        self.sources = list(sources)
+        assert self.sources, "an interrupt controller needs a source"
+        names = [source.name for source in self.sources]
+        assert len(set(names)) == len(names), "interrupt sources must have distinct names"
+
+        layout = [(name, 1) for name in names]
+        self.pending = Record(layout, name="irq_pending")
+        self.enable = Record(layout, name="irq_enable")
+        self.clear = Record(layout, name="irq_clear")
+        self.irq = Signal()
+
+        self.registers = {register.name: register for register in [
+            Register("pending", self.pending, access="r"),
+            Register("enable", self.enable),
+            Register("clear", self.clear, access="w", desc="Write ones to clear edge-triggered sources."),
+        ]}
+
+    def csr_bank(self, name: str = "irq") -> Bank:
+        return Bank(name, self.registers.values(), desc="Interrupt controller.")
+
+    def elaborate(self, platform):
+        m = Module()
+
+        pending = self.pending
+        for source in self.sources:
+            if not source.edge:
+                m.d.comb += pending[source.name].eq(source.signal)
+                continue
+            prev = Signal(name=f"{source.name}_prev")
+            m.d.sync += prev.eq(source.signal)
+            with m.If(source.signal & ~prev):
+                m.d.sync += pending[source.name].eq(1)
+            with m.Elif(self.registers["clear"].w_stb & self.clear[source.name]):
+                m.d.sync += pending[source.name].eq(0)
+        m.d.comb += self.irq.eq((pending & self.enable).any())
+
+        return m
+
+class Timer(Elaboratable):
+    """
+    A cycle timer. Writing ``ctrl`` with ``enable`` set (re)starts it from ``period``; it counts down to 0,
+    where ``event`` pulses, which is every ``period + 1`` cycles with ``periodic`` set and once without.
+    Writing ``ctrl`` with ``enable`` clear stops it.
+    """
+    def __init__(self, width: int = 32):
+        self.width = width
+
+        self.event = Signal()
+
+        self.ctrl = Record([
+            ("enable", 1),
+            ("periodic", 1),
+        ])
+        self.status = Record([
+            ("running", 1),
+        ])
+        self.period = Signal(width)
+        self.value = Signal(width)
+
+        self.registers = {register.name: register for register in [
+            Register("ctrl", self.ctrl),
+            Register("status", self.status, access="r"),
+            Register("period", self.period, desc="Cycles between events, minus one."),
+            Register("value", self.value, access="r", desc="Cycles left until the next event."),
+        ]}
+
+    def csr_bank(self, name: str = "timer") -> Bank:
+        return Bank(name, self.registers.values(), desc="Programmable cycle timer.")
+
+    def elaborate(self, platform):
+        m = Module()
+
+        running = self.status.running
+        m.d.comb += self.event.eq(running & (self.value == 0))
+
+        with m.If(self.registers["ctrl"].w_stb):
+            m.d.sync += [
+                running.eq(self.ctrl.enable),
+                self.value.eq(self.period),
+            ]
+        with m.Elif(self.event):
+            m.d.sync += [
+                running.eq(self.ctrl.periodic),
+                self.value.eq(self.period),
+            ]
+        with m.Elif(running):
+            m.d.sync += self.value.eq(self.value - 1)
+
+        return m
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    p_action = parser.add_subparsers(dest="action")
+    p_check = p_action.add_parser("check", help="run the timer into the controller and measure the latencies")
+    p_check.add_argument("--period", type=int, default=37)
+
+    args = parser.parse_args()
+    if args.action == "check":
+        from nmigen.sim import Simulator, Passive, Settle
+        from csr import CSRBridge, CSRMap, wishbone_access
+
+        m = Module()
+        m.submodules.timer = timer = Timer()
+        level = Signal()
+        m.submodules.controller = controller = InterruptController([
+            IRQLine("timer", timer.event, edge=True),
+            IRQLine("level", level),
+        ])
+        m.submodules.bridge = bridge = CSRBridge(CSRMap([timer.csr_bank(), controller.csr_bank()]))
+        sim = Simulator(m)
+        sim.add_clock(1e-6)
+
+        def access(register, data=None):
+            return (yield from wishbone_access(bridge.bus, register, data))
+
+        # the cycles on which the timer fired and on which the line rose
+        events, rises = [], []
+        def monitor():
+            yield Passive()
+            cycle, irq = 0, 0
+            while True:
+                yield
+                cycle += 1
+                if (yield timer.event):
+                    events.append(cycle)
+                if (yield controller.irq) and not irq:
+                    rises.append(cycle)
+                irq = yield controller.irq
+
+        def wait(cycles):
+            for _ in range(cycles):
+                yield
+
+        def proc():
+            t, c = timer.registers, controller.registers
+            yield from access(c["enable"], 0b11)
+            yield from access(t["period"], args.period)
+            yield from access(t["ctrl"], 0b11)
+
+            # periodic events, each raising the line until cleared
+            for i in range(3):
+                yield from wait(args.period + 1)
+                assert (yield from access(c["pending"])) == 0b01
+                yield from access(c["clear"], 0b01)
+                assert len(rises) == i + 1 and not (yield controller.irq)
+            assert {b - a for a, b in zip(events, events[1:])} == {args.period + 1}, events
+            edge_latency = rises[0] - events[0]
+
+            # a one-shot stops after its event
+            yield from access(t["ctrl"], 0b01)
+            yield from wait(args.period + 4)
+            assert not (yield timer.status.running)
+            fired = len(events)
+            yield from wait(args.period + 4)
+            assert len(events) == fired
+            yield from access(c["clear"], 0b01)
+
+            # a level passes straight through and cannot be cleared in the controller
+            yield level.eq(1)
+            yield Settle()
+            assert (yield controller.irq)
+            yield from access(c["clear"], 0b10)
+            assert (yield controller.irq)
+            yield level.eq(0)
+            yield Settle()
+            assert not (yield controller.irq)
+
+            print(f"timer events every {args.period + 1} cycles; the line rises {edge_latency} cycle(s) after "
+                f"an edge and in the same cycle as a level")
+        sim.add_sync_process(monitor)
+        sim.add_sync_process(proc)
+        sim.run()
+    else:
+        parser.print_usage()
@@ -0,0 +1,928 @@
+import struct
+from collections import Counter, namedtuple
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from csr import Bank, CSRMap
+from irq import CORE_IRQ
+from picorv32 import PROGADDR_RESET, RAM_SIZE
+
+# Instruction-set simulator for the firmware.
+#
+# Simulating `picorv32.v` in RTL runs the firmware a few thousand instructions per second. `Machine` instead
+# interprets RV32IMC in Python, with the same memory layout as `PicoRV32` (RAM at 0, the image at
+# `PROGADDR_RESET`, or read-only in flash with XIP) and the CSRs of the gateware's `CSRMap` served by Python
+# models of the peripherals, so a long firmware scenario runs in seconds. Each instruction is decoded once into
+# a closure, kept in a cache keyed by its address, and writes to the code evict the closures they overlap.
+#
+# It is a functional model: peripherals answer at once, and time is counted as one cycle per instruction, plus
+# the cycles slept in `waitirq` until a timer event.
+
+MASK = 0xffff_ffff
+
+Access = namedtuple('Access', 'instret pc op addr value register')
+
+class Halt(Exception):
+    """
+    Raised when the firmware stops: an ``ecall`` or ``ebreak``, or a jump to itself, which nothing can leave
+    without interrupts.
+    """
+
+class Fault(Exception):
+    """
+    An access or instruction the core would not handle: a misaligned access (which PicoRV32, built without
+    ``CATCH_MISALIGN``, silently aligns), an illegal instruction, or an access outside RAM and the CSRs, which
+    no slave would acknowledge.
+    """
+    def __init__(self, pc: int, message: str):
+        super().__init__(f"{message} at pc {pc:#010x}")
+        self.pc = pc
+
+def _signed(value: int) -> int:
+    return value - (1 << 32) if value & 0x8000_0000 else value
+
+def _sext(value: int, bits: int) -> int:
+    value &= (1 << bits) - 1
+    return value - (1 << bits) if value >> (bits - 1) else value
+
+def _div(a: int, b: int) -> int:
+    a, b = _signed(a), _signed(b)
+    if b == 0:
+        return MASK
+    if a == -(1 << 31) and b == -1:
+        return a
+    q = abs(a) // abs(b)
+    return -q if (a < 0) != (b < 0) else q
+
+def _rem(a: int, b: int) -> int:
+    sa, sb = _signed(a), _signed(b)
+    if sb == 0:
+        return a
+    if sa == -(1 << 31) and sb == -1:
+        return 0
+    return sa - sb * _div(a, b)
+
+# results before masking to 32 bits, for two unsigned 32-bit operands
+ALU = {
+    "add": lambda a, b: a + b,
+    "sub": lambda a, b: a - b,
+    "sll": lambda a, b: a << (b & 31),
+    "slt": lambda a, b: int(_signed(a) < _signed(b)),
+    "sltu": lambda a, b: int(a < b),
+    "xor": lambda a, b: a ^ b,
+    "srl": lambda a, b: a >> (b & 31),
+    "sra": lambda a, b: _signed(a) >> (b & 31),
+    "or": lambda a, b: a | b,
+    "and": lambda a, b: a & b,
+    "mul": lambda a, b: a * b,
+    "mulh": lambda a, b: (_signed(a) * _signed(b)) >> 32,
+    "mulhsu": lambda a, b: (_signed(a) * b) >> 32,
+    "mulhu": lambda a, b: (a * b) >> 32,
+    "div": _div,
+    "divu": lambda a, b: a // b if b else MASK,
+    "rem": _rem,
+    "remu": lambda a, b: a % b if b else a,
+}
+DIVISION = ("div", "divu", "rem", "remu")
+# the register-immediate forms without a fast path of their own, and the `ALU` operation of each
+IMMEDIATE_ALU = {"slti": "slt", "sltiu": "sltu", "xori": "xor", "ori": "or", "srai": "sra"}
+
+BRANCHES = {
+    "beq": lambda a, b: a == b,
+    "bne": lambda a, b: a != b,
+    "blt": lambda a, b: _signed(a) < _signed(b),
+    "bge": lambda a, b: _signed(a) >= _signed(b),
+    "bltu": lambda a, b: a < b,
+    "bgeu": lambda a, b: a >= b,
+}
+
+# struct format and size of each access
+LOADS = {"lb": ("<b", 1), "lh": ("<h", 2), "lw": ("<I", 4), "lbu": ("<B", 1), "lhu": ("<H", 2)}
+STORES = {"sb": ("<B", 1), "sh": ("<H", 2), "sw": ("<I", 4)}
+
+# the user-level counters, for `rdcycle`, `rdtime` and `rdinstret` and their upper halves
+COUNTER_CSRS = {0xc00: ("time", 0), 0xc01: ("time", 0), 0xc02: ("instret", 0),
+    0xc80: ("time", 32), 0xc81: ("time", 32), 0xc82: ("instret", 32)}
+
+# PicoRV32's interrupt instructions, by funct7
+IRQ_INSTRUCTIONS = ["getq", "setq", "retirq", "maskirq", "waitirq", "timer"]
+
+def decode(insn: int) -> tuple:
+    """
+    ``(name, rd, rs1, rs2, imm)`` for a 32-bit instruction. Shifts by an immediate carry the amount in ``imm``
+    and CSR instructions the CSR number; unknown encodings are named ``"illegal"``.
+    """
+    opcode = insn & 0x7f
+    rd = (insn >> 7) & 31
+    funct3 = (insn >> 12) & 7
+    rs1 = (insn >> 15) & 31
+    rs2 = (insn >> 20) & 31
+    funct7 = insn >> 25
+    illegal = ("illegal", 0, 0, 0, insn)
+
+    if opcode == 0x37:
+        return ("lui", rd, 0, 0, insn & 0xffff_f000)
+    if opcode == 0x17:
+        return ("auipc", rd, 0, 0, insn & 0xffff_f000)
+    if opcode == 0x6f:
+        imm = (insn >> 31) << 20 | ((insn >> 12) & 0xff) << 12 | ((insn >> 20) & 1) << 11 | ((insn >> 21) & 0x3ff) << 1
+        return ("jal", rd, 0, 0, _sext(imm, 21))
+    if opcode == 0x67 and funct3 == 0:
+        return ("jalr", rd, rs1, 0, _sext(insn >> 20, 12))
+    if opcode == 0x63:
+        name = {0: "beq", 1: "bne", 4: "blt", 5: "bge", 6: "bltu", 7: "bgeu"}.get(funct3)
+        imm = (insn >> 31) << 12 | ((insn >> 7) & 1) << 11 | ((insn >> 25) & 0x3f) << 5 | ((insn >> 8) & 0xf) << 1
+        return (name, 0, rs1, rs2, _sext(imm, 13)) if name else illegal
+    if opcode == 0x03:
+        name = {0: "lb", 1: "lh", 2: "lw", 4: "lbu", 5: "lhu"}.get(funct3)
+        return (name, rd, rs1, 0, _sext(insn >> 20, 12)) if name else illegal
+    if opcode == 0x23:
+        name = {0: "sb", 1: "sh", 2: "sw"}.get(funct3)
+        return (name, 0, rs1, rs2, _sext((insn >> 25) << 5 | rd, 12)) if name else illegal
+    if opcode == 0x13:
+        if funct3 == 1:
+            return ("slli", rd, rs1, 0, rs2) if funct7 == 0 else illegal
+        if funct3 == 5:
+            name = {0x00: "srli", 0x20: "srai"}.get(funct7)
+            return (name, rd, rs1, 0, rs2) if name else illegal
+        name = {0: "addi", 2: "slti", 3: "sltiu", 4: "xori", 6: "ori", 7: "andi"}[funct3]
+        return (name, rd, rs1, 0, _sext(insn >> 20, 12))
+    if opcode == 0x33:
+        names = {
+            0x00: ["add", "sll", "slt", "sltu", "xor", "srl", "or", "and"],
+            0x20: ["sub", None, None, None, None, "sra", None, None],
+            0x01: ["mul", "mulh", "mulhsu", "mulhu", "div", "divu", "rem", "remu"],
+        }.get(funct7)
+        name = names[funct3] if names else None
+        return (name, rd, rs1, rs2, 0) if name else illegal
+    if opcode == 0x0f:
+        return ("fence", 0, 0, 0, 0)
+    if opcode == 0x73:
+        if insn == 0x0000_0073:
+            return ("ecall", 0, 0, 0, 0)
+        if insn == 0x0010_0073:
+            return ("ebreak", 0, 0, 0, 0)
+        name = {1: "csrrw", 2: "csrrs", 3: "csrrc", 5: "csrrwi", 6: "csrrsi", 7: "csrrci"}.get(funct3)
+        return (name, rd, rs1, 0, insn >> 20) if name else illegal
+    if opcode == 0x0b and funct7 < len(IRQ_INSTRUCTIONS):
+        return (IRQ_INSTRUCTIONS[funct7], rd, rs1, 0, 0)
+    return illegal
+
+def decode_compressed(insn: int) -> tuple:
+    """
+    The ``decode`` of the 32-bit instruction a 16-bit one expands to.
+    """
+    op = insn & 3
+    funct3 = insn >> 13
+    bit = lambda i: (insn >> i) & 1
+    bits = lambda hi, lo: (insn >> lo) & ((1 << (hi - lo + 1)) - 1)
+    rd = bits(11, 7)
+    rs2 = bits(6, 2)
+    rd_ = bits(4, 2) + 8
+    rs1_ = bits(9, 7) + 8
+    imm6 = _sext(bit(12) << 5 | bits(6, 2), 6)
+    illegal = ("illegal", 0, 0, 0, insn)
+
+    if op == 0:
+        if funct3 == 0:
+            imm = bits(12, 11) << 4 | bits(10, 7) << 6 | bit(6) << 2 | bit(5) << 3
+            return ("addi", rd_, 2, 0, imm) if imm else illegal
+        offset = bits(12, 10) << 3 | bit(6) << 2 | bit(5) << 6
+        if funct3 == 2:
+            return ("lw", rd_, rs1_, 0, offset)
+        if funct3 == 6:
+            return ("sw", 0, rs1_, rd_, offset)
+        return illegal
+
+    if op == 1:
+        if funct3 == 0:
+            return ("addi", rd, rd, 0, imm6)
+        if funct3 in (1, 5):
+            imm = (bit(12) << 11 | bit(11) << 4 | bits(10, 9) << 8 | bit(8) << 10 | bit(7) << 6 | bit(6) << 7
+                | bits(5, 3) << 1 | bit(2) << 5)
+            return ("jal", 1 if funct3 == 1 else 0, 0, 0, _sext(imm, 12))
+        if funct3 == 2:
+            return ("addi", rd, 0, 0, imm6)
+        if funct3 == 3:
+            if rd == 2:
+                imm = bit(12) << 9 | bit(6) << 4 | bit(5) << 6 | bits(4, 3) << 7 | bit(2) << 5
+                return ("addi", 2, 2, 0, _sext(imm, 10)) if imm else illegal
+            return ("lui", rd, 0, 0, (imm6 << 12) & MASK) if imm6 else illegal
+        if funct3 == 4:
+            funct2 = bits(11, 10)
+            if funct2 == 0:
+                return ("srli", rs1_, rs1_, 0, rs2) if not bit(12) else illegal
+            if funct2 == 1:
+                return ("srai", rs1_, rs1_, 0, rs2) if not bit(12) else illegal
+            if funct2 == 2:
+                return ("andi", rs1_, rs1_, 0, imm6)
+            if bit(12):
+                return illegal
+            return (["sub", "xor", "or", "and"][bits(6, 5)], rs1_, rs1_, rd_, 0)
+        imm = bit(12) << 8 | bits(11, 10) << 3 | bits(6, 5) << 6 | bits(4, 3) << 1 | bit(2) << 5
+        return ("beq" if funct3 == 6 else "bne", 0, rs1_, 0, _sext(imm, 9))
+
+    if op == 2:
+        if funct3 == 0:
+            return ("slli", rd, rd, 0, rs2) if not bit(12) else illegal
+        if funct3 == 2:
+            offset = bit(12) << 5 | bits(6, 4) << 2 | bits(3, 2) << 6
+            return ("lw", rd, 2, 0, offset) if rd else illegal
+        if funct3 == 4:
+            if not bit(12):
+                if rs2 == 0:
+                    return ("jalr", 0, rd, 0, 0) if rd else illegal
+                return ("add", rd, 0, rs2, 0)
+            if rd == 0 and rs2 == 0:
+                return ("ebreak", 0, 0, 0, 0)
+            if rs2 == 0:
+                return ("jalr", 1, rd, 0, 0)
+            return ("add", rd, rd, rs2, 0)
+        if funct3 == 6:
+            offset = bits(12, 9) << 2 | bits(8, 7) << 6
+            return ("sw", 0, 2, rs2, offset)
+    return illegal
+
+class BankModel:
+    """
+    Python model of one ``Bank`` of CSRs, by default plain storage that behaves like ``CSRBridge``: writes to
+    read-only registers are dropped and write-only registers read as 0. Subclasses model a peripheral's side
+    effects by overriding ``read`` and ``write``, which see whole registers by name.
+
+    ``machine`` is the ``Machine`` the model is attached to, for the time and for DMA. Models of peripherals
+    that act on their own, like a timer, catch up in ``advance`` before every CSR access, and say in
+    ``next_event`` when they next need to, so ``waitirq`` can sleep until then.
+    """
+    def __init__(self, bank: Bank):
+        self.bank = bank
+        self.registers = {register.name: register for register in bank.registers}
+        self.values = {register.name: getattr(register.signal, "reset", 0) for register in bank.registers}
+        self.machine = None
+
+    def field(self, register: str, name: str) -> int:
+        # the mask of a field of a `Record` register
+        for field, offset, width in self.registers[register].fields:
+            if field == name:
+                return ((1 << width) - 1) << offset
+        raise KeyError(f"{self.bank.name}.{register} has no field {name!r}")
+
+    def advance(self, time: int):
+        pass
+
+    def next_event(self) -> Optional[int]:
+        return None
+
+    def read(self, name: str) -> int:
+        return self.values[name] if "r" in self.registers[name].access else 0
+
+    def write(self, name: str, value: int):
+        if "w" in self.registers[name].access:
+            self.values[name] = value & ((1 << len(self.registers[name].signal)) - 1)
+
+class LEDModel(BankModel):
+    """
+    The LED, with ``history`` of ``(time, on)`` for every change.
+    """
+    def __init__(self, bank: Bank):
+        super().__init__(bank)
+        self.history = []
+
+    @property
+    def on(self) -> bool:
+        return bool(self.values["ctrl"])
+
+    def write(self, name: str, value: int):
+        was = self.on
+        super().write(name, value)
+        if self.on != was:
+            self.history.append((self.machine.time, self.on))
+
+class NCOControlModel(BankModel):
+    """
+    The NCO's control register, with ``history`` of ``(time, enabled)`` for every change.
+    """
+    def __init__(self, bank: Bank):
+        super().__init__(bank)
+        self.history = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.values["ctrl"] & self.field("ctrl", "enable"))
+
+    def write(self, name: str, value: int):
+        was = self.enabled
+        super().write(name, value)
+        if self.enabled != was:
+            self.history.append((self.machine.time, self.enabled))
+
+class ChirpModel(BankModel):
+    """
+    The sweep engine as a fixed-frequency source: ``step`` sets the phase step at once and segments are only
+    stored, never played. ``history`` has ``(time, phase_step)`` for every change, and with ``nco``, one of
+    the NCO models, ``samples`` generates the waveform at the current step.
+    """
+    def __init__(self, bank: Bank, nco=None):
+        super().__init__(bank)
+        self.nco = nco
+        self.history = []
+
+    @property
+    def phase_step(self) -> int:
+        return self.values["phase_step"]
+
+    def frequency(self, clk_freq: float = 16e6) -> float:
+        return self.phase_step * clk_freq / (1 << 32)
+
+    def read(self, name: str) -> int:
+        if name == "phase_step":
+            return self.phase_step
+        return super().read(name)
+
+    def write(self, name: str, value: int):
+        super().write(name, value)
+        if name == "step" and value != self.phase_step:
+            self.values["phase_step"] = value
+            self.history.append((self.machine.time, value))
+
+    def samples(self, n: int):
+        """
+        The NCO's next ``n`` ``(sin, cos)`` samples at the current phase step.
+        """
+        assert self.nco is not None, "no NCO model attached"
+        return self.nco.run(self.phase_step, n)
+
+class UARTModel(BankModel):
+    """
+    The UART with an infinitely fast line: bytes written to ``tx_data`` or sent by DMA land in ``tx`` at once,
+    and bytes put in ``rx`` are read back through ``rx_data``. Errors never happen, so only the ready, empty
+    and DMA interrupts are raised.
+    """
+    def __init__(self, bank: Bank):
+        super().__init__(bank)
+        self.tx = bytearray()
+        self.rx = bytearray()
+        self.sticky = 0
+
+    @property
+    def pending(self) -> int:
+        levels = self.field("irq_pending", "tx_empty") | (self.field("irq_pending", "rx_ready") if self.rx else 0)
+        return levels | self.sticky
+
+    @property
+    def irq(self) -> bool:
+        return bool(self.pending & self.values["irq_enable"])
+
+    def read(self, name: str) -> int:
+        if name == "status":
+            return self.field("status", "rx_empty") if not self.rx else 0
+        if name == "rx_data":
+            return self.rx.pop(0) if self.rx else 0
+        if name == "levels":
+            # the TX FIFO is always empty
+            return min(len(self.rx), 0xffff) << 16
+        if name == "irq_pending":
+            return self.pending
+        return super().read(name)
+
+    def write(self, name: str, value: int):
+        super().write(name, value)
+        if name == "tx_data":
+            self.tx.append(value & 0xff)
+        elif name == "tx_dma_len":
+            addr = self.values["tx_dma_addr"]
+            self.tx += self.machine.ram[addr:addr + value]
+            self.sticky |= self.field("irq_pending", "tx_dma_done")
+        elif name == "rx_dma_len":
+            addr = self.values["rx_dma_addr"]
+            data, self.rx = self.rx[:value], self.rx[value:]
+            self.machine.ram[addr:addr + len(data)] = data
+            # the transfer only ends once `value` bytes have arrived
+            if len(data) == value:
+                self.sticky |= self.field("irq_pending", "rx_dma_done")
+        elif name == "irq_clear":
+            self.sticky &= ~value
+
+class InterruptControllerModel(BankModel):
+    """
+    The interrupt controller. Edge-triggered sources are raised by other models through ``trigger``, and
+    ``levels`` maps the names of level-triggered ones to functions returning their state.
+    """
+    def __init__(self, bank: Bank, levels: Dict[str, Callable[[], bool]] = {}):
+        super().__init__(bank)
+        self.levels = levels
+        self.sticky = 0
+
+    def trigger(self, name: str):
+        self.sticky |= self.field("pending", name)
+
+    @property
+    def pending(self) -> int:
+        pending = self.sticky
+        for name, level in self.levels.items():
+            if level():
+                pending |= self.field("pending", name)
+        return pending
+
+    @property
+    def irq(self) -> bool:
+        return bool(self.pending & self.values["enable"])
+
+    def read(self, name: str) -> int:
+        if name == "pending":
+            return self.pending
+        return super().read(name)
+
+    def write(self, name: str, value: int):
+        super().write(name, value)
+        if name == "clear":
+            self.sticky &= ~value
+
+class TimerModel(BankModel):
+    """
+    The cycle timer, triggering ``source`` in ``controller`` (an ``InterruptControllerModel``) on every event.
+    """
+    def __init__(self, bank: Bank, controller: Optional[InterruptControllerModel] = None, source: str = "timer"):
+        super().__init__(bank)
+        self.controller = controller
+        self.source = source
+        # the time of the next event while running
+        self.deadline = None
+        self.events = 0
+
+    def advance(self, time: int):
+        if self.deadline is None or time < self.deadline:
+            return
+        interval = self.values["period"] + 1
+        if self.values["ctrl"] & self.field("ctrl", "periodic"):
+            fired = (time - self.deadline) // interval + 1
+            self.deadline += fired * interval
+        else:
+            fired = 1
+            self.deadline = None
+        self.events += fired
+        if self.controller is not None:
+            self.controller.trigger(self.source)
+
+    def next_event(self) -> Optional[int]:
+        return self.deadline
+
+    def read(self, name: str) -> int:
+        if name == "status":
+            return self.field("status", "running") if self.deadline is not None else 0
+        if name == "value":
+            return self.deadline - self.machine.time if self.deadline is not None else self.values["period"]
+        return super().read(name)
+
+    def write(self, name: str, value: int):
+        super().write(name, value)
+        if name == "ctrl":
+            enabled = value & self.field("ctrl", "enable")
+            self.deadline = self.machine.time + self.values["period"] + 1 if enabled else None
+
+# models for the banks `Top` lays out, by bank name; `models_for` wires up the ones that talk to each other
+MODELS = {
+    "nco": NCOControlModel,
+    "led": LEDModel,
+    "uart": UARTModel,
+    "chirp": ChirpModel,
+    "irq": InterruptControllerModel,
+    "timer": TimerModel,
+}
+
+class Machine:
+    """
+    An RV32IMC hart with ``image`` (32-bit words) loaded at ``PROGADDR_RESET`` after ``RAM_SIZE`` words of
+    RAM, and the registers of ``csr_map`` served by ``models`` (``BankModel``s by bank name; banks without one
+    get plain storage).
+
+    Like the core in ``PicoRV32``, division, the counter CSRs and the interrupt instructions are only there when
+    enabled. With ``interrupts``, ``waitirq`` sleeps until the ``InterruptControllerModel`` among the models
+    raises its line, but handlers are not modelled: unmasking the controller's IRQ is a ``Fault``.
+
+    ``counts`` tallies CSR accesses by ``(op, "bank.register")``; with ``trace`` every one is also kept in
+    ``accesses`` as an ``Access``.
+
+    With an ``image_base`` other than ``PROGADDR_RESET``, as for a ``PicoRV32`` with ``xip``, the image is
+    read-only memory at that address and runs from there. The instruction cache is not modelled.
+    """
+    def __init__(self, image, csr_map: CSRMap, models: Dict[str, BankModel] = {}, division: bool = False,
+            counters: bool = False, interrupts: bool = False, trace: bool = False, image_base: int = PROGADDR_RESET):
+        image = np.asarray(image, dtype='<u4').tobytes()
+        if image_base == PROGADDR_RESET:
+            self.ram = bytearray(4 * RAM_SIZE) + bytearray(image)
+            self.flash = b""
+        else:
+            assert image_base >= 4 * RAM_SIZE
+            self.ram = bytearray(4 * RAM_SIZE)
+            self.flash = image
+        self.ram_size = len(self.ram)
+        self.flash_base = image_base
+        self.flash_end = image_base + len(self.flash)
+        self.division = division
+        self.counters = counters
+        self.interrupts = interrupts
+        self.trace = trace
+
+        self.models = {}
+        self.registers = {}
+        for bank in csr_map.banks:
+            model = models.get(bank.name) or BankModel(bank)
+            model.machine = self
+            self.models[bank.name] = model
+            for register in bank.registers:
+                self.registers[register.addr] = (model, register.name, f"{bank.name}.{register.name}")
+        self.csr_window = (csr_map.base, csr_map.base + csr_map.size)
+        self.controller = next((model for model in self.models.values()
+            if isinstance(model, InterruptControllerModel)), None)
+
+        # x0 is never written: instructions with rd = 0 write to x[32] instead
+        self.x = [0] * 33
+        self.pc = image_base
+        self.instret = 0
+        # cycles spent in `waitirq`
+        self.slept = 0
+        self.irq_mask = MASK
+        self.counts = Counter()
+        self.accesses: List[Access] = []
+
+        self.cache: Dict[int, Callable[[], int]] = {}
+        # the lowest address with a cached instruction, so stores below it skip the eviction
+        self.code_low = MASK
+
+    @property
+    def time(self) -> int:
+        """
+        Clock cycles since reset.
+        """
+        return self.instret + self.slept
+
+    def _advance(self):
+        time = self.time
+        for model in self.models.values():
+            model.advance(time)
+
+    def _waitirq(self, pc: int) -> int:
+        # the core's pending IRQs once the controller's line is up
+        if self.controller is None:
+            raise Fault(pc, "waitirq without an interrupt controller")
+        self._advance()
+        while not self.controller.irq:
+            events = [t for t in (model.next_event() for model in self.models.values()) if t is not None]
+            if not events:
+                raise Halt(f"waitirq at {pc:#010x} with nothing to wake it")
+            self.slept += max(min(events) - self.time, 0)
+            self._advance()
+        return 1 << CORE_IRQ
+
+    def _mmio_read(self, pc: int, addr: int, size: int) -> int:
+        self._advance()
+        target = self.registers.get(addr & ~3)
+        if target is None:
+            if not self.csr_window[0] <= addr < self.csr_window[1]:
+                raise Fault(pc, f"read from unmapped address {addr:#010x}")
+            # the bridge acknowledges its whole window
+            word, name = 0, f"{addr & ~3:#010x}"
+        else:
+            model, register, name = target
+            word = model.read(register) & MASK
+        self.counts["r", name] += 1
+        if self.trace:
+            self.accesses.append(Access(self.instret, pc, "r", addr, word, name))
+        return (word >> (8 * (addr & 3))) & ((1 << (8 * size)) - 1)
+
+    def _mmio_write(self, pc: int, addr: int, value: int, size: int):
+        self._advance()
+        target = self.registers.get(addr & ~3)
+        if target is None:
+            if not self.csr_window[0] <= addr < self.csr_window[1]:
+                raise Fault(pc, f"write to unmapped address {addr:#010x}")
+            self.counts["w", f"{addr & ~3:#010x}"] += 1
+            return
+        model, register, name = target
+        # sub-word writes merge with the register, as `CSRBridge` does with the byte selects
+        shift = 8 * (addr & 3)
+        mask = ((1 << (8 * size)) - 1) << shift
+        word = (model.values[register] & ~mask) | ((value << shift) & mask)
+        model.write(register, word)
+        self.counts["w", name] += 1
+        if self.trace:
+            self.accesses.append(Access(self.instret, pc, "w", addr, word, name))
+
+    def _evict(self, addr: int, size: int):
+        # instructions are 2 or 4 bytes at even addresses, so one starting 2 bytes early can overlap
+        for pc in range((addr - 2) & ~1, addr + size, 2):
+            self.cache.pop(pc, None)
+
+    def fetch(self, pc: int) -> tuple:
+        """
+        ``(decoded, size)`` for the instruction at ``pc``.
+        """
+        if pc < self.ram_size:
+            memory, offset = self.ram, pc
+        else:
+            memory, offset = self.flash, pc - self.flash_base
+        if pc & 1 or not 0 <= offset <= len(memory) - 2:
+            raise Fault(pc, "instruction fetch outside RAM and flash")
+        low = struct.unpack_from("<H", memory, offset)[0]
+        if low & 3 != 3:
+            return decode_compressed(low), 2
+        if offset + 4 > len(memory):
+            raise Fault(pc, "instruction fetch outside RAM and flash")
+        return decode(struct.unpack_from("<I", memory, offset)[0]), 4
+
+    def compile(self, pc: int) -> Callable[[], int]:
+        """
+        A closure executing the instruction at ``pc`` and returning the next ``pc``, cached until the
+        instruction is overwritten.
+        """
+        (name, rd, rs1, rs2, imm), size = self.fetch(pc)
+        x, ram, ram_size = self.x, self.ram, self.ram_size
+        flash, flash_base, flash_end = self.flash, self.flash_base, self.flash_end
+        rd = rd or 32
+        nxt = (pc + size) & MASK
+        target = (pc + imm) & MASK
+
+        if name == "illegal" or name in DIVISION and not self.division:
+            message = f"illegal instruction {imm:#x}" if name == "illegal" else f"{name} without ENABLE_DIV"
+            def op():
+                raise Fault(pc, message)
+        elif name == "fence":
+            def op():
+                return nxt
+
+        # the most common operations skip the call through `ALU`
+        elif name == "addi":
+            def op():
+                x[rd] = (x[rs1] + imm) & MASK
+                return nxt
+        elif name == "add":
+            def op():
+                x[rd] = (x[rs1] + x[rs2]) & MASK
+                return nxt
+        elif name == "andi":
+            b = imm & MASK
+            def op():
+                x[rd] = x[rs1] & b
+                return nxt
+        elif name == "slli":
+            def op():
+                x[rd] = (x[rs1] << imm) & MASK
+                return nxt
+        elif name == "srli":
+            def op():
+                x[rd] = x[rs1] >> imm
+                return nxt
+        elif name in IMMEDIATE_ALU:
+            f, b = ALU[IMMEDIATE_ALU[name]], imm & MASK
+            def op():
+                x[rd] = f(x[rs1], b) & MASK
+                return nxt
+        elif name in ALU:
+            f = ALU[name]
+            def op():
+                x[rd] = f(x[rs1], x[rs2]) & MASK
+                return nxt
+        elif name in ("lui", "auipc"):
+            value = imm if name == "lui" else (pc + imm) & MASK
+            def op():
+                x[rd] = value
+                return nxt
+
+        elif name == "jal":
+            if target == pc:
+                def op():
+                    raise Halt(f"idle loop at {pc:#010x}")
+            else:
+                def op():
+                    x[rd] = nxt
+                    return target
+        elif name == "jalr":
+            def op():
+                t = (x[rs1] + imm) & ~1 & MASK
+                x[rd] = nxt
+                return t
+        elif name in ("beq", "bne"):
+            taken = name == "beq"
+            def op():
+                return target if (x[rs1] == x[rs2]) == taken else nxt
+        elif name in BRANCHES:
+            f = BRANCHES[name]
+            def op():
+                return target if f(x[rs1], x[rs2]) else nxt
+
+        elif name in LOADS:
+            fmt, width = LOADS[name]
+            signed = name in ("lb", "lh")
+            def op():
+                addr = (x[rs1] + imm) & MASK
+                if addr & (width - 1):
+                    raise Fault(pc, f"misaligned {name} from {addr:#010x}")
+                if addr < ram_size:
+                    x[rd] = struct.unpack_from(fmt, ram, addr)[0] & MASK
+                elif flash_base <= addr < flash_end:
+                    x[rd] = struct.unpack_from(fmt, flash, addr - flash_base)[0] & MASK
+                else:
+                    value = self._mmio_read(pc, addr, width)
+                    x[rd] = _sext(value, 8 * width) & MASK if signed else value
+                return nxt
+        elif name in STORES:
+            fmt, width = STORES[name]
+            mask = (1 << (8 * width)) - 1
+            def op():
+                addr = (x[rs1] + imm) & MASK
+                if addr & (width - 1):
+                    raise Fault(pc, f"misaligned {name} to {addr:#010x}")
+                if addr < ram_size:
+                    struct.pack_into(fmt, ram, addr, x[rs2] & mask)
+                    if addr + width > self.code_low:
+                        self._evict(addr, width)
+                elif flash_base <= addr < flash_end:
+                    raise Fault(pc, f"{name} to flash at {addr:#010x}")
+                else:
+                    self._mmio_write(pc, addr, x[rs2] & mask, width)
+                return nxt
+
+        elif name in ("ecall", "ebreak"):
+            def op():
+                raise Halt(f"{name} at {pc:#010x}")
+        elif name in IRQ_INSTRUCTIONS:
+            if not self.interrupts:
+                def op():
+                    raise Fault(pc, f"{name} without ENABLE_IRQ")
+            elif name == "waitirq":
+                def op():
+                    x[rd] = self._waitirq(pc)
+                    return nxt
+            elif name == "maskirq":
+                def op():
+                    mask = x[rs1]
+                    if not mask & (1 << CORE_IRQ):
+                        raise Fault(pc, "interrupt handlers are not modelled; wait for interrupts with waitirq")
+                    x[rd], self.irq_mask = self.irq_mask, mask
+                    return nxt
+            else:
+                def op():
+                    raise Fault(pc, f"{name} is only used in interrupt handlers, which are not modelled")
+        else:
+            # the only CSRs are the counters, which are read-only
+            if not self.counters or imm not in COUNTER_CSRS or name not in ("csrrs", "csrrc", "csrrsi", "csrrci") or rs1:
+                def op():
+                    raise Fault(pc, f"{name} of CSR {imm:#x}")
+            else:
+                counter, shift = COUNTER_CSRS[imm]
+                def op():
+                    x[rd] = (getattr(self, counter) >> shift) & MASK
+                    return nxt
+
+        self.cache[pc] = op
+        self.code_low = min(self.code_low, pc)
+        return op
+
+    def run(self, instructions: int) -> Optional[str]:
+        """
+        Run up to ``instructions`` instructions. Returns why the firmware stopped, or ``None`` if it is still
+        running; a ``Fault`` propagates with the machine stopped at the faulting instruction.
+        """
+        cache, compile = self.cache, self.compile
+        pc = self.pc
+        start = self.instret
+        try:
+            # `instret` is kept up to date for the peripheral models
+            for instret in range(start, start + instructions):
+                self.instret = instret
+                op = cache.get(pc)
+                if op is None:
+                    op = compile(pc)
+                pc = op()
+            self.instret = start + instructions
+        except Halt as e:
+            return str(e)
+        finally:
+            self.pc = pc
+        return None
+
+def models_for(top) -> Dict[str, BankModel]:
+    """
+    Models for the CSR banks of ``top``, a ``Top``, with its NCO's model behind the sweep engine.
+    """
+    from nco import NCO, PipelinedNCO
+    from cordic import CordicNCO
+    from nco_model import NCOModel, PipelinedNCOModel
+    from cordic_model import CordicNCOModel
+
+    models = {}
+    for bank in top.csr.map.banks:
+        if bank.name == "irq":
+            continue
+        if bank.name == "chirp":
+            nco = top.nco
+            if isinstance(nco, CordicNCO):
+                nco_model = CordicNCOModel(width=nco.width, iterations=nco.iterations)
+            elif isinstance(nco, PipelinedNCO):
+                nco_model = PipelinedNCOModel(width=nco.width, samples=nco.samples, dither_bits=nco.dither_bits,
+                    interpolate=nco.interpolate)
+            elif isinstance(nco, NCO):
+                nco_model = NCOModel(width=nco.width, samples=nco.samples)
+            else:
+                nco_model = None
+            models[bank.name] = ChirpModel(bank, nco=nco_model)
+        elif bank.name in MODELS:
+            models[bank.name] = MODELS[bank.name](bank)
+
+    # the controller's sources, as `Top` connects them; the sweep engine never finishes a sweep here
+    for bank in top.csr.map.banks:
+        if bank.name == "irq":
+            uart = models.get("uart")
+            controller = InterruptControllerModel(bank, levels={"uart": lambda: uart.irq} if uart else {})
+            models[bank.name] = controller
+            if "timer" in models:
+                models["timer"].controller = controller
+    return models
+
+if __name__ == "__main__":
+    import argparse, time
+    from firmware import load_firmware
+    from top import Top
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--firmware", help="path to a prebuilt app.bin; otherwise the app is built with cargo")
+    parser.add_argument("--nco-channels", type=int, default=0)
+    parser.add_argument("--dsp-clk", type=float, metavar="MHZ", help="lay out the gateware with the NCO on the PLL")
+    parser.add_argument("--profile", action="store_true", help="lay out the CSRs with the profiler, and enable rdcycle")
+    parser.add_argument("--xip", action="store_true", help="link the firmware to run from the SPI flash")
+    p_action = parser.add_subparsers(dest="action")
+    p_run = p_action.add_parser("run", help="run the firmware and report what it did to the peripherals")
+    p_run.add_argument("--instructions", type=int, default=10_000_000, help="stop after this many")
+    p_run.add_argument("--trace", action="store_true", help="print every CSR access")
+    p_action.add_parser("check", help="run each register-immediate instruction and check its result")
+
+    args = parser.parse_args()
+    if args.action == "run":
+        from icache import InstructionCache
+        top = Top(firmware=args.firmware, nco_channels=args.nco_channels, dsp_clk_mhz=args.dsp_clk,
+            profile=args.profile, cache_dir=None, xip=InstructionCache() if args.xip else None)
+        cpu = top.picorv32
+        image = load_firmware(image=cpu.firmware, sources=cpu.firmware_sources)
+        machine = Machine(image, top.csr.map, models_for(top), counters=cpu.counters,
+            interrupts=cpu.irq is not None, trace=args.trace, image_base=cpu.progaddr_reset)
+
+        start = time.perf_counter()
+        try:
+            reason = machine.run(args.instructions)
+        except Fault as e:
+            reason = f"fault: {e}"
+        elapsed = time.perf_counter() - start
+
+        for access in machine.accesses:
+            print(f"{access.instret:>10}  {access.pc:#010x}  {access.op}  {access.register:<24} {access.value:#010x}")
+        print(f"{machine.instret} instructions in {elapsed:.2f} s ({machine.instret / max(elapsed, 1e-9) / 1e6:.2f} MIPS), "
+            f"{len(machine.cache)} decoded, {machine.time / 16e6:.3f} s of firmware time at 16 MHz; "
+            + (reason or "still running"))
+        for (op, name), count in sorted(machine.counts.items(), key=lambda item: item[0][1]):
+            print(f"  {op}  {name:<24} {count:>8}")
+
+        models = machine.models
+        if isinstance(models.get("led"), LEDModel):
+            print(f"led: {'on' if models['led'].on else 'off'}, {len(models['led'].history)} changes")
+        if isinstance(models.get("timer"), TimerModel):
+            print(f"timer: {models['timer'].events} events")
+        if isinstance(models.get("nco"), NCOControlModel):
+            print(f"nco: {'enabled' if models['nco'].enabled else 'disabled'}")
+        if isinstance(models.get("chirp"), ChirpModel):
+            chirp = models["chirp"]
+            print(f"chirp: phase step {chirp.phase_step:#010x} ({chirp.frequency(top.nco_clk_freq):.1f} Hz at "
+                f"{top.nco_clk_freq / 1e6:g} MHz)")
+        if isinstance(models.get("uart"), UARTModel):
+            print(f"uart: {bytes(models['uart'].tx)!r}")
+    elif args.action == "check":
+        def i_type(funct3, rd, rs1, imm):
+            return (imm & 0xfff) << 20 | rs1 << 15 | funct3 << 12 | rd << 7 | 0x13
+        def shift(funct3, funct7, rd, rs1, shamt):
+            return funct7 << 25 | shamt << 20 | rs1 << 15 | funct3 << 12 | rd << 7 | 0x13
+        EBREAK = 0x0010_0073
+
+        # (instruction, its destination register, the value expected there); x1 = -5 and x2 = 7
+        cases = [
+            (i_type(2, 3, 1, 1), 3, 1),                    # slti -5 < 1
+            (i_type(2, 4, 2, -1), 4, 0),                   # slti 7 < -1
+            (i_type(3, 5, 1, 1), 5, 0),                    # sltiu 0xfffffffb < 1
+            (i_type(3, 6, 0, 1), 6, 1),                    # sltiu, as in `seqz`
+            (i_type(3, 7, 2, -1), 7, 1),                   # sltiu 7 < 0xffffffff
+            (i_type(4, 8, 1, -1), 8, 4),                   # xori, as in `not`
+            (i_type(6, 9, 2, 0x70), 9, 0x77),              # ori
+            (i_type(7, 10, 1, 0xff), 10, 0xfb),            # andi
+            (i_type(0, 11, 1, -2047), 11, 0xffff_f7fc),    # addi
+            (shift(1, 0x00, 12, 2, 29), 12, 0xe000_0000),  # slli
+            (shift(5, 0x00, 13, 1, 28), 13, 0xf),          # srli
+            (shift(5, 0x20, 14, 1, 1), 14, 0xffff_fffd),   # srai
+        ]
+        program = [i_type(0, 1, 0, -5), i_type(0, 2, 0, 7)] + [insn for insn, _, _ in cases] + [EBREAK]
+        machine = Machine(program, CSRMap([]))
+        reason = machine.run(len(program) + 1)
+        assert reason is not None, "the program did not reach its ebreak"
+        for insn, rd, expected in cases:
+            assert machine.x[rd] == expected, f"{insn:#010x}: x{rd} = {machine.x[rd]:#x}, expected {expected:#x}"
+        print(f"{len(cases)} register-immediate instructions give the expected results")
+    else:
+        parser.print_usage()
@@ -4,11 +4,13 @@ import math
 def trunc_add(signal, n):
     return (signal + n)[:len(signal)]
 
+def quarter_sine(out_width: int, samples: int, offset: float = 0):
+    M = 1 << (out_width - 1)
+    return [int(M * math.sin((math.pi / 2) * ((i + offset)/samples))) for i in range(samples)]
+
 class SinCosLookup(Elaboratable):
     def __init__(self, out_width: int, samples: int):
-        M = 1 << (out_width - 1)
-
-        amplitudes = [int(M * math.sin((math.pi / 2) * (i/samples))) for i in range(samples)]
+        amplitudes = quarter_sine(out_width, samples)
 
         self.quarter_sin_mem = Memory(
             width=(out_width - 1),
@@ -70,23 +72,265 @@ class NCO(Elaboratable):
     def calculate_phase_step(clk_frequency: float, frequency: float):
         return int(round((2 ** 32) * frequency / clk_frequency))
 
+LFSR_WIDTH = 17
+LFSR_TAPS = 0x12000 # x^17 + x^14 + 1, Galois form
+
+class PipelinedNCOParameters:
+    """
+    What ``PipelinedNCO`` derives from its parameters: the widths of its phase fields, the interpolator's
+    constant, its latency and its table. ``PipelinedNCOModel`` uses them without building the gateware.
+    """
+    def __init__(self, width: int, samples: int, dither_bits: int = 0, interpolate: bool = False):
+        self.width = width
+        self.samples = samples
+        self.dither_bits = dither_bits
+        self.interpolate = interpolate
+
+        self.addr_width = (samples * 4 - 1).bit_length()
+        self.frac_width = 32 - self.addr_width
+        assert dither_bits <= min(self.frac_width, LFSR_WIDTH)
+        self.interp_bits = min(self.frac_width, width)
+        self.k_bits = width + self.addr_width
+        self.k = int(round((math.pi / 2) / samples * 2 ** self.k_bits))
+
+        self.latency = 6 if interpolate else 4
+        self.table = quarter_sine(width, samples, offset=0.5)
+
+class PipelinedNCO(PipelinedNCOParameters, Elaboratable):
+    """
+    Drop-in replacement for ``NCO`` with every step between the phase accumulator and the outputs registered,
+    so the table address, BRAM read and sign inversion each get a clock cycle of their own.
+
+    The quarter-wave table is sampled half a step off the grid, which makes the mirrored quadrants exactly
+    symmetric. ``dither_bits`` adds that many bits of LFSR noise just below the table address to break up
+    the phase truncation spurs. With ``interpolate``, sin/cos are corrected to the fractional phase between
+    table entries (``sin(x + d) ~ sin(x) + d cos(x)``), using the other output as the derivative so no extra
+    table reads are needed; a smaller table then reaches the same SFDR.
+
+    Parameters
+    ----------
+    width : int
+        Output width.
+    samples : int
+        Depth of the quarter-wave table.
+    dither_bits : int
+        Width of the phase dither, 0 to disable.
+    interpolate : bool
+        Add the two-stage linear interpolator.
+
+    Attributes
+    ----------
+    latency : int
+        Clock cycles from the phase accumulator to ``sin``/``cos``: 4, or 6 with ``interpolate``.
+        A write to ``phase_step`` reaches the accumulator one cycle later.
+    """
+    def __init__(self, width: int, samples: int, dither_bits: int = 0, interpolate: bool = False):
+        super().__init__(width, samples, dither_bits=dither_bits, interpolate=interpolate)
+
+        self.quarter_sin_mem = Memory(
+            width=(width - 1),
+            depth=samples,
+            init=self.table,
+        )
+
+        self.enable = Signal()
+        self.sin = Signal(width)
+        self.cos = Signal(width)
+        self.phase_step = Signal(32)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        phase_acc = Signal(32)
+        # with m.If(self.enable):
+        m.d.sync += phase_acc.eq(phase_acc + self.phase_step)
+
+        # stage 1: dither
+        phase = Signal(32)
+        if self.dither_bits:
+            lfsr = Signal(LFSR_WIDTH, reset=1)
+            m.d.sync += lfsr.eq(Mux(lfsr[0], (lfsr >> 1) ^ LFSR_TAPS, lfsr >> 1))
+            m.d.sync += phase.eq(phase_acc + (lfsr[:self.dither_bits] << (self.frac_width - self.dither_bits)))
+        else:
+            m.d.sync += phase.eq(phase_acc)
+
+        # stage 2: table address and quadrant
+        addr = phase[-self.addr_width:]
+        cos_addr = trunc_add(addr, self.samples)
+        sin_index = Signal(range(self.samples))
+        cos_index = Signal(range(self.samples))
+        sin_neg = Signal()
+        cos_neg = Signal()
+        frac = Signal(self.interp_bits)
+        m.d.sync += [
+            sin_index.eq(Mux(addr[-2], ~addr[:-2], addr[:-2])),
+            cos_index.eq(Mux(cos_addr[-2], ~cos_addr[:-2], cos_addr[:-2])),
+            sin_neg.eq(addr[-1]),
+            cos_neg.eq(cos_addr[-1]),
+            frac.eq(phase[self.frac_width - self.interp_bits:self.frac_width]),
+        ]
+
+        # stage 3: table read
+        m.submodules.sin_rdport = sin_rdport = self.quarter_sin_mem.read_port(transparent=False)
+        m.submodules.cos_rdport = cos_rdport = self.quarter_sin_mem.read_port(transparent=False)
+        sin_neg_3 = Signal()
+        cos_neg_3 = Signal()
+        frac_3 = Signal(self.interp_bits)
+        m.d.comb += [
+            sin_rdport.addr.eq(sin_index),
+            cos_rdport.addr.eq(cos_index),
+        ]
+        m.d.sync += [
+            sin_neg_3.eq(sin_neg),
+            cos_neg_3.eq(cos_neg),
+            frac_3.eq(frac),
+        ]
+
+        # stage 4: sign, as two's complement
+        sin_4 = Signal(signed(self.width))
+        cos_4 = Signal(signed(self.width))
+        m.d.sync += [
+            sin_4.eq(Mux(sin_neg_3, Cat(~sin_rdport.data, 1), Cat(sin_rdport.data, 0))),
+            cos_4.eq(Mux(cos_neg_3, Cat(~cos_rdport.data, 1), Cat(cos_rdport.data, 0))),
+        ]
+
+        if self.interpolate:
+            # offset of the phase from the middle of the table step, in units of the step
+            offset = Cat(frac_3[:-1], ~frac_3[-1]).as_signed()
+            offset_4 = Signal(signed(self.interp_bits + self.k.bit_length() + 1))
+            m.d.sync += offset_4.eq(offset * self.k)
+
+            # stage 5: derivative terms
+            sin_5 = Signal.like(sin_4)
+            cos_5 = Signal.like(cos_4)
+            sin_delta = Signal(signed(self.width + len(offset_4) + 1))
+            cos_delta = Signal(signed(self.width + len(offset_4) + 1))
+            m.d.sync += [
+                sin_5.eq(sin_4),
+                cos_5.eq(cos_4),
+                sin_delta.eq(cos_4 * offset_4),
+                cos_delta.eq(-(sin_4 * offset_4)),
+            ]
+
+            # stage 6: correct and saturate
+            def saturate(value):
+                hi, lo = (1 << (self.width - 1)) - 1, -(1 << (self.width - 1))
+                return Mux(value > hi, hi, Mux(value < lo, lo, value))
+
+            shift = self.interp_bits + self.k_bits
+            sin_out = Signal(signed(self.width))
+            cos_out = Signal(signed(self.width))
+            m.d.sync += [
+                sin_out.eq(saturate(sin_5 + (sin_delta >> shift))),
+                cos_out.eq(saturate(cos_5 + (cos_delta >> shift))),
+            ]
+        else:
+            sin_out, cos_out = sin_4, cos_4
+
+        # back to offset binary, like `NCO`
+        m.d.comb += [
+            self.sin.eq(Cat(sin_out[:-1], ~sin_out[-1])),
+            self.cos.eq(Cat(cos_out[:-1], ~cos_out[-1])),
+        ]
+
+        return m
+
 
 if __name__ == "__main__":
     # from nmigen_boards.tinyfpga_bx import TinyFPGABXPlatform
     # platform = TinyFPGABXPlatform()
     # products = platform.build(Top(), do_program=True)
-    
-    from nmigen.sim import Simulator, Tick
 
-    dut = NCO(width=8, samples=1024)
-    sim = Simulator(dut)
-    sim.add_clock(1 / 1e6)
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    p_action = parser.add_subparsers(dest="action")
+    p_action.add_parser("simulate")
+    p_check = p_action.add_parser("check", help="compare the HDL against the NumPy model in nco_model.py")
+    p_check.add_argument("--width", type=int, default=12)
+    p_check.add_argument("--samples", type=int, default=1024)
+    p_check.add_argument("--cycles", type=int, default=2000, help="length of the simulated window")
+    p_check.add_argument("--skip", type=int, default=1_000_000, help="model-only cycles run before the window")
+    p_check.add_argument("--seed", type=int, default=0)
+    p_check.add_argument("--pipelined", action="store_true", help="check PipelinedNCO instead of NCO")
+    p_check.add_argument("--dither-bits", type=int, default=0)
+    p_check.add_argument("--interpolate", action="store_true")
+    p_check.add_argument("--cordic", action="store_true", help="check CordicNCO instead of NCO")
+    p_check.add_argument("--iterations", type=int, help="CORDIC iterations, width + 1 by default")
+
+    args = parser.parse_args()
+    if args.action == "simulate":
+        from nmigen.sim import Simulator, Tick
+
+        dut = NCO(width=8, samples=1024)
+        sim = Simulator(dut)
+        sim.add_clock(1 / 1e6)
+
+        def proc():
+            yield dut.phase_step.eq(NCO.calculate_phase_step(clk_frequency=1e6, frequency=440))
+            for i in range(3000):
+                yield Tick()
+
+        sim.add_process(proc)
+        with sim.write_vcd("dds.vcd"):
+            sim.run()
 
-    def proc():
-        yield dut.phase_step.eq(NCO.calculate_phase_step(clk_frequency=1e6, frequency=440))
-        for i in range(3000):
-            yield Tick()
+    if args.action == "check":
+        import numpy as np
+        from nmigen.sim import Simulator, Settle
+        from nco_model import NCOModel, PipelinedNCOModel
 
-    sim.add_process(proc)
-    with sim.write_vcd("dds.vcd"):
+        if args.cordic:
+            from cordic import CordicNCO
+            from cordic_model import CordicNCOModel
+            def make_model():
+                return CordicNCOModel(width=args.width, iterations=args.iterations)
+            dut = CordicNCO(width=args.width, iterations=args.iterations)
+        elif args.pipelined:
+            def make_model():
+                return PipelinedNCOModel(width=args.width, samples=args.samples,
+                    dither_bits=args.dither_bits, interpolate=args.interpolate)
+            dut = PipelinedNCO(width=args.width, samples=args.samples,
+                dither_bits=args.dither_bits, interpolate=args.interpolate)
+        else:
+            def make_model():
+                return NCOModel(width=args.width, samples=args.samples)
+            dut = NCO(width=args.width, samples=args.samples)
+
+        rng = np.random.default_rng(args.seed)
+
+        # a long model-only run lands the window at an arbitrary accumulator phase
+        skip_model = make_model()
+        skip_model.run(rng.integers(0, 1 << 32, dtype=np.uint64), n=args.skip)
+        start_phase = skip_model.phase_acc
+
+        # hold each random step for a random number of cycles, including wraparound-sized steps
+        steps = np.repeat(
+            rng.integers(0, 1 << 32, size=args.cycles, dtype=np.uint64),
+            rng.integers(1, 64, size=args.cycles),
+        )[:args.cycles]
+
+        # mirror what the simulation below does before the window: sync processes start after one
+        # clock edge (with `phase_step` still 0), then a one-cycle jump to the window start
+        model = make_model()
+        model.run(np.array([0, start_phase], dtype=np.uint64))
+        expected_sin, expected_cos = model.run(steps)
+
+        sim = Simulator(dut)
+        sim.add_clock(1e-6)
+
+        def proc():
+            # the accumulator is internal, so jump it to the window start with a one-cycle step
+            yield dut.phase_step.eq(start_phase)
+            yield
+            for i, (step, sin, cos) in enumerate(zip(steps, expected_sin, expected_cos)):
+                yield dut.phase_step.eq(int(step))
+                yield
+                yield Settle()
+                got = (yield dut.sin), (yield dut.cos)
+                assert got == (sin, cos), f"cycle {i}: HDL {got}, model {(sin, cos)}"
+        sim.add_sync_process(proc)
         sim.run()
+
+        params = f"iterations={dut.iterations}" if args.cordic else f"samples={args.samples}"
+        print(f"{type(dut).__name__}(width={args.width}, {params}) matches the model for {args.cycles} cycles")
@@ -0,0 +1,215 @@
+from nmigen import Elaboratable, Module, Signal, Memory, Array, Mux, Cat, signed
+
+from csr import Bank, Register
+from nco import quarter_sine
+
+# Many NCO channels sharing one quarter-wave table.
+#
+# `NCO` gives every generator its own table with two read ports, which Yosys maps to two copies of the table
+# in block RAM. `NCOBank` instead steps through its channels one per clock cycle and runs them all through a
+# single pipeline and a single read port, so N channels cost one table; each channel is updated once every N
+# cycles, at the clock frequency divided by N.
+
+AMPLITUDE_BITS = 16
+
+class NCOBank(Elaboratable):
+    """
+    ``channels`` phase accumulators, each with its own ``phase_step``, ``phase_offset`` and ``amplitude``,
+    time-multiplexed over one table of ``samples`` quarter-wave entries.
+
+    ``outputs[i]`` is channel ``i``'s sine and ``mix`` the sum of all channels divided by the next power of
+    two of ``channels``, in offset binary like ``NCO``. They are all updated together, on the cycle
+    ``strobe`` is high, once every ``channels`` cycles. ``amplitude`` scales a channel by ``amplitude /
+    2**16``, and ``phase_offset`` is added to its accumulator before the table lookup. The accumulators only
+    advance while ``enable`` is set, which is sampled once a frame so that all channels start and stop on the
+    same frame and keep their relative phases.
+
+    The table is sampled half a step off the grid like ``PipelinedNCO``'s, and a channel's output follows its
+    accumulator by ``latency`` cycles.
+    """
+    latency = 4
+
+    def __init__(self, channels: int, width: int = 12, samples: int = 1024):
+        assert channels >= 1
+        assert samples & (samples - 1) == 0, "the table depth must be a power of two"
+        self.channels = channels
+        self.width = width
+        self.samples = samples
+        self.addr_width = (samples * 4 - 1).bit_length()
+        self.mix_shift = (channels - 1).bit_length()
+
+        self.quarter_sin_mem = Memory(width=width - 1, depth=samples, init=quarter_sine(width, samples, offset=0.5))
+
+        self.enable = Signal()
+        self.phase_step = [Signal(32, name=f"phase_step{i}") for i in range(channels)]
+        self.phase_offset = [Signal(32, name=f"phase_offset{i}") for i in range(channels)]
+        self.amplitude = [Signal(AMPLITUDE_BITS, name=f"amplitude{i}", reset=(1 << AMPLITUDE_BITS) - 1)
+            for i in range(channels)]
+        self.outputs = [Signal(width, name=f"out{i}", reset=1 << (width - 1)) for i in range(channels)]
+        self.mix = Signal(width, reset=1 << (width - 1))
+        self.strobe = Signal()
+
+    def calculate_phase_step(self, clk_frequency: float, frequency: float) -> int:
+        # each channel is stepped once every `channels` cycles
+        return int(round((2 ** 32) * frequency * self.channels / clk_frequency))
+
+    def csr_bank(self, name: str = "nco_bank") -> Bank:
+        """
+        ``enable`` followed by each channel's ``phase_step``, ``phase_offset`` and ``amplitude``, so channel ``i``'s
+        registers are ``12 * i`` bytes after channel 0's.
+        """
+        registers = [Register("enable", self.enable)]
+        for i in range(self.channels):
+            registers += [
+                Register(f"ch{i}_phase_step", self.phase_step[i]),
+                Register(f"ch{i}_phase_offset", self.phase_offset[i]),
+                Register(f"ch{i}_amplitude", self.amplitude[i], desc="Full scale is 0xffff."),
+            ]
+        return Bank(name, registers, desc=f"{self.channels} NCO channels sharing one sine table.")
+
+    def elaborate(self, platform):
+        m = Module()
+        n = self.channels
+
+        slot = Signal(range(n))
+        running = Signal()
+        m.d.sync += slot.eq(Mux(slot == n - 1, 0, slot + 1))
+        with m.If(slot == n - 1):
+            m.d.sync += running.eq(self.enable)
+
+        # stage 1: step the channel's accumulator, look up its phase
+        accumulators = Array(Signal(32, name=f"phase_acc{i}") for i in range(n))
+        acc = accumulators[slot]
+        with m.If(running):
+            m.d.sync += acc.eq(acc + Array(self.phase_step)[slot])
+        phase = Signal(32)
+        m.d.comb += phase.eq(acc + Array(self.phase_offset)[slot])
+
+        addr = phase[-self.addr_width:]
+        index_1 = Signal(range(self.samples))
+        neg_1 = Signal()
+        amplitude_1 = Signal(AMPLITUDE_BITS)
+        channel_1 = Signal.like(slot)
+        # the pipeline is empty after reset
+        valid_1 = Signal()
+        m.d.sync += [
+            valid_1.eq(1),
+            index_1.eq(Mux(addr[-2], ~addr[:-2], addr[:-2])),
+            neg_1.eq(addr[-1]),
+            amplitude_1.eq(Array(self.amplitude)[slot]),
+            channel_1.eq(slot),
+        ]
+
+        # stage 2: table read
+        m.submodules.rdport = rdport = self.quarter_sin_mem.read_port(transparent=False)
+        m.d.comb += rdport.addr.eq(index_1)
+        neg_2 = Signal()
+        amplitude_2 = Signal.like(amplitude_1)
+        channel_2 = Signal.like(slot)
+        valid_2 = Signal()
+        m.d.sync += [
+            valid_2.eq(valid_1),
+            neg_2.eq(neg_1),
+            amplitude_2.eq(amplitude_1),
+            channel_2.eq(channel_1),
+        ]
+
+        # stage 3: sign and amplitude
+        sample = Signal(signed(self.width))
+        m.d.comb += sample.eq(Mux(neg_2, Cat(~rdport.data, 1), Cat(rdport.data, 0)))
+        product_3 = Signal(signed(self.width + AMPLITUDE_BITS + 1))
+        channel_3 = Signal.like(slot)
+        valid_3 = Signal()
+        m.d.sync += [
+            valid_3.eq(valid_2),
+            product_3.eq(sample * amplitude_2),
+            channel_3.eq(channel_2),
+        ]
+
+        # stage 4: outputs, and the mix summed over the frame
+        scaled = Signal(signed(self.width))
+        m.d.comb += scaled.eq(product_3 >> AMPLITUDE_BITS)
+        mix_acc = Signal(signed(self.width + self.mix_shift))
+        total = Signal.like(mix_acc)
+        m.d.comb += total.eq(mix_acc + scaled)
+
+        def offset_binary(value):
+            return Cat(value[:-1], ~value[-1])
+
+        with m.Switch(channel_3):
+            for i, out in enumerate(self.outputs):
+                with m.Case(i):
+                    m.d.sync += out.eq(offset_binary(scaled))
+        last = valid_3 & (channel_3 == n - 1)
+        m.d.sync += [
+            self.strobe.eq(last),
+            mix_acc.eq(Mux(last, 0, total)),
+        ]
+        with m.If(last):
+            m.d.sync += self.mix.eq(offset_binary(total[self.mix_shift:]))
+
+        return m
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    p_action = parser.add_subparsers(dest="action")
+    p_check = p_action.add_parser("check", help="compare the HDL against NCOBankModel in nco_model.py")
+    p_check.add_argument("--channels", type=int, default=5)
+    p_check.add_argument("--width", type=int, default=12)
+    p_check.add_argument("--samples", type=int, default=256)
+    p_check.add_argument("--frames", type=int, default=400)
+    p_check.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.action == "check":
+        import numpy as np
+        from nmigen.sim import Simulator
+        from nco_model import NCOBankModel
+
+        rng = np.random.default_rng(args.seed)
+        steps = [int(x) for x in rng.integers(0, 1 << 32, size=args.channels)]
+        offsets = [int(x) for x in rng.integers(0, 1 << 32, size=args.channels)]
+        amplitudes = [int(x) for x in rng.integers(0, 1 << AMPLITUDE_BITS, size=args.channels)]
+        amplitudes[0] = (1 << AMPLITUDE_BITS) - 1
+
+        dut = NCOBank(channels=args.channels, width=args.width, samples=args.samples)
+        model = NCOBankModel(channels=args.channels, width=args.width, samples=args.samples)
+        expected, expected_mix = model.run(steps, offsets, amplitudes, frames=args.frames)
+
+        # the registers hold their values from reset, so the accumulators start with the second frame
+        m = Module()
+        m.submodules.dut = dut
+        for i in range(args.channels):
+            m.d.comb += [
+                dut.phase_step[i].eq(steps[i]),
+                dut.phase_offset[i].eq(offsets[i]),
+                dut.amplitude[i].eq(amplitudes[i]),
+            ]
+        m.d.comb += dut.enable.eq(1)
+
+        sim = Simulator(m)
+        sim.add_clock(1e-6)
+
+        def proc():
+            frame = -1
+            while frame < args.frames:
+                yield
+                if not (yield dut.strobe):
+                    continue
+                if frame >= 0:
+                    got = []
+                    for out in dut.outputs:
+                        got.append((yield out))
+                    mix = yield dut.mix
+                    assert got == list(expected[frame]), f"frame {frame}: HDL {got}, model {list(expected[frame])}"
+                    assert mix == expected_mix[frame], f"frame {frame}: HDL mix {mix}, model {expected_mix[frame]}"
+                frame += 1
+        sim.add_sync_process(proc)
+        sim.run()
+
+        print(f"NCOBank(channels={args.channels}, width={args.width}, samples={args.samples}) matches the model "
+            f"for {args.frames} frames")
+    else:
+        parser.print_usage()
@@ -0,0 +1,249 @@
+from typing import Tuple, Union
+import numpy as np
+
+from nco import quarter_sine, PipelinedNCOParameters, LFSR_WIDTH, LFSR_TAPS
+from nco_bank import AMPLITUDE_BITS
+
+PHASE_BITS = 32
+
+class SinCosLookupModel:
+    """
+    Bit-exact NumPy model of ``SinCosLookup``.
+
+    The quarter-wave table is read through synchronous read ports, so the table data lags the
+    address by one clock while the quadrant sign (``addr[-1]``) is taken combinationally from the
+    current address. ``lookup`` reproduces that skew given the address one cycle earlier.
+    """
+
+    def __init__(self, out_width: int, samples: int):
+        if samples & (samples - 1):
+            raise ValueError("the model only covers power-of-two table depths")
+
+        self.out_width = out_width
+        self.samples = samples
+        self.addr_width = (samples * 4 - 1).bit_length()
+        self.table = np.array(quarter_sine(out_width, samples), dtype=np.int64) & ((1 << (out_width - 1)) - 1)
+
+    def table_index(self, addr: np.ndarray) -> np.ndarray:
+        # Mux(addr[-2], ~addr[:-2], addr[:-2])
+        low_mask = (1 << (self.addr_width - 2)) - 1
+        low = addr & low_mask
+        mirrored = (addr >> (self.addr_width - 2)) & 1
+        return np.where(mirrored, ~low & low_mask, low)
+
+    def output(self, addr: np.ndarray, data: np.ndarray) -> np.ndarray:
+        # Mux(addr[-1], Cat(~data, 0), Cat(data, 1))
+        data_mask = (1 << (self.out_width - 1)) - 1
+        negative = (addr >> (self.addr_width - 1)) & 1
+        return np.where(negative, ~data & data_mask, data | (1 << (self.out_width - 1)))
+
+    def cos_addr(self, addr: np.ndarray) -> np.ndarray:
+        return (addr + self.samples) & ((1 << self.addr_width) - 1)
+
+    def lookup(self, addr: np.ndarray, prev_addr: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return ``(sin, cos)`` for the cycles where ``addr`` is on the lookup input and ``prev_addr``
+        was on it one clock earlier.
+        """
+        sin_data = self.table[self.table_index(prev_addr)]
+        cos_data = self.table[self.table_index(self.cos_addr(prev_addr))]
+        return self.output(addr, sin_data), self.output(self.cos_addr(addr), cos_data)
+
+class NCOModel:
+    """
+    Bit-exact NumPy model of ``NCO``.
+
+    ``run`` advances the model by one clock per ``phase_step`` entry and returns the ``sin``/``cos``
+    outputs seen during each of those cycles, i.e. exactly what a simulation reads after each tick
+    that follows a ``phase_step`` write. State is kept between calls so long runs can be chunked.
+    """
+
+    def __init__(self, width: int, samples: int):
+        self.width = width
+        self.samples = samples
+        self.lookup = SinCosLookupModel(out_width=width, samples=samples)
+        self.reset()
+
+    def reset(self):
+        self.phase_acc = 0
+
+    def addr(self, phase_acc: np.ndarray) -> np.ndarray:
+        return phase_acc >> (PHASE_BITS - self.lookup.addr_width)
+
+    def run(self, phase_step: Union[int, np.ndarray], n: Union[None, int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Run for ``n`` cycles with a constant ``phase_step``, or for ``len(phase_step)`` cycles with a
+        per-cycle ``phase_step`` sequence.
+        """
+        steps = np.asarray(phase_step, dtype=np.uint64)
+        if steps.ndim == 0:
+            steps = np.full(n, steps, dtype=np.uint64)
+        mask = np.uint64((1 << PHASE_BITS) - 1)
+        steps = steps & mask
+        if len(steps) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        # phase_acc after each tick; the 32-bit wraparound falls out of the mask since 2**32 divides 2**64
+        acc = (np.uint64(self.phase_acc) + np.cumsum(steps, dtype=np.uint64)) & mask
+        addr = self.addr(acc).astype(np.int64)
+
+        # the read ports latch the address that was on the lookup input before each tick
+        prev_addr = np.empty_like(addr)
+        prev_addr[0] = self.addr(np.uint64(self.phase_acc))
+        prev_addr[1:] = addr[:-1]
+
+        sin, cos = self.lookup.lookup(addr, prev_addr)
+
+        if len(acc):
+            self.phase_acc = int(acc[-1])
+        return sin, cos
+
+class NCOBankModel:
+    """
+    Bit-exact NumPy model of ``NCOBank`` with fixed registers.
+
+    ``run`` returns what the bank outputs on each ``strobe`` from the first frame its accumulators run in: the
+    channel outputs as a ``(frames, channels)`` array and the mix.
+    """
+
+    def __init__(self, channels: int, width: int, samples: int):
+        if samples & (samples - 1):
+            raise ValueError("the model only covers power-of-two table depths")
+
+        self.channels = channels
+        self.width = width
+        self.samples = samples
+        self.addr_width = (samples * 4 - 1).bit_length()
+        self.mix_shift = (channels - 1).bit_length()
+        self.table = np.array(quarter_sine(width, samples, offset=0.5), dtype=np.int64)
+
+    def run(self, phase_step, phase_offset, amplitude, frames: int) -> Tuple[np.ndarray, np.ndarray]:
+        mask = np.uint64((1 << PHASE_BITS) - 1)
+        k = np.arange(frames, dtype=np.uint64)[:, None]
+        steps = np.asarray(phase_step, dtype=np.uint64)[None, :]
+        offsets = np.asarray(phase_offset, dtype=np.uint64)[None, :]
+        phase = (k * steps + offsets) & mask
+        addr = (phase >> np.uint64(PHASE_BITS - self.addr_width)).astype(np.int64)
+
+        low_mask = self.samples - 1
+        low = addr & low_mask
+        index = np.where((addr >> (self.addr_width - 2)) & 1, ~low & low_mask, low)
+        negative = (addr >> (self.addr_width - 1)) & 1
+        # Cat(~data, 1) is -data - 1 in two's complement
+        sample = np.where(negative, -self.table[index] - 1, self.table[index])
+        scaled = (sample * np.asarray(amplitude, dtype=np.int64)[None, :]) >> AMPLITUDE_BITS
+
+        half = 1 << (self.width - 1)
+        outputs = (scaled + half) & ((1 << self.width) - 1)
+        mix = ((scaled.sum(axis=1) >> self.mix_shift) + half) & ((1 << self.width) - 1)
+        return outputs, mix
+
+def lfsr_sequence() -> np.ndarray:
+    """
+    One full period of the dither LFSR in ``PipelinedNCO``, starting from its reset value.
+    """
+    state = 1
+    sequence = np.empty((1 << LFSR_WIDTH) - 1, dtype=np.uint64)
+    for i in range(len(sequence)):
+        sequence[i] = state
+        state = (state >> 1) ^ (LFSR_TAPS if state & 1 else 0)
+    return sequence
+
+class PipelinedNCOModel:
+    """
+    Bit-exact NumPy model of ``PipelinedNCO``, with the same ``run`` contract as ``NCOModel``.
+
+    Every pipeline register is modelled as a one-cycle shift of its input with the register's reset value
+    in front, so the start-up transient and the ``latency`` cycles of delay come out exactly as in the HDL.
+    """
+
+    def __init__(self, width: int, samples: int, dither_bits: int = 0, interpolate: bool = False):
+        if samples & (samples - 1):
+            raise ValueError("the model only covers power-of-two table depths")
+
+        self.params = PipelinedNCOParameters(width=width, samples=samples, dither_bits=dither_bits,
+            interpolate=interpolate)
+        self.table = np.array(self.params.table, dtype=np.int64)
+        self.lfsr = lfsr_sequence() if dither_bits else None
+        self.reset()
+
+    @property
+    def phase_acc(self):
+        return int(self.regs['phase_acc'])
+
+    def reset(self):
+        self.cycles = 0
+        self.regs = {}
+
+    def _register(self, name: str, d: np.ndarray) -> np.ndarray:
+        # values of a register at times 0..N, given its input at times 0..N-1
+        q = np.concatenate(([self.regs.get(name, 0)], d)).astype(np.int64)
+        self.regs[name] = q[-1]
+        return q
+
+    def run(self, phase_step: Union[int, np.ndarray], n: Union[None, int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        p = self.params
+        steps = np.asarray(phase_step, dtype=np.uint64)
+        if steps.ndim == 0:
+            steps = np.full(n, steps, dtype=np.uint64)
+        steps = (steps & np.uint64((1 << PHASE_BITS) - 1)).astype(np.int64)
+        mask = (1 << PHASE_BITS) - 1
+        if len(steps) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        phase_acc = (self.regs.get('phase_acc', 0) + np.concatenate(([0], np.cumsum(steps)))) & mask
+        self.regs['phase_acc'] = phase_acc[-1]
+
+        # stage 1
+        if p.dither_bits:
+            lfsr = self.lfsr[(self.cycles + np.arange(len(steps))) % len(self.lfsr)].astype(np.int64)
+            dither = (lfsr & ((1 << p.dither_bits) - 1)) << (p.frac_width - p.dither_bits)
+        else:
+            dither = 0
+        self.cycles += len(steps)
+        phase = self._register('phase', (phase_acc[:-1] + dither) & mask)
+
+        # stage 2
+        addr = phase[:-1] >> p.frac_width
+        cos_addr = (addr + p.samples) & ((1 << p.addr_width) - 1)
+        def index(addr):
+            low_mask = (1 << (p.addr_width - 2)) - 1
+            return np.where((addr >> (p.addr_width - 2)) & 1, ~addr & low_mask, addr & low_mask)
+        sin_index = self._register('sin_index', index(addr))
+        cos_index = self._register('cos_index', index(cos_addr))
+        sin_neg = self._register('sin_neg', addr >> (p.addr_width - 1))
+        cos_neg = self._register('cos_neg', cos_addr >> (p.addr_width - 1))
+        frac = self._register('frac', (phase[:-1] >> (p.frac_width - p.interp_bits)) & ((1 << p.interp_bits) - 1))
+
+        # stage 3
+        sin_data = self._register('sin_data', self.table[sin_index[:-1]])
+        cos_data = self._register('cos_data', self.table[cos_index[:-1]])
+        sin_neg_3 = self._register('sin_neg_3', sin_neg[:-1])
+        cos_neg_3 = self._register('cos_neg_3', cos_neg[:-1])
+        frac_3 = self._register('frac_3', frac[:-1])
+
+        # stage 4
+        sin_4 = self._register('sin_4', np.where(sin_neg_3[:-1], -sin_data[:-1] - 1, sin_data[:-1]))
+        cos_4 = self._register('cos_4', np.where(cos_neg_3[:-1], -cos_data[:-1] - 1, cos_data[:-1]))
+
+        if p.interpolate:
+            offset = frac_3[:-1] - (1 << (p.interp_bits - 1))
+            offset_4 = self._register('offset_4', offset * p.k)
+
+            # stage 5
+            sin_5 = self._register('sin_5', sin_4[:-1])
+            cos_5 = self._register('cos_5', cos_4[:-1])
+            sin_delta = self._register('sin_delta', cos_4[:-1] * offset_4[:-1])
+            cos_delta = self._register('cos_delta', -(sin_4[:-1] * offset_4[:-1]))
+
+            # stage 6
+            shift = p.interp_bits + p.k_bits
+            hi, lo = (1 << (p.width - 1)) - 1, -(1 << (p.width - 1))
+            sin_out = self._register('sin_out', np.clip(sin_5[:-1] + (sin_delta[:-1] >> shift), lo, hi))
+            cos_out = self._register('cos_out', np.clip(cos_5[:-1] + (cos_delta[:-1] >> shift), lo, hi))
+        else:
+            sin_out, cos_out = sin_4, cos_4
+
+        # values after each tick, back in offset binary
+        half = 1 << (p.width - 1)
+        return sin_out[1:] + half, cos_out[1:] + half
@@ -1,27 +1,30 @@
+import argparse
 import matplotlib.pyplot as plt
-import sys
-from vcdvcd import VCDVCD
-from bitstring import BitArray
+from vcd_reader import read_vcd, resample, envelope
 
-vcd = VCDVCD(sys.argv[1])
-# times, amplitudes = zip(*vcd['top.sin'].tv)
-# print(amplitudes)
+parser = argparse.ArgumentParser()
+parser.add_argument("vcd")
+parser.add_argument("signals", nargs="*", default=["top.sin"])
+parser.add_argument("--envelope", type=int, metavar="BINS",
+    help="plot the min/max envelope over BINS time bins instead of every transition")
+parser.add_argument("--decimate", type=int, metavar="SAMPLES",
+    help="resample each signal onto SAMPLES evenly spaced points")
+parser.add_argument("--chunk-size", type=int, default=1 << 24, metavar="BYTES")
+args = parser.parse_args()
 
-def plot(name):
-    x = vcd[name]
-    times, amplitudes = zip(*x.tv)
+traces = read_vcd(args.vcd, args.signals, chunk_size=args.chunk_size)
 
-    # print(amplitudes)
-    size = int(x.size)
+for name, trace in traces.items():
+    if args.envelope:
+        times, lo, hi = envelope(trace, args.envelope)
+        plt.fill_between(times, lo, hi, step='post', alpha=0.5, label=name)
+    elif args.decimate:
+        trace = resample(trace, args.decimate)
+        plt.step(trace.times, trace.values, where='post', label=name)
+    else:
+        plt.step(trace.times, trace.values, where='post', label=name)
 
-    amplitudes = list(map(lambda s: BitArray(bin=s.zfill(size)).uint, amplitudes))
-    times = list(map(lambda t: t * vcd.timescale["magnitude"], times))
-
-    plt.plot(times, amplitudes)
-
-plot('top.sin')
-# plot('top.cos')
-
-plt.xlabel('timestamp')
+plt.xlabel('time (s)')
 plt.ylabel('amplitude')
+plt.legend()
 plt.show()
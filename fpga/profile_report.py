@@ -0,0 +1,134 @@
+import json, re, struct
+from collections import namedtuple
+from typing import List
+
+# Hot-spot report for a profile written by `top.py simulate --profile`, resolved against the firmware's ELF.
+#
+# Each histogram bin holds the number of PC samples that fell in its `2**bin_shift` bytes of code. A bin's
+# samples are shared out between the functions it overlaps in proportion to the bytes of each inside it, so
+# the report is only as sharp as the bins are narrow.
+
+Symbol = namedtuple('Symbol', 'name addr size')
+
+DEFAULT_ELF = "app/target/riscv32imc-unknown-none-elf/release/app"
+
+SHT_SYMTAB = 2
+STT_FUNC = 2
+
+def elf_symbols(path: str) -> List[Symbol]:
+    """
+    The sized function symbols of a little-endian ELF file, sorted by address.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != b"\x7fELF":
+        raise ValueError(f"{path} is not an ELF file")
+    if data[5] != 1:
+        raise ValueError(f"{path} is not little-endian")
+
+    is_64 = data[4] == 2
+    if is_64:
+        shoff, = struct.unpack_from("<Q", data, 0x28)
+        shentsize, shnum = struct.unpack_from("<HH", data, 0x3a)
+        section = "<IIQQQQIIQQ"
+    else:
+        shoff, = struct.unpack_from("<I", data, 0x20)
+        shentsize, shnum = struct.unpack_from("<HH", data, 0x2e)
+        section = "<IIIIIIIIII"
+    sections = [struct.unpack_from(section, data, shoff + i * shentsize) for i in range(shnum)]
+
+    symbols = []
+    for _, sh_type, _, _, offset, size, link, _, _, entsize in sections:
+        if sh_type != SHT_SYMTAB:
+            continue
+        strtab_offset = sections[link][4]
+        for i in range(size // entsize):
+            if is_64:
+                name, info, _, _, value, sym_size = struct.unpack_from("<IBBHQQ", data, offset + i * entsize)
+            else:
+                name, value, sym_size, info, _, _ = struct.unpack_from("<IIIBBH", data, offset + i * entsize)
+            if info & 0xf != STT_FUNC or sym_size == 0:
+                continue
+            end = data.index(b"\0", strtab_offset + name)
+            symbols.append(Symbol(demangle(data[strtab_offset + name:end].decode()), value & ~1, sym_size))
+    return sorted(symbols, key=lambda symbol: symbol.addr)
+
+_ESCAPES = {"$LT$": "<", "$GT$": ">", "$RF$": "&", "$BP$": "*", "$C$": ",", "$SP$": "@", "$u20$": " ",
+    "$u27$": "'", "$u5b$": "[", "$u5d$": "]", "$u7b$": "{", "$u7d$": "}", "$u7e$": "~", "..": "::"}
+
+def demangle(name: str) -> str:
+    """
+    Readable form of a legacy-mangled Rust symbol, without its hash; other names are returned as they are.
+    """
+    if not name.startswith("_ZN") or not name.endswith("E"):
+        return name
+    parts, rest = [], name[3:-1]
+    while rest and rest[0].isdigit():
+        length = re.match(r"\d+", rest).group()
+        parts.append(rest[len(length):len(length) + int(length)])
+        rest = rest[len(length) + int(length):]
+    if parts and re.fullmatch(r"h[0-9a-f]{16}", parts[-1]):
+        parts.pop()
+    text = "::".join(part[1:] if part.startswith("_$") else part for part in parts)
+    for escape, char in _ESCAPES.items():
+        text = text.replace(escape, char)
+    return text
+
+def hot_spots(profile: dict, symbols: List[Symbol]) -> List[tuple]:
+    """
+    ``(name, samples)`` for every function with samples, hottest first. Samples outside every function,
+    including the histogram's catch-all last bin, are reported as ``"?"``.
+    """
+    histogram = profile["histogram"]
+    bin_size = 1 << profile["bin_shift"]
+    totals = {}
+    for i, samples in enumerate(histogram[:-1]):
+        if not samples:
+            continue
+        start = profile["pc_base"] + i * bin_size
+        end = start + bin_size
+        covered = 0
+        for symbol in symbols:
+            overlap = min(end, symbol.addr + symbol.size) - max(start, symbol.addr)
+            if overlap > 0:
+                totals[symbol.name] = totals.get(symbol.name, 0) + samples * overlap / bin_size
+                covered += overlap
+        if covered < bin_size:
+            totals["?"] = totals.get("?", 0) + samples * (bin_size - covered) / bin_size
+    if histogram[-1]:
+        totals["?"] = totals.get("?", 0) + histogram[-1]
+    return sorted(totals.items(), key=lambda item: -item[1])
+
+def format_report(profile: dict, symbols: List[Symbol], top: int = 20) -> str:
+    cycles, fetches, wait_states = profile["cycles"], profile["fetches"], profile["wait_states"]
+    lines = [
+        f"{cycles} cycles, {fetches} instructions fetched"
+            + (f", {cycles / fetches:.2f} cycles per fetch" if fetches else "")
+            + (f", {wait_states / cycles:.1%} of cycles waiting on the bus" if cycles else ""),
+        "",
+        f"{'region':<12} {'accesses':>10} {'waits':>10} {'waits/access':>13}",
+    ]
+    for region in profile["regions"]:
+        if region["accesses"] or region["waits"]:
+            ratio = region["waits"] / region["accesses"] if region["accesses"] else float("inf")
+            lines.append(f"{region['name']:<12} {region['accesses']:>10} {region['waits']:>10} {ratio:>13.2f}")
+
+    spots = hot_spots(profile, symbols)
+    total = sum(samples for _, samples in spots)
+    lines += ["", f"{total:.0f} PC samples, one every {1 << profile['sample_shift']} cycles", ""]
+    for name, samples in spots[:top]:
+        lines.append(f"{samples / total:>6.1%} {samples:>9.1f}  {name}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("profile", help="JSON written by `top.py simulate --profile`")
+    parser.add_argument("--elf", default=DEFAULT_ELF, help="firmware ELF with symbols")
+    parser.add_argument("--top", type=int, default=20, help="number of functions to list")
+
+    args = parser.parse_args()
+    with open(args.profile) as f:
+        profile = json.load(f)
+    print(format_report(profile, elf_symbols(args.elf), top=args.top))
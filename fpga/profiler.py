@@ -0,0 +1,221 @@
+from typing import Dict, List
+
+from nmigen import Elaboratable, Module, Signal, Memory, Array, Mux, Record
+
+from address_decoder import Peripheral, Region
+from csr import Bank, Register
+
+# Opt-in performance counters for the PicoRV32 SoC.
+#
+# `Profiler` watches the core's memory interface: it counts cycles and instruction fetches, completed
+# accesses and wait states per address region, and every `2**sample_shift` cycles adds the address of the
+# last instruction fetch to a histogram in block RAM. Firmware reads it all through its CSR bank, and
+# simulations export it with `outputs`, `histogram` and `dump`; `profile_report.py` turns a dump into a
+# hot-spot report.
+
+class Profiler(Elaboratable):
+    """
+    Counters and a sampled PC histogram for a ``PicoRV32``, attached with ``observe``.
+
+    The histogram has ``bins`` bins of ``2**bin_shift`` bytes of code each, the first starting at ``pc_base``;
+    the last bin also collects every PC past the others. Counting runs while ``ctrl.enable`` is set (as it
+    is from reset), and writing ``clear`` zeroes everything, which takes ``bins`` cycles for the histogram.
+    The histogram shares its block RAM port with the sampler, so stop counting before reading it back through
+    ``hist_index`` and ``hist_data``.
+
+    Region counters are selected with ``region_select``: region 0 counts instruction fetches, region 1 data
+    accesses to RAM, and the rest the CPU's peripherals and CSR banks, in the order of ``regions``.
+    """
+    def __init__(self, pc_base: int = 1024, bins: int = 256, bin_shift: int = 4, sample_shift: int = 6):
+        assert bins & (bins - 1) == 0 and bins >= 2, "the histogram must have a power of two of bins"
+        # the histogram is read, then written back incremented, the cycle after a sample
+        assert sample_shift >= 1
+        self.pc_base = pc_base
+        self.bins = bins
+        self.bin_shift = bin_shift
+        self.sample_shift = sample_shift
+
+        self.cpu = None
+        self.regions = [Region("fetch", None, None), Region("ram", None, None)]
+
+        self.ctrl = Record([("enable", 1)])
+        self.ctrl.enable.reset = 1
+        self.clear = Signal()
+        self.config = Record([
+            ("bins_log2", 8),
+            ("bin_shift", 8),
+            ("sample_shift", 8),
+            ("regions", 8),
+        ])
+        self.cycles = Signal(32, name="profile_cycles")
+        self.fetches = Signal(32, name="profile_fetches")
+        self.wait_states = Signal(32, name="profile_wait_states")
+        self.region_select = Signal(8)
+        self.region_accesses = Signal(32)
+        self.region_waits = Signal(32)
+        self.hist_index = Signal(range(bins))
+        self.histogram = Memory(width=32, depth=bins, name="profile_histogram")
+
+        self._read_port = self.histogram.read_port(transparent=False)
+        self.registers = {register.name: register for register in [
+            Register("ctrl", self.ctrl),
+            Register("clear", self.clear, access="w", desc="Zeroes the counters and the histogram."),
+            Register("config", self.config, access="r"),
+            Register("cycles", self.cycles, access="r"),
+            Register("fetches", self.fetches, access="r", desc="Completed instruction fetches."),
+            Register("wait_states", self.wait_states, access="r", desc="Cycles spent waiting on the bus."),
+            Register("region_select", self.region_select),
+            Register("region_accesses", self.region_accesses, access="r"),
+            Register("region_waits", self.region_waits, access="r"),
+            Register("hist_index", self.hist_index),
+            Register("hist_data", self._read_port.data, access="r", desc="Samples in bin `hist_index`."),
+        ]}
+
+    def csr_bank(self, name: str = "profiler") -> Bank:
+        return Bank(name, self.registers.values(), desc="Performance counters and PC histogram.")
+
+    def observe(self, cpu):
+        """
+        Profile ``cpu``, with one region per CSR bank and peripheral it maps. This is separate from the
+        constructor because the profiler's own bank has to be in the CPU's CSR map first.
+        """
+        self.cpu = cpu
+        for slave in cpu.wishbone:
+            if hasattr(slave, "map"):
+                self.regions += [Region(bank.name, bank.base, slave.map.stride) for bank in slave.map.banks]
+            else:
+                self.regions.append(Region(slave.name, slave.base, slave.size))
+        for mapping in cpu.memory_mappings:
+            p = mapping if isinstance(mapping, Peripheral) else Peripheral.single(mapping)
+            self.regions.append(Region(p.name, p.base, p.size))
+
+        self.region_counters = [
+            (Signal(32, name=f"profile_region{i}_accesses"), Signal(32, name=f"profile_region{i}_waits"))
+            for i in range(len(self.regions))
+        ]
+
+    def outputs(self) -> List[Signal]:
+        """
+        The counters, for ``CxxrtlSimulation`` and ``run_pysim``.
+        """
+        return [self.cycles, self.fetches, self.wait_states] + [s for pair in self.region_counters for s in pair]
+
+    def dump(self, values: Dict[str, int], histogram: List[int]) -> dict:
+        """
+        The profile as a dict for ``profile_report.py``, from a simulation's final ``values`` of ``outputs``
+        and the contents of ``histogram``.
+        """
+        return {
+            "pc_base": self.pc_base,
+            "bin_shift": self.bin_shift,
+            "sample_shift": self.sample_shift,
+            "cycles": values[self.cycles.name],
+            "fetches": values[self.fetches.name],
+            "wait_states": values[self.wait_states.name],
+            "regions": [{
+                "name": region.name,
+                "base": region.base,
+                "size": region.size,
+                "accesses": values[accesses.name],
+                "waits": values[waits.name],
+            } for region, (accesses, waits) in zip(self.regions, self.region_counters)],
+            "histogram": list(histogram),
+        }
+
+    def elaborate(self, platform):
+        assert self.cpu is not None, "call `observe` before elaborating the profiler"
+        m = Module()
+        cpu = self.cpu
+
+        m.d.comb += [
+            self.config.bins_log2.eq(self.bins.bit_length() - 1),
+            self.config.bin_shift.eq(self.bin_shift),
+            self.config.sample_shift.eq(self.sample_shift),
+            self.config.regions.eq(len(self.regions)),
+        ]
+
+        enable = self.ctrl.enable
+        clear = self.registers["clear"].w_stb
+        done = cpu.mem_valid & cpu.mem_ready
+        waiting = cpu.mem_valid & ~cpu.mem_ready
+
+        counters = [self.cycles, self.fetches, self.wait_states]
+        counters += [s for pair in self.region_counters for s in pair]
+        with m.If(clear):
+            m.d.sync += [counter.eq(0) for counter in counters]
+        with m.Elif(enable):
+            m.d.sync += self.cycles.eq(self.cycles + 1)
+            with m.If(done & cpu.mem_instr):
+                m.d.sync += self.fetches.eq(self.fetches + 1)
+            with m.If(waiting):
+                m.d.sync += self.wait_states.eq(self.wait_states + 1)
+
+            # an access belongs to the first region that matches; data accesses fall back to RAM
+            with m.If(cpu.mem_valid):
+                with m.If(cpu.mem_instr):
+                    self._count(m, 0, done)
+                for i, region in enumerate(self.regions[2:], start=2):
+                    shift = region.size.bit_length() - 1
+                    with m.Elif((cpu.mem_addr >> shift) == (region.base >> shift)):
+                        self._count(m, i, done)
+                with m.Else():
+                    self._count(m, 1, done)
+
+        accesses = Array(pair[0] for pair in self.region_counters)
+        waits = Array(pair[1] for pair in self.region_counters)
+        m.d.comb += [
+            self.region_accesses.eq(accesses[self.region_select]),
+            self.region_waits.eq(waits[self.region_select]),
+        ]
+
+        # PC histogram
+        m.submodules.read_port = read_port = self._read_port
+        m.submodules.write_port = write_port = self.histogram.write_port()
+
+        pc = Signal(32)
+        with m.If(done & cpu.mem_instr):
+            m.d.sync += pc.eq(cpu.mem_addr)
+
+        divider = Signal(self.sample_shift)
+        m.d.sync += divider.eq(divider + 1)
+
+        sweeping = Signal()
+        sweep_addr = Signal(range(self.bins))
+        with m.If(clear):
+            m.d.sync += [
+                sweeping.eq(1),
+                sweep_addr.eq(0),
+            ]
+        with m.Elif(sweeping):
+            m.d.sync += sweep_addr.eq(sweep_addr + 1)
+            with m.If(sweep_addr == self.bins - 1):
+                m.d.sync += sweeping.eq(0)
+
+        offset = Signal(32)
+        sample_bin = Signal(range(self.bins))
+        m.d.comb += offset.eq((pc - self.pc_base) >> self.bin_shift)
+        m.d.comb += sample_bin.eq(Mux((pc < self.pc_base) | (offset >= self.bins - 1), self.bins - 1, offset))
+
+        sample = enable & ~sweeping & (divider == 0)
+        sampled = Signal()
+        sampled_bin = Signal.like(sample_bin)
+        m.d.sync += [
+            sampled.eq(sample),
+            sampled_bin.eq(sample_bin),
+        ]
+        m.d.comb += [
+            read_port.addr.eq(Mux(sample, sample_bin, self.hist_index)),
+            read_port.en.eq(1),
+            write_port.addr.eq(Mux(sweeping, sweep_addr, sampled_bin)),
+            write_port.data.eq(Mux(sweeping, 0, read_port.data + 1)),
+            write_port.en.eq(sweeping | sampled),
+        ]
+
+        return m
+
+    def _count(self, m: Module, region: int, done):
+        accesses, waits = self.region_counters[region]
+        with m.If(done):
+            m.d.sync += accesses.eq(accesses + 1)
+        with m.Else():
+            m.d.sync += waits.eq(waits + 1)
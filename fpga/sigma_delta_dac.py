@@ -1,17 +1,236 @@
-from nmigen import Elaboratable, Module, Signal
+from math import comb
+from nmigen import Elaboratable, Module, Signal, Mux, Cat, signed
+from nco import LFSR_WIDTH, LFSR_TAPS
+
+# CIFB loop filter coefficients (delaying integrators, single-bit quantizer), as fractions of full scale.
+# Order 2 is the classic NTF = (1 - z^-1)^2. Order 3 places the NTF poles for a maximum out-of-band gain of
+# about 1.5 (0.669, 0.765 +/- 0.293j), which is stable with a 1-bit quantizer up to roughly 0.75 full scale; both
+# orders take their input attenuated to 0.75 full scale.
+CIFB_FEEDBACK = {
+    2: (1, 2),
+    3: (0.0465, 0.2958, 0.7998),
+}
+# the first-to-second integrator gain of the third-order loop is applied as `(x * C) >> CIFB_SHIFT`
+CIFB_SHIFT = 10
+# headroom of the CIFB integrators over full scale, in bits
+CIFB_GUARD_BITS = 5
 
 class SigmaDeltaDAC(Elaboratable):
-    def __init__(self, width: int):
+    """
+    Sigma-delta modulator driving a 1-bit output from an unsigned (offset binary) ``waveform``.
+
+    Parameters
+    ----------
+    width : int
+        Width of ``waveform``.
+    order : int
+        Noise shaping order, 1 to 3. Order 1 is a plain accumulator whose carry is ``out``.
+    topology : str
+        ``"cifb"`` for a single-loop modulator with a 1-bit quantizer on ``out``, or ``"mash"`` for cascaded
+        first-order stages whose combined multi-level output is ``level`` (for a resistor ladder or
+        several pins); ``out`` is then the first stage's 1-bit stream. CIFB loops attenuate their input by a
+        quarter to stay out of overload at full scale. Integrators saturate instead of wrapping.
+    dither_bits : int
+        Add that many bits of LFSR noise to the bottom of the input, 0 to disable.
+    upsample : int
+        Take a new ``waveform`` sample every ``upsample`` cycles (a power of two), marked by ``strobe``,
+        and linearly interpolate between samples, so the modulator can run faster than its source.
+        The interpolated ramp lags the samples by ``upsample`` cycles.
+    """
+    def __init__(self, width: int, order: int = 1, topology: str = "cifb", dither_bits: int = 0, upsample: int = 1):
+        assert 1 <= order <= 3
+        assert topology in ("cifb", "mash")
+        assert upsample >= 1 and upsample & (upsample - 1) == 0
+        assert dither_bits <= min(width, LFSR_WIDTH)
+
         self.width = width
+        self.order = order
+        self.topology = topology
+        self.dither_bits = dither_bits
+        self.upsample = upsample
+
         self.out = Signal()
         self.waveform = Signal(width)
+        self.strobe = Signal()
+        self.level = Signal(order if topology == "mash" else 1)
+
+    def interpolate(self, m: Module):
+        k = self.upsample.bit_length() - 1
+
+        phase = Signal(range(self.upsample))
+        last = Signal(self.width)
+        step = Signal(signed(self.width + 1))
+        ramp = Signal(signed(self.width + k + 2))
+
+        m.d.sync += phase.eq(phase + 1)
+        m.d.comb += self.strobe.eq(phase == 0)
+        with m.If(self.strobe):
+            m.d.sync += [
+                last.eq(self.waveform),
+                step.eq(self.waveform - last),
+                ramp.eq(last << k),
+            ]
+        with m.Else():
+            m.d.sync += ramp.eq(ramp + step)
+
+        return ramp[k:k + self.width]
+
+    def dither(self, m: Module, value):
+        lfsr = Signal(LFSR_WIDTH, reset=1)
+        m.d.sync += lfsr.eq(Mux(lfsr[0], (lfsr >> 1) ^ LFSR_TAPS, lfsr >> 1))
+
+        dithered = Signal(self.width)
+        total = value + lfsr[:self.dither_bits]
+        m.d.comb += dithered.eq(Mux(total[-1], (1 << self.width) - 1, total))
+        return dithered
+
+    def accumulator(self, m: Module, value):
+        acc = Signal(self.width+1)
+        m.d.sync += acc.eq(acc[:self.width] + value)
+        return acc
+
+    def cifb(self, m: Module, value):
+        FS = 1 << (self.width - 1)
+        state_width = self.width + CIFB_GUARD_BITS + 1
+        hi, lo = (1 << (state_width - 1)) - 1, -(1 << (state_width - 1))
+        def saturate(x):
+            return Mux(x > hi, hi, Mux(x < lo, lo, x))
+
+        u = Cat(value[:-1], ~value[-1]).as_signed()
+        u = u - (u >> 2)
+
+        x = [Signal(signed(state_width), name=f"x{i + 1}") for i in range(self.order)]
+        y = ~x[-1][-1]
+        def feedback(a):
+            k = round(a * FS)
+            return Mux(y, k, -k)
+
+        if self.order == 2:
+            a1, a2 = CIFB_FEEDBACK[2]
+            m.d.sync += [
+                x[0].eq(saturate(x[0] + u - feedback(a1))),
+                x[1].eq(saturate(x[1] + x[0] - feedback(a2))),
+            ]
+        else:
+            # the first integrator runs at unity gain and its coefficient moves to the second's input,
+            # so no truncation happens ahead of the noise shaping
+            a1, a2, a3 = CIFB_FEEDBACK[3]
+            c = round(a1 * (1 << CIFB_SHIFT))
+            m.d.sync += [
+                x[0].eq(saturate(x[0] + u - feedback(1))),
+                x[1].eq(saturate(x[1] + ((x[0] * c) >> CIFB_SHIFT) - feedback(a2))),
+                x[2].eq(saturate(x[2] + x[1] - feedback(a3))),
+            ]
+
+        m.d.comb += [
+            self.out.eq(y),
+            self.level.eq(y),
+        ]
+
+    def mash(self, m: Module, value):
+        carries = []
+        for stage in range(self.order):
+            acc = self.accumulator(m, value)
+            carries.append(acc[-1])
+            value = acc[:self.width]
+
+        # stage i contributes (1 - z^-1)^i of its carry, delayed so that every stage lines up with the last
+        history = []
+        for stage, carry in enumerate(carries):
+            taps = [carry]
+            for d in range(self.order - 1):
+                delayed = Signal(name=f"carry{stage + 1}_d{d + 1}")
+                m.d.sync += delayed.eq(taps[-1])
+                taps.append(delayed)
+            history.append(taps)
+
+        terms = []
+        for stage, taps in enumerate(history):
+            delay = self.order - 1 - stage
+            for d in range(stage + 1):
+                terms.append((-1) ** d * comb(stage, d) * taps[delay + d])
+        offset = (1 << (self.order - 1)) - 1
+
+        m.d.comb += [
+            self.level.eq(sum(terms) + offset),
+            self.out.eq(carries[0]),
+        ]
 
     def elaborate(self, platform):
         m = Module()
 
-        acc = Signal(self.width+1)
+        value = self.waveform
+        if self.upsample > 1:
+            value = self.interpolate(m)
+        else:
+            m.d.comb += self.strobe.eq(1)
+        if self.dither_bits:
+            value = self.dither(m, value)
 
-        m.d.sync += acc.eq(acc[:self.width] + self.waveform)
-        m.d.comb += self.out.eq(acc[-1])
+        if self.order == 1:
+            acc = self.accumulator(m, value)
+            m.d.comb += [
+                self.out.eq(acc[-1]),
+                self.level.eq(acc[-1]),
+            ]
+        elif self.topology == "mash":
+            self.mash(m, value)
+        else:
+            self.cifb(m, value)
 
         return m
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    p_action = parser.add_subparsers(dest="action")
+    p_check = p_action.add_parser("check", help="compare the HDL against the NumPy model in sigma_delta_dac_model.py")
+    p_check.add_argument("--width", type=int, default=12)
+    p_check.add_argument("--cycles", type=int, default=2000)
+    p_check.add_argument("--seed", type=int, default=0)
+    p_check.add_argument("--order", type=int, choices=[1, 2, 3], default=1)
+    p_check.add_argument("--topology", choices=["cifb", "mash"], default="cifb")
+    p_check.add_argument("--dither-bits", type=int, default=0)
+    p_check.add_argument("--upsample", type=int, default=1)
+
+    args = parser.parse_args()
+    if args.action == "check":
+        import numpy as np
+        from nmigen.sim import Simulator, Settle
+        from sigma_delta_dac_model import SigmaDeltaDACModel
+
+        rng = np.random.default_rng(args.seed)
+        waveform = np.repeat(
+            rng.integers(0, 1 << args.width, size=args.cycles),
+            rng.integers(1, 16, size=args.cycles),
+        )[:args.cycles]
+
+        # sync processes start after one clock edge, with the waveform still 0
+        params = dict(width=args.width, order=args.order, topology=args.topology,
+            dither_bits=args.dither_bits, upsample=args.upsample)
+        model = SigmaDeltaDACModel(**params)
+        model.run([0])
+        expected = model.run(waveform)
+        expected_level = model.level
+
+        dut = SigmaDeltaDAC(**params)
+        sim = Simulator(dut)
+        sim.add_clock(1e-6)
+
+        def proc():
+            for i, (sample, out, level) in enumerate(zip(waveform, expected, expected_level)):
+                yield dut.waveform.eq(int(sample))
+                yield
+                yield Settle()
+                got = yield dut.out
+                assert got == out, f"cycle {i}: HDL {got}, model {out}"
+                got = yield dut.level
+                assert got == level, f"cycle {i}: HDL level {got}, model {level}"
+        sim.add_sync_process(proc)
+        sim.run()
+
+        print(f"SigmaDeltaDAC({', '.join(f'{k}={v!r}' for k, v in params.items())}) matches the model for {args.cycles} cycles")
+    else:
+        parser.print_usage()
@@ -0,0 +1,154 @@
+from math import comb
+import numpy as np
+
+from nco_model import lfsr_sequence
+from sigma_delta_dac import CIFB_FEEDBACK, CIFB_SHIFT, CIFB_GUARD_BITS
+
+class SigmaDeltaDACModel:
+    """
+    Bit-exact NumPy model of ``SigmaDeltaDAC``.
+
+    The first-order accumulator keeps ``width`` bits and the output is the carry out of it, so the bitstream
+    is the difference of ``floor(sum / 2**width)`` between consecutive cycles and a whole run is one ``cumsum``.
+    MASH stages are the same accumulator fed with the previous stage's residue, and the upsampler and dither
+    are closed-form too; only the CIFB loop, whose quantizer feeds back into itself, is stepped in Python.
+
+    ``run`` returns ``out`` as seen after each tick, for one ``waveform`` sample per tick, and ``level``
+    is the matching multi-level output.
+    """
+
+    def __init__(self, width: int, order: int = 1, topology: str = "cifb", dither_bits: int = 0, upsample: int = 1):
+        self.width = width
+        self.order = order
+        self.topology = topology
+        self.dither_bits = dither_bits
+        self.upsample = upsample
+        self.lfsr = lfsr_sequence() if dither_bits else None
+        self.reset()
+
+    def reset(self):
+        self.cycle = 0
+        self.acc = 0
+        self.level = np.empty(0, dtype=np.int64)
+        # MASH stage accumulators, and the carries each stage produced over the last `order - 1` cycles
+        self.stages = [0] * self.order
+        self.carries = [np.zeros(self.order - 1, dtype=np.int64) for _ in range(self.order)]
+        # CIFB integrators
+        self.x = [0] * self.order
+        # the last two samples the upsampler took, and the index of the newest one (-1 is the reset value)
+        self.samples = np.zeros(2, dtype=np.int64)
+        self.sample_index = -1
+
+    def _interpolate(self, waveform: np.ndarray) -> np.ndarray:
+        r, k = self.upsample, self.upsample.bit_length() - 1
+        t = self.cycle + np.arange(len(waveform))
+
+        # a new sample is taken wherever the phase counter wraps
+        taken = t[t % r == 0]
+        samples = np.concatenate([self.samples, waveform[taken - self.cycle]])
+        base = self.sample_index - 1
+
+        # after the sample at `j * r`, the ramp runs from sample `j - 1` towards sample `j`
+        j = (t - 1) // r
+        p = (t - 1) % r
+        prev, cur = samples[j - 1 - base], samples[j - base]
+        ramp = np.where(t == 0, 0, (prev << k) + p * (cur - prev))
+
+        self.sample_index += len(taken)
+        self.samples = samples[-2:]
+        return ramp >> k
+
+    def _dither(self, waveform: np.ndarray) -> np.ndarray:
+        t = self.cycle + np.arange(len(waveform))
+        noise = (self.lfsr[t % len(self.lfsr)] & ((1 << self.dither_bits) - 1)).astype(np.int64)
+        return np.minimum(waveform + noise, (1 << self.width) - 1)
+
+    def _accumulate(self, acc: int, waveform: np.ndarray):
+        # returns the accumulator after each tick
+        mask = (1 << self.width) - 1
+        total = (acc & mask) + np.cumsum(waveform)
+        residue = np.concatenate([[acc & mask], total[:-1] & mask])
+        return residue + waveform
+
+    def _first_order(self, waveform: np.ndarray) -> np.ndarray:
+        acc = self._accumulate(self.acc, waveform)
+        self.acc = int(acc[-1])
+        out = acc >> self.width
+        self.level = out
+        return out
+
+    def _mash(self, waveform: np.ndarray) -> np.ndarray:
+        mask = (1 << self.width) - 1
+        n = len(waveform)
+        history = []
+        for stage in range(self.order):
+            acc = self._accumulate(self.stages[stage], waveform)
+            waveform = np.concatenate([[self.stages[stage] & mask], acc[:-1] & mask])
+            self.stages[stage] = int(acc[-1])
+
+            # carries from `order - 1` cycles before the first tick up to the last one
+            carries = np.concatenate([self.carries[stage], acc >> self.width])
+            self.carries[stage] = carries[n:]
+            history.append(carries)
+
+        level = np.full(n, (1 << (self.order - 1)) - 1, dtype=np.int64)
+        for stage, carries in enumerate(history):
+            delay = self.order - 1 - stage
+            for d in range(stage + 1):
+                start = self.order - 1 - delay - d
+                level += (-1) ** d * comb(stage, d) * carries[start:start + n]
+        self.level = level
+        return history[0][self.order - 1:]
+
+    def _cifb(self, waveform: np.ndarray) -> np.ndarray:
+        fs = 1 << (self.width - 1)
+        bound = 1 << (self.width + CIFB_GUARD_BITS)
+        def saturate(x):
+            return min(max(x, -bound), bound - 1)
+        def feedback(a, y):
+            k = round(a * fs)
+            return k if y else -k
+
+        u = waveform - fs
+        u = u - (u >> 2)
+
+        x = self.x
+        out = np.empty(len(u), dtype=np.int64)
+        if self.order == 2:
+            a1, a2 = CIFB_FEEDBACK[2]
+            for i, sample in enumerate(u.tolist()):
+                y = x[1] >= 0
+                x = [saturate(x[0] + sample - feedback(a1, y)), saturate(x[1] + x[0] - feedback(a2, y))]
+                out[i] = x[1] >= 0
+        else:
+            a1, a2, a3 = CIFB_FEEDBACK[3]
+            c = round(a1 * (1 << CIFB_SHIFT))
+            for i, sample in enumerate(u.tolist()):
+                y = x[2] >= 0
+                x = [
+                    saturate(x[0] + sample - feedback(1, y)),
+                    saturate(x[1] + ((x[0] * c) >> CIFB_SHIFT) - feedback(a2, y)),
+                    saturate(x[2] + x[1] - feedback(a3, y)),
+                ]
+                out[i] = x[2] >= 0
+        self.x = x
+        self.level = out
+        return out
+
+    def run(self, waveform: np.ndarray) -> np.ndarray:
+        waveform = np.asarray(waveform, dtype=np.int64) & ((1 << self.width) - 1)
+        if len(waveform) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        if self.upsample > 1:
+            waveform = self._interpolate(waveform)
+        if self.dither_bits:
+            waveform = self._dither(waveform)
+        self.cycle += len(waveform)
+
+        if self.order == 1:
+            return self._first_order(waveform)
+        elif self.topology == "mash":
+            return self._mash(waveform)
+        else:
+            return self._cifb(waveform)
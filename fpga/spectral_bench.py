@@ -0,0 +1,170 @@
+import itertools, json, math
+from collections import namedtuple
+from typing import Optional
+import numpy as np
+
+from nco import NCO
+from cordic import CORDIC
+from nco_model import NCOModel, PipelinedNCOModel
+from cordic_model import CordicNCOModel
+from sigma_delta_dac_model import SigmaDeltaDACModel
+
+# Output quality of the NCO and the NCO + SigmaDeltaDAC chain, measured on the bit-exact models (which
+# `nco.py check` and `sigma_delta_dac.py check` verify against the HDL), so long runs take seconds. Next to
+# the quality figures, `table_bits` and `adder_bits` estimate what each variant costs: the lookup tables take
+# block RAM, the CORDIC none but one logic cell per adder bit; `sweep.py` gives the synthesized numbers.
+
+BenchPoint = namedtuple('BenchPoint', 'variant width samples dither_bits interpolate iterations dac_width dac_order dac_topology freq')
+
+def blackman_harris(n: int) -> np.ndarray:
+    k = np.arange(n) * (2 * np.pi / n)
+    return 0.35875 - 0.48829 * np.cos(k) + 0.14128 * np.cos(2 * k) - 0.01168 * np.cos(3 * k)
+
+# bins either side of a tone that still hold its energy under the Blackman-Harris window
+TONE_BINS = 4
+
+def spectrum_metrics(x: np.ndarray, sample_rate: float, bandwidth: Optional[float] = None) -> dict:
+    """
+    SFDR, SNR, SINAD and ENOB of the strongest tone in ``x``.
+
+    Only bins up to ``bandwidth`` count, which acts as an ideal (brick-wall) reference low-pass filter;
+    for a sigma-delta bitstream that is the in-band quality seen after the analog reconstruction filter.
+    DC is excluded, and SNR additionally excludes harmonics 2 to 5.
+    """
+    x = np.asarray(x, dtype=float)
+    power = np.abs(np.fft.rfft((x - x.mean()) * blackman_harris(len(x)))) ** 2
+    bin_width = sample_rate / len(x)
+    last = len(power) if bandwidth is None else min(len(power), int(bandwidth / bin_width) + 1)
+    power = power[:last]
+    power[:TONE_BINS + 1] = 0
+
+    tone = int(power.argmax())
+    def around(k):
+        return slice(max(k - TONE_BINS, 0), k + TONE_BINS + 1)
+
+    signal = power[around(tone)].sum()
+    rest = power.copy()
+    rest[around(tone)] = 0
+    noise_and_distortion = rest.sum()
+
+    harmonics = rest.copy()
+    for h in range(2, 6):
+        # harmonics above Nyquist alias back down
+        k = (h * tone) % len(x)
+        k = min(k, len(x) - k)
+        if k < last:
+            harmonics[around(k)] = 0
+    noise = harmonics.sum()
+
+    spur = max(rest.max(), 1e-300)
+    sinad = 10 * math.log10(signal / max(noise_and_distortion, 1e-300))
+    return {
+        'tone_hz': tone * bin_width,
+        'sfdr_db': 10 * math.log10(signal / spur),
+        'snr_db': 10 * math.log10(signal / max(noise, 1e-300)),
+        'sinad_db': sinad,
+        'enob': (sinad - 1.76) / 6.02,
+    }
+
+def make_model(point: BenchPoint):
+    if point.variant == 'nco':
+        return NCOModel(width=point.width, samples=point.samples)
+    if point.variant == 'cordic':
+        return CordicNCOModel(width=point.width, iterations=point.iterations)
+    return PipelinedNCOModel(width=point.width, samples=point.samples,
+        dither_bits=point.dither_bits, interpolate=point.interpolate)
+
+def resource_estimate(point: BenchPoint) -> dict:
+    """
+    Table bits in block RAM and adder bits in the phase to amplitude conversion, leaving out the phase
+    accumulator that all variants share.
+    """
+    if point.variant == 'cordic':
+        cordic = CORDIC(width=point.width, iterations=point.iterations)
+        per_stage = 2 * cordic.data_width + cordic.angle_bits
+        return dict(table_bits=0, adder_bits=cordic.iterations * per_stage + 2 * (cordic.data_width + 1))
+    # the interpolating variant adds its correction to both outputs
+    adder_bits = 2 * point.width if point.interpolate else 0
+    return dict(table_bits=point.samples * (point.width - 1), adder_bits=adder_bits)
+
+def run_point(point: BenchPoint, n: int, clk_freq: float, bandwidth: float, settle: int = 16) -> dict:
+    phase_step = NCO.calculate_phase_step(clk_frequency=clk_freq, frequency=point.freq)
+    sin, _ = make_model(point).run(phase_step, n=n + settle)
+    sin = sin[settle:]
+
+    # the DAC takes the top bits of the NCO output, like `fit_width` in top.py
+    shift = point.width - point.dac_width
+    waveform = sin >> shift if shift >= 0 else sin << -shift
+    dac_model = SigmaDeltaDACModel(width=point.dac_width, order=point.dac_order, topology=point.dac_topology)
+    dac_model.run(waveform)
+    # a MASH modulator is measured on its multi-level output, which is what it is built to drive
+    bitstream = dac_model.level
+
+    nco = spectrum_metrics(sin, clk_freq)
+    dac = spectrum_metrics(bitstream, clk_freq, bandwidth=bandwidth)
+    return dict(
+        point._asdict(),
+        phase_step=phase_step,
+        **resource_estimate(point),
+        **{f'nco_{k}': v for k, v in nco.items()},
+        **{f'dac_{k}': v for k, v in dac.items()},
+    )
+
+def expand_points(variants, widths, samples, dither_bits, interpolate, iterations, dac_widths, dac_orders,
+        dac_topologies, freqs):
+    dacs = [(order, topology) for order in dac_orders for topology in (["cifb"] if order == 1 else dac_topologies)]
+    for variant, width, dac_width, (order, topology), freq in itertools.product(
+            variants, widths, dac_widths, dacs, freqs):
+        if variant == 'cordic':
+            # the CORDIC has no table; an iteration count of 0 stands for its default, width + 1
+            for n in iterations:
+                yield BenchPoint(variant, width, 0, 0, False, n or width + 1, dac_width, order, topology, freq)
+            continue
+        for depth in samples:
+            if variant == 'nco':
+                yield BenchPoint(variant, width, depth, 0, False, 0, dac_width, order, topology, freq)
+            else:
+                for dither, interp in itertools.product(dither_bits, interpolate):
+                    yield BenchPoint(variant, width, depth, dither, interp, 0, dac_width, order, topology, freq)
+
+REPORT_COLUMNS = ['variant', 'width', 'samples', 'dither_bits', 'interpolate', 'iterations', 'dac_width', 'dac_order',
+    'dac_topology', 'freq', 'table_bits', 'adder_bits', 'nco_sfdr_db', 'nco_enob', 'dac_sfdr_db', 'dac_snr_db',
+    'dac_enob']
+
+def format_report(rows) -> str:
+    def cell(value):
+        return f"{value:.1f}" if isinstance(value, float) else str(value)
+    lines = [REPORT_COLUMNS] + [[cell(row[k]) for k in REPORT_COLUMNS] for row in rows]
+    widths = [max(len(line[i]) for line in lines) for i in range(len(REPORT_COLUMNS))]
+    return "\n".join("  ".join(c.rjust(w) for c, w in zip(line, widths)) for line in lines)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--variant", nargs="+", choices=["nco", "pipelined", "cordic"], default=["nco", "pipelined"])
+    parser.add_argument("--width", type=int, nargs="+", default=[12])
+    parser.add_argument("--samples", type=int, nargs="+", default=[1024])
+    parser.add_argument("--dither-bits", type=int, nargs="+", default=[0], help="pipelined variant only")
+    parser.add_argument("--interpolate", type=int, nargs="+", choices=[0, 1], default=[0], help="pipelined variant only")
+    parser.add_argument("--iterations", type=int, nargs="+", default=[0], help="cordic variant only, 0 for width + 1")
+    parser.add_argument("--dac-width", type=int, nargs="+", default=[12])
+    parser.add_argument("--dac-order", type=int, nargs="+", choices=[1, 2, 3], default=[1])
+    parser.add_argument("--dac-topology", nargs="+", choices=["cifb", "mash"], default=["cifb"], help="orders 2 and 3 only")
+    parser.add_argument("--freq", type=float, nargs="+", default=[32_768.], help="output frequencies in Hz")
+    parser.add_argument("--clk", type=float, default=16e6, help="NCO/DAC clock in Hz")
+    parser.add_argument("--bandwidth", type=float, default=100e3, help="reference low-pass cutoff for the DAC output, in Hz")
+    parser.add_argument("-n", "--cycles", type=int, default=1 << 20)
+    parser.add_argument("--json", metavar="FILE", help="write the report as JSON")
+
+    args = parser.parse_args()
+
+    points = expand_points(args.variant, args.width, args.samples, args.dither_bits,
+        [bool(i) for i in args.interpolate], args.iterations, args.dac_width,
+        args.dac_order, args.dac_topology, args.freq)
+    rows = [run_point(point, n=args.cycles, clk_freq=args.clk, bandwidth=args.bandwidth) for point in points]
+
+    print(format_report(rows))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'cycles': args.cycles, 'clk': args.clk, 'bandwidth': args.bandwidth, 'results': rows}, f, indent=2)
@@ -0,0 +1,382 @@
+from nmigen import Elaboratable, Module, Signal, Record, Cat, Repl
+from nmigen.build.dsl import Resource, PinsN, Attrs
+from nmigen.hdl.rec import Layout
+
+# Reading the configuration flash from the gateware.
+#
+# The TinyFPGA BX boots its bitstream from an 8 Mbit SPI NOR flash that stays on the FPGA's pins afterwards.
+# `SPIFlashReader` streams words out of it with the fast read commands: `READ` (03h) on one data line, or
+# `DUAL I/O FAST READ` (BBh) / `QUAD I/O FAST READ` (EBh), which send the address on two or four lines as well.
+# With `continuous`, the mode bits after the address keep the flash in continuous read mode, so every read
+# after the first skips the 8-clock command. SCK runs at half the clock, 8 MHz from the 16 MHz `sync` domain.
+#
+# Quad I/O only works once the flash's non-volatile Quad Enable bit is set (without it WP# and HOLD# keep
+# their pin functions), which the reader does not do; dual I/O needs nothing. The bootloader leaves the flash
+# in deep power-down, so the reader first resets continuous read mode and then wakes it with `RELEASE POWER
+# DOWN` (ABh), waiting `wake_cycles` (tRES1 is 3 us, 48 cycles at 16 MHz) before its first read.
+
+FLASH_SIZE = 1 << 20 # bytes
+# the start of the user data area, past the bootloader and the user bitstream; `tinyprog -u` writes it
+FIRMWARE_OFFSET = 0x50000
+
+def flash_layout() -> Layout:
+    # the reader's side of the pins: `cs` is active high, and all four data lines share one output enable, like
+    # the `dq` subsignal of the `spi_flash_4x` resource. In single line mode, `dq_o[0]` is MOSI and `dq_i[1]` MISO
+    return Layout([
+        ("sck", 1),
+        ("cs", 1),
+        ("dq_o", 4),
+        ("dq_oe", 1),
+        ("dq_i", 4),
+    ])
+
+class SPIFlashReader(Elaboratable):
+    """
+    Reads ``burst`` consecutive little-endian words from the flash at a time, over ``width`` (1, 2 or 4) data
+    lines.
+
+    When ``ready``, a pulse on ``start`` reads from byte address ``addr``, which must be word aligned; each word
+    is then on ``data`` in the cycle ``valid`` pulses. With ``width`` 2 or 4 and ``continuous``, reads after the
+    first go without the command. A burst of ``n`` words over ``w`` lines takes ``2 * 32 * n / w`` cycles of data,
+    plus the address, mode and dummy clocks (12 with quad I/O) at 2 cycles each.
+    """
+    COMMANDS = {1: 0x03, 2: 0xbb, 4: 0xeb}
+    DUMMY_CLOCKS = {1: 0, 2: 0, 4: 4}
+    # M5-4 = 10 keeps the flash in continuous read mode, anything else ends it
+    MODE_CONTINUOUS = 0x20
+
+    def __init__(self, width: int = 2, burst: int = 8, continuous: bool = True, wake_cycles: int = 64):
+        if width not in self.COMMANDS:
+            raise ValueError(f"a SPI flash has 1, 2 or 4 data lines, not {width}")
+        if continuous and width == 1:
+            raise ValueError("continuous read mode needs dual or quad I/O")
+        self.width = width
+        self.burst = burst
+        self.continuous = continuous
+        self.wake_cycles = wake_cycles
+
+        self.pins = Record(flash_layout(), name="flash")
+
+        self.ready = Signal()
+        self.start = Signal()
+        self.addr = Signal(24)
+        self.valid = Signal()
+        self.data = Signal(32)
+
+    def elaborate(self, platform):
+        m = Module()
+        pins = self.pins
+        w = self.width
+
+        sck = Signal()
+        cs = Signal()
+        # bits go out from the top of `sr` and come in at the bottom
+        sr = Signal(32)
+        clocks = Signal(range(33), reset=16)
+        words = Signal(range(self.burst + 1))
+        wait = Signal(range(self.wake_cycles + 1))
+        addr = Signal(24)
+        continuous = Signal()
+        m.d.comb += [
+            pins.sck.eq(sck),
+            pins.cs.eq(cs),
+        ]
+
+        def lanes(n):
+            # drive `n` lines from the top of `sr`, the most significant bit on the highest line; WP# and HOLD#
+            # stay high while they are not data lines
+            m.d.comb += [
+                pins.dq_o.eq(Cat(sr[-n:], Repl(1, 4 - n))),
+                pins.dq_oe.eq(1),
+            ]
+
+        def clock(n, then):
+            # one SCK period over two cycles; the flash samples on the rising edge and changes its output on the
+            # falling one, where `n` bits are shifted in. `then` runs with the last falling edge
+            m.d.sync += sck.eq(~sck)
+            with m.If(sck):
+                bits = pins.dq_i[1] if n == 1 else pins.dq_i[:n]
+                m.d.sync += [
+                    sr.eq(Cat(bits, sr[:-n])),
+                    clocks.eq(clocks - 1),
+                ]
+                with m.If(clocks == 1):
+                    then()
+
+        def deselect():
+            m.d.sync += cs.eq(0)
+
+        def data_phase():
+            m.d.sync += [
+                clocks.eq(32 // w),
+                words.eq(self.burst),
+            ]
+            m.next = "DATA"
+
+        def after_address():
+            if w == 1:
+                data_phase()
+            else:
+                mode = self.MODE_CONTINUOUS if self.continuous else 0
+                m.d.sync += [
+                    sr.eq(mode << 24),
+                    clocks.eq(8 // w),
+                ]
+                m.next = "MODE"
+
+        def after_mode():
+            if self.DUMMY_CLOCKS[w]:
+                m.d.sync += clocks.eq(self.DUMMY_CLOCKS[w])
+                m.next = "DUMMY"
+            else:
+                data_phase()
+
+        m.d.sync += self.valid.eq(0)
+        with m.FSM():
+            with m.State("RESET"):
+                # all lines high for 16 clocks ends continuous read mode, whatever the number of lines
+                m.d.comb += [
+                    pins.dq_o.eq(0b1111),
+                    pins.dq_oe.eq(1),
+                ]
+                m.d.sync += cs.eq(1)
+                with m.If(cs):
+                    def wake():
+                        deselect()
+                        m.d.sync += [
+                            sr.eq(0xab << 24),
+                            clocks.eq(8),
+                        ]
+                        m.next = "WAKE"
+                    clock(1, wake)
+
+            with m.State("WAKE"):
+                # CS# was high for a cycle
+                m.d.sync += cs.eq(1)
+                with m.If(cs):
+                    lanes(1)
+                    def sleep():
+                        deselect()
+                        m.d.sync += wait.eq(self.wake_cycles)
+                        m.next = "WAIT"
+                    clock(1, sleep)
+
+            with m.State("WAIT"):
+                m.d.sync += wait.eq(wait - 1)
+                with m.If(wait == 0):
+                    m.next = "IDLE"
+
+            with m.State("IDLE"):
+                m.d.comb += self.ready.eq(1)
+                with m.If(self.start):
+                    m.d.sync += [
+                        cs.eq(1),
+                        addr.eq(self.addr),
+                    ]
+                    with m.If(continuous):
+                        m.d.sync += [
+                            sr.eq(self.addr << 8),
+                            clocks.eq(24 // w),
+                        ]
+                        m.next = "ADDR"
+                    with m.Else():
+                        m.d.sync += [
+                            sr.eq(self.COMMANDS[w] << 24),
+                            clocks.eq(8),
+                        ]
+                        m.next = "CMD"
+
+            with m.State("CMD"):
+                lanes(1)
+                def address():
+                    m.d.sync += [
+                        sr.eq(addr << 8),
+                        clocks.eq(24 // w),
+                    ]
+                    m.next = "ADDR"
+                clock(1, address)
+
+            with m.State("ADDR"):
+                lanes(w)
+                clock(w, after_address)
+
+            with m.State("MODE"):
+                lanes(w)
+                clock(w, after_mode)
+
+            with m.State("DUMMY"):
+                clock(w, data_phase)
+
+            with m.State("DATA"):
+                def word():
+                    s = Cat(pins.dq_i[1] if w == 1 else pins.dq_i[:w], sr[:-w])
+                    m.d.sync += [
+                        # bytes arrive in address order, each most significant bit first
+                        self.data.eq(Cat(s[24:32], s[16:24], s[8:16], s[0:8])),
+                        self.valid.eq(1),
+                        words.eq(words - 1),
+                        clocks.eq(32 // w),
+                    ]
+                    with m.If(words == 1):
+                        # CS# goes high for at least a cycle (62.5 ns) before the next read
+                        deselect()
+                        m.d.sync += continuous.eq(self.continuous)
+                        m.next = "IDLE"
+                clock(w, word)
+
+        return m
+
+def connect_flash(m: Module, platform, pins: Record, width: int):
+    """
+    Connect ``pins``, a ``SPIFlashReader``'s, to the TinyFPGA BX's flash, for a reader with ``width`` data
+    lines.
+    """
+    if width == 4:
+        flash = platform.request("spi_flash_4x")
+        m.d.comb += [
+            flash.dq.o.eq(pins.dq_o),
+            flash.dq.oe.eq(pins.dq_oe),
+            pins.dq_i.eq(flash.dq.i),
+        ]
+    elif width == 2:
+        flash = platform.request("spi_flash_2x")
+        m.d.comb += [
+            flash.dq.o.eq(pins.dq_o[:2]),
+            flash.dq.oe.eq(pins.dq_oe),
+            pins.dq_i[:2].eq(flash.dq.i),
+        ]
+        # the dual resource leaves out WP# and HOLD#, and a floating HOLD# pauses the flash
+        platform.add_resources([Resource("spi_flash_wp_hold", 0, PinsN("H4 J8", dir="o"),
+            Attrs(IO_STANDARD="SB_LVCMOS"))])
+        m.d.comb += platform.request("spi_flash_wp_hold").o.eq(0)
+    else:
+        flash = platform.request("spi_flash_1x")
+        m.d.comb += [
+            flash.mosi.o.eq(pins.dq_o[0]),
+            pins.dq_i[1].eq(flash.miso.i),
+            flash.wp.o.eq(0),
+            flash.hold.o.eq(0),
+        ]
+    m.d.comb += [
+        flash.cs.o.eq(pins.cs),
+        flash.clk.o.eq(pins.sck),
+    ]
+
+def flash_model(pins: Record, contents: bytes, stats: dict = None):
+    """
+    A simulation process playing the flash on the far side of ``pins``, which holds ``contents`` and answers
+    the commands `SPIFlashReader` sends. It starts in deep power-down and checks that it is woken before any
+    read. ``stats`` counts the commands and the reads made in continuous read mode.
+    """
+    from nmigen.sim import Passive, Settle
+
+    stats = stats if stats is not None else {}
+    yield Passive()
+    awake = False
+    continuous = False
+    sck = cs = 0
+    phase, lanes, clocks, value, addr, command = None, 1, 0, 0, 0, None
+    while True:
+        yield
+        yield Settle()
+        prev_sck, prev_cs = sck, cs
+        sck, cs = (yield pins.sck), (yield pins.cs)
+        if not cs:
+            phase = None
+            continue
+        if not prev_cs:
+            if continuous:
+                phase, lanes, clocks, value = "addr", command_lanes, 24 // command_lanes, 0
+                stats["continuous"] = stats.get("continuous", 0) + 1
+            else:
+                phase, lanes, clocks, value = "cmd", 1, 8, 0
+        if sck and not prev_sck and phase not in (None, "data"):
+            dq = yield pins.dq_o
+            value = (value << lanes) | (dq & ((1 << lanes) - 1))
+            clocks -= 1
+            if clocks:
+                continue
+            if phase == "cmd":
+                command = value
+                stats[f"{command:02x}h"] = stats.get(f"{command:02x}h", 0) + 1
+                if command == 0xab:
+                    awake, phase = True, None
+                elif command in (0x03, 0xbb, 0xeb):
+                    assert awake, "read while in deep power-down"
+                    command_lanes = {0x03: 1, 0xbb: 2, 0xeb: 4}[command]
+                    phase, lanes, clocks, value = "addr", command_lanes, 24 // command_lanes, 0
+                else:
+                    phase = None
+            elif phase == "addr":
+                addr = value
+                if lanes == 1:
+                    phase = "data"
+                else:
+                    phase, clocks, value = "mode", 8 // lanes, 0
+            elif phase == "mode":
+                continuous = value & 0x30 == 0x20
+                dummy = 4 if lanes == 4 else 0
+                phase, clocks = ("dummy", dummy) if dummy else ("data", 0)
+            elif phase == "dummy":
+                phase = "data"
+            if phase == "data":
+                bit = 0
+        elif not sck and prev_sck and phase == "data":
+            # the next `lanes` bits, most significant first, on MISO or the data lines
+            byte = contents[(addr + bit // 8) % len(contents)]
+            bits = (byte >> (8 - lanes - bit % 8)) & ((1 << lanes) - 1)
+            yield pins.dq_i.eq(bits << 1 if lanes == 1 else bits)
+            bit += lanes
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    p_action = parser.add_subparsers(dest="action")
+    p_check = p_action.add_parser("check", help="read bursts from a model of the flash in simulation")
+    p_check.add_argument("--width", type=int, choices=[1, 2, 4], default=2)
+    p_check.add_argument("--burst", type=int, default=8)
+    p_check.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.action == "check":
+        import random
+        from nmigen.sim import Simulator
+
+        rng = random.Random(args.seed)
+        contents = bytes(rng.getrandbits(8) for _ in range(4096))
+        reader = SPIFlashReader(width=args.width, burst=args.burst, continuous=args.width > 1)
+        sim = Simulator(reader)
+        sim.add_clock(1 / 16e6)
+        stats = {}
+        def flash():
+            yield from flash_model(reader.pins, contents, stats)
+        sim.add_sync_process(flash)
+
+        def proc():
+            while not (yield reader.ready):
+                yield
+            cycles = []
+            for _ in range(4):
+                addr = rng.randrange(0, len(contents) - 4 * args.burst, 4)
+                yield reader.addr.eq(addr)
+                yield reader.start.eq(1)
+                yield
+                yield reader.start.eq(0)
+                words, start = [], 0
+                while len(words) < args.burst:
+                    yield
+                    start += 1
+                    if (yield reader.valid):
+                        words.append((yield reader.data))
+                expected = [int.from_bytes(contents[addr + 4 * i:addr + 4 * i + 4], "little") for i in range(args.burst)]
+                assert words == expected, f"read {[hex(w) for w in words]} at {addr:#x}, not {[hex(w) for w in expected]}"
+                cycles.append(start)
+                while not (yield reader.ready):
+                    yield
+            print(f"{args.width} line(s): {args.burst}-word bursts in {cycles[0]} cycles, then {cycles[-1]} "
+                f"({4 * args.burst * 16e6 / cycles[-1] / 1e6:.1f} MB/s at 16 MHz); commands {stats}")
+        sim.add_sync_process(proc)
+        sim.run()
+    else:
+        parser.print_usage()
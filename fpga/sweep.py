@@ -0,0 +1,136 @@
+import glob, hashlib, itertools, json, os, re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+# Design-space exploration for `Top`: build every combination of NCO backend, NCO width, table depth, DAC
+# width and target clock with yosys/nextpnr, in parallel, and tabulate resource usage and achieved Fmax.
+#
+# `Top` is built without its PLL-driven `dsp` domain, so everything runs from the 16 MHz `sync` clock and the
+# target clock is not synthesized by a PLL; it is the frequency the build has to reach, and `meets` compares
+# it against nextpnr's Fmax for `sync`.
+# Points that differ only in the target clock share one build.
+
+SweepPoint = namedtuple('SweepPoint', 'nco_backend nco_width nco_samples dac_width clk_freq_mhz')
+
+RESULT_FIELDS = ['lc', 'lc_total', 'ram', 'ram_total', 'fmax_mhz', 'meets']
+
+_UTILISATION = re.compile(r"^Info:\s+(ICESTORM_LC|ICESTORM_RAM):\s+(\d+)/\s*(\d+)")
+_FMAX = re.compile(r"^Info: Max frequency for clock\s+'([^']+)':\s+([\d.]+) MHz")
+
+def parse_nextpnr_log(path: str) -> dict:
+    """
+    Pull logic cell / BRAM usage and the post-route Fmax of each clock out of a nextpnr-ice40 log.
+    """
+    usage = {}
+    fmax = {}
+    with open(path) as f:
+        for line in f:
+            match = _UTILISATION.match(line)
+            if match:
+                usage[match.group(1)] = (int(match.group(2)), int(match.group(3)))
+            match = _FMAX.match(line)
+            if match:
+                # nextpnr reports after placement and again after routing; the last one wins
+                fmax[match.group(1)] = float(match.group(2))
+    return {
+        'lc': usage['ICESTORM_LC'][0],
+        'lc_total': usage['ICESTORM_LC'][1],
+        'ram': usage['ICESTORM_RAM'][0],
+        'ram_total': usage['ICESTORM_RAM'][1],
+        'fmax_mhz': fmax,
+    }
+
+def gateware_hash(firmware: Optional[str]) -> str:
+    h = hashlib.sha256()
+    for path in sorted(glob.glob("*.py")) + ["picorv32.v"] + ([firmware] if firmware else []):
+        with open(path, "rb") as f:
+            h.update(path.encode())
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+def point_hash(point: SweepPoint, sources: str) -> str:
+    params = point._replace(clk_freq_mhz=None)._asdict()
+    return hashlib.sha256(json.dumps([sources, params], sort_keys=True).encode()).hexdigest()[:16]
+
+def build_point(point: SweepPoint, build_dir: str, firmware: Optional[str]) -> dict:
+    from nmigen_boards.tinyfpga_bx import TinyFPGABXPlatform
+    from top import Top
+
+    top = Top(firmware=firmware, nco_width=point.nco_width, nco_samples=point.nco_samples, dac_width=point.dac_width,
+        nco_backend=point.nco_backend)
+    TinyFPGABXPlatform().build(top, build_dir=build_dir, do_program=False)
+
+    report = parse_nextpnr_log(os.path.join(build_dir, "top.tim"))
+    # the design has a single clock domain, driven by the board oscillator
+    report['fmax_mhz'] = min(report['fmax_mhz'].values())
+
+    with open(os.path.join(build_dir, "result.json"), "w") as f:
+        json.dump(report, f)
+    return report
+
+def sweep(points, jobs: Optional[int] = None, firmware: Optional[str] = None, build_root: str = "build/sweep") -> list:
+    """
+    Build every point not already in the cache under ``build_root`` and return ``(point, result)`` pairs
+    in the order given. Points are cached by a hash of their parameters and of the gateware sources.
+    """
+    from firmware import load_firmware
+
+    # build (or fetch) the firmware once up front, so the workers never race on cargo
+    load_firmware(image=firmware)
+
+    sources = gateware_hash(firmware)
+    build_dirs = [os.path.join(build_root, point_hash(point, sources)) for point in points]
+
+    results = {}
+    pending = []
+    for point, build_dir in zip(points, build_dirs):
+        cached = os.path.join(build_dir, "result.json")
+        if os.path.exists(cached):
+            with open(cached) as f:
+                results[build_dir] = json.load(f)
+        elif build_dir not in pending:
+            pending.append(build_dir)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            build_dir: executor.submit(build_point, points[build_dirs.index(build_dir)], build_dir, firmware)
+            for build_dir in pending
+        }
+        for build_dir, future in futures.items():
+            results[build_dir] = future.result()
+
+    return [
+        (point, dict(results[build_dir], meets=results[build_dir]['fmax_mhz'] >= point.clk_freq_mhz))
+        for point, build_dir in zip(points, build_dirs)
+    ]
+
+def format_table(rows) -> str:
+    header = list(SweepPoint._fields) + RESULT_FIELDS
+    lines = [header] + [[str(v) for v in point] + [str(result[k]) for k in RESULT_FIELDS] for point, result in rows]
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(line, widths)) for line in lines)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nco-backend", nargs="+", choices=["lookup", "cordic"], default=["lookup"])
+    parser.add_argument("--nco-width", type=int, nargs="+", default=[12])
+    parser.add_argument("--nco-samples", type=int, nargs="+", default=[1024])
+    parser.add_argument("--dac-width", type=int, nargs="+", default=[12])
+    parser.add_argument("--clk", type=float, nargs="+", default=[16.0], metavar="MHZ", help="target clock frequencies")
+    parser.add_argument("--jobs", type=int, help="parallel builds (default: one per CPU)")
+    parser.add_argument("--firmware", metavar="APP_BIN", help="use a prebuilt firmware image instead of running cargo")
+    parser.add_argument("--json", metavar="FILE", help="also write the results as JSON")
+
+    args = parser.parse_args()
+
+    points = [SweepPoint(*p) for p in itertools.product(args.nco_backend, args.nco_width, args.nco_samples,
+        args.dac_width, args.clk)]
+    rows = sweep(points, jobs=args.jobs, firmware=args.firmware)
+
+    print(format_table(rows))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([dict(point._asdict(), **result) for point, result in rows], f, indent=2)
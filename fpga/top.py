@@ -1,129 +1,397 @@
-from os import wait
-from uart import UART
-from nmigen import Module, Elaboratable, DomainRenamer, Signal, Record, Cat
+from nmigen import Module, Elaboratable, DomainRenamer, Signal, Record, Cat, Const
 from nmigen.build.dsl import Resource, Pins
+from nmigen_boards.resources import UARTResource
 
 import typing
 
-# from cordic import CORDIC
 from blinky import Blinky
-from ice40_pll import ICE40_PLL
+from ice40_pll import ICE40_PLL, calc_pll_coefficients
+from cdc import BusSynchronizer
+from build_cache import Cached, DEFAULT_CACHE_DIR
 from nco import NCO
+from cordic import CordicNCO
+from nco_bank import NCOBank
+from chirp import ChirpEngine
 from sigma_delta_dac import SigmaDeltaDAC
-from picorv32 import PicoRV32, Mapping
+from picorv32 import PicoRV32
+from irq import InterruptController, Timer, IRQLine
+from csr import CSRBridge, CSRMap, Bank, Register
+from uart_peripheral import UARTPeripheral
+from profiler import Profiler
+from icache import InstructionCache
+from spi_flash import connect_flash
+from awg import AWG, SourceSelect
+from capture import LogicAnalyzer
+
+def fit_width(value, width: int):
+    # keep the most significant bits when narrowing, pad the bottom with zeros when widening
+    if len(value) >= width:
+        return value[-width:]
+    return Cat(Const(0, width - len(value)), value)
 
 class Top(Elaboratable):
-    def __init__(self):
-        # self.pll = ICE40_PLL(
-        #     50, # Mhz
-        #     "pll",
-        # )
-
-        # self.cordic = DomainRenamer("pll")(CORDIC(width=12))
-        # self.nco = DomainRenamer("pll")(NCO(width=12, samples=1024))
-        # self.dac = DomainRenamer("pll")(SigmaDeltaDAC(width=12))
-        self.nco = NCO(width=12, samples=1024)
-        self.sine_dac = SigmaDeltaDAC(width=12)
-        self.cosine_dac = SigmaDeltaDAC(width=12)
-        # self.uart = UART(clk_freq=16e6, baud_rate=9600)
+    def __init__(self, firmware: typing.Optional[str] = None, nco_width: int = 12, nco_samples: int = 1024, dac_width: int = 12,
+            nco: typing.Optional[Elaboratable] = None, cpu_bus: str = "look_ahead", cpu_prefetch: bool = False,
+            profile: bool = False, nco_channels: int = 0, nco_backend: str = "lookup",
+            dsp_clk_mhz: typing.Optional[float] = None, cache_dir: typing.Optional[str] = DEFAULT_CACHE_DIR,
+            xip: typing.Optional[InstructionCache] = None, awg_samples: int = 0, capture_depth: int = 0):
+        # with `dsp_clk_mhz`, the NCO and the DACs run in a `dsp` domain clocked by the PLL, so the DACs can
+        # oversample far faster than the CPU runs, and the NCO's control registers cross into it through a
+        # `BusSynchronizer`. Without it everything shares the 16 MHz `sync` clock
+        if dsp_clk_mhz is not None and nco_channels:
+            raise ValueError("the DSP clock domain is only supported with a single NCO")
+        if dsp_clk_mhz is not None and awg_samples:
+            raise ValueError("the AWG only runs in the CPU's clock domain")
+        if dsp_clk_mhz is not None and capture_depth:
+            raise ValueError("the logic analyzer only samples in the CPU's clock domain")
+        self.dsp_clk_mhz = dsp_clk_mhz
+        self.pll = ICE40_PLL(dsp_clk_mhz, "dsp") if dsp_clk_mhz is not None else None
+        # the rate the NCO's phase accumulator advances at: its clock, as the PLL gets closest to `dsp_clk_mhz`,
+        # and with `nco_channels` a channel's share of it. The firmware turns frequencies into phase steps with
+        # it, from `csr::NCO_CLOCK_FREQUENCY`
+        self.nco_clk_freq = 16e6 if dsp_clk_mhz is None else calc_pll_coefficients(16, dsp_clk_mhz).f_out * 1e6
+        if nco_channels:
+            self.nco_clk_freq /= nco_channels
+        # the signal chain is converted to RTLIL once per configuration and reused by later builds; `None` turns
+        # that off
+        self.cache_dir = cache_dir
+
+        # any NCO-compatible generator (e.g. `PipelinedNCO`) can be passed in place of the default one, and
+        # `nco_backend="cordic"` swaps the lookup table for a `CordicNCO`, which takes no block RAM. With
+        # `nco_channels`, an `NCOBank` replaces it: channel 0 drives the sine DAC and the mix of all channels the
+        # cosine DAC, and the firmware programs it through `csr::nco_bank` instead of `csr::nco`
+        if nco_backend not in ("lookup", "cordic"):
+            raise ValueError(f"unknown NCO backend {nco_backend!r}")
+        if nco_channels and nco_backend != "lookup":
+            raise ValueError("an NCOBank only has a lookup table backend")
+        if nco_channels:
+            assert nco is None
+            self.nco = None
+            self.nco_bank = NCOBank(channels=nco_channels, width=nco_width, samples=nco_samples)
+        else:
+            if nco is None:
+                nco = NCO(width=nco_width, samples=nco_samples) if nco_backend == "lookup" else CordicNCO(width=nco_width)
+            self.nco = nco
+            self.nco_bank = None
+        # the NCO's phase step comes from the sweep engine, which also takes fixed frequencies
+        self.chirp = ChirpEngine() if self.nco is not None else None
+        self.sine_dac = SigmaDeltaDAC(width=dac_width)
+        self.cosine_dac = SigmaDeltaDAC(width=dac_width)
+        self.uart = UARTPeripheral(clk_freq=16e6, baud_rate=115200)
+
+        # with `awg_samples`, an `AWG` with buffers of that many samples, and a choice per DAC of the NCO, the AWG
+        # or the NCO modulated by the AWG, in `csr::dac::source`
+        self.awg = AWG(width=dac_width, samples=awg_samples) if awg_samples else None
+        if self.awg is not None:
+            self.sine_source = SourceSelect(dac_width)
+            self.cosine_source = SourceSelect(dac_width)
+            self.dac_source = Record([
+                ("sine", 2),
+                ("cosine", 2),
+            ])
+        # with `capture_depth`, a `LogicAnalyzer` of that many entries on the DACs' inputs and outputs, so
+        # `capture_dump.py` can record them on the board at full speed
+        self.analyzer = None
+        if capture_depth:
+            self.analyzer = LogicAnalyzer({
+                "sin": self.sine_dac.waveform,
+                "cos": self.cosine_dac.waveform,
+                "sine_dac": self.sine_dac.out,
+                "cosine_dac": self.cosine_dac.out,
+            }, depth=capture_depth, clk_freq=16e6)
         # self.blinky = Blinky()
 
         self.nco_ctrl = Record([
             ("enable", 1),
         ])
 
-        # self.uart_data = Signal(8)
         self.led = Signal()
 
-        # def uart_write(m: Module, mem_wdata: Signal):
-        #     m.d.comb += self.uart_data.eq(mem_wdata)
-        #     m.d.sync += [
-        #         self.uart.tx_rdy.eq(1),
-        #         self.uart
-        #     ]
-
-        self.picorv32 = PicoRV32([
-            Mapping(
-                addr=0xcafebab0,
-                signal=self.led,
-                write=True,
-                read=False,
-            ),
-            # NCO
-            Mapping(
-                addr=0xf000_0000,
-                signal=self.nco_ctrl,
-                read=True,
-                write=True,
-            ),
-            Mapping(
-                addr=0xf000_0004, # offset by 1 word
-                signal=self.nco.phase_step,
-                read=True,
-                write=True,
-            ),
-            # UART
-            # Mapping(
-            #     addr=0xf000_0008, # offset by 1 word,
-            #     # signal=self.uart_data,
-            #     read=False,
-            #     write=uart_write,
-            # )
-        ])
+        # with `xip`, the firmware runs from the SPI flash through this cache instead of from block RAM
+        self.xip = xip
+
+        # performance counters and a PC histogram, which cost a block RAM and some logic, so only on request
+        self.profiler = None
+        if profile:
+            self.profiler = Profiler(pc_base=xip.image_base) if xip is not None else Profiler()
+
+        # interrupts, so the firmware can sleep instead of polling: the UART's own sources, a cycle timer and the
+        # optional peripherals' events. The NCO itself free-runs and has no event to report, so the end of a chirp
+        # sweep, which is what retunes it, is the NCO's interrupt
+        self.timer = Timer()
+        irq_sources = [IRQLine("timer", self.timer.event, edge=True), IRQLine("uart", self.uart.irq)]
+        if self.chirp is not None:
+            irq_sources.append(IRQLine("chirp", self.chirp.done, edge=True))
+        if self.awg is not None:
+            irq_sources.append(IRQLine("awg", self.awg.event, edge=True))
+        if self.analyzer is not None:
+            irq_sources.append(IRQLine("capture", self.analyzer.event, edge=True))
+        self.irq = InterruptController(irq_sources)
+
+        # registers are laid out by `CSRMap`; the firmware's `csr.rs` is generated from the same map. New banks go
+        # at the end so the existing ones keep their addresses
+        banks = [
+            Bank("nco", [
+                Register("ctrl", self.nco_ctrl),
+            ]) if self.nco is not None else self.nco_bank.csr_bank(),
+            Bank("led", [
+                Register("ctrl", self.led, access="w"),
+            ]),
+            self.uart.csr_bank(),
+        ]
+        if self.chirp is not None:
+            banks.append(self.chirp.csr_bank())
+        if self.profiler is not None:
+            banks.append(self.profiler.csr_bank())
+        banks += [self.irq.csr_bank(), self.timer.csr_bank()]
+        if self.xip is not None:
+            banks.append(self.xip.csr_bank())
+        if self.awg is not None:
+            banks += [
+                self.awg.csr_bank(),
+                Bank("dac", [
+                    Register("source", self.dac_source, desc="0 for the NCO, 1 for the AWG, 2 for their product."),
+                ]),
+            ]
+        if self.analyzer is not None:
+            banks.append(self.analyzer.csr_bank())
+        self.csr = CSRBridge(CSRMap(banks))
+        self.csr_constants = {"NCO_CLOCK_FREQUENCY": self.nco_clk_freq}
+
+        dma = [self.uart.dma] + ([self.awg.dma] if self.awg is not None else [])
+        self.picorv32 = PicoRV32([], firmware=firmware, bus=cpu_bus, prefetch=cpu_prefetch,
+            wishbone=[self.csr], dma=dma, firmware_sources={"csr.rs": self.csr.map.to_rust(self.csr_constants)},
+            counters=profile, irq=self.irq.irq, xip=xip)
+        if profile:
+            self.profiler.observe(self.picorv32)
 
     def elaborate(self, platform):
         m = Module()
 
-        m.submodules += [self.sine_dac, self.cosine_dac]
-        m.submodules += [self.nco, self.picorv32]
+        if self.pll is not None:
+            m.submodules.pll = self.pll
+            dsp = DomainRenamer("dsp")
+        else:
+            dsp = lambda elaboratable: elaboratable
 
-        m.d.comb += [
+        def cached(elaboratable, ports):
+            return Cached(elaboratable, ports, self.cache_dir) if self.cache_dir is not None else elaboratable
+        def dac(modulator):
+            return dsp(cached(modulator, [modulator.waveform, modulator.out, modulator.strobe, modulator.level]))
+
+        m.submodules += [dac(self.sine_dac), dac(self.cosine_dac)]
+        m.submodules += [self.picorv32, self.csr, self.uart, self.irq, self.timer]
+        if self.profiler is not None:
+            m.submodules.profiler = self.profiler
+        if self.xip is not None:
+            m.submodules.xip = self.xip
+        if self.awg is not None:
+            m.submodules += [self.awg, self.sine_source, self.cosine_source]
+        if self.analyzer is not None:
+            m.submodules.analyzer = self.analyzer
+
+        if self.nco is not None:
+            nco = self.nco
+            m.submodules.nco = dsp(cached(nco, [nco.enable, nco.phase_step, nco.sin, nco.cos]))
+            m.submodules.chirp = self.chirp
+            if self.pll is not None:
+                # the phase step and the enable bit cross together, so they always change on the same cycle
+                m.submodules.nco_cdc = BusSynchronizer(Cat(self.chirp.phase_step, self.nco_ctrl.enable),
+                    Cat(self.nco.phase_step, self.nco.enable), o_domain="dsp")
+            else:
+                m.d.comb += [
+                    self.nco.phase_step.eq(self.chirp.phase_step),
+                    self.nco.enable.eq(self.nco_ctrl.enable),
+                ]
             # self.dds.phase_step.eq(DDS.calculate_phase_step(clk_frequency=50e6, frequency=32_768)),
-            self.sine_dac.waveform.eq(self.nco.sin),
-            self.cosine_dac.waveform.eq(self.nco.cos),
-            self.nco.enable.eq(self.nco_ctrl.enable),
-        ]
+            sine, cosine = self.nco.sin, self.nco.cos
+        else:
+            bank = self.nco_bank
+            m.submodules.nco_bank = cached(bank, [bank.enable, *bank.phase_step, *bank.phase_offset, *bank.amplitude,
+                *bank.outputs, bank.mix, bank.strobe])
+            sine, cosine = self.nco_bank.outputs[0], self.nco_bank.mix
 
-        # m.d.sync += self.uart.tx_rdy.eq(0)
+        sine, cosine = fit_width(sine, self.sine_dac.width), fit_width(cosine, self.cosine_dac.width)
+        if self.awg is not None:
+            for select, nco, source in [(self.sine_source, sine, self.dac_source.sine),
+                    (self.cosine_source, cosine, self.dac_source.cosine)]:
+                m.d.comb += [
+                    select.nco.eq(nco),
+                    select.awg.eq(self.awg.out),
+                    select.select.eq(source),
+                ]
+            sine, cosine = self.sine_source.out, self.cosine_source.out
+        m.d.comb += [
+            self.sine_dac.waveform.eq(sine),
+            self.cosine_dac.waveform.eq(cosine),
+        ]
 
         if platform is not None:
             platform.add_resources([Resource("dac", 0, Pins("12 13", dir="o", conn=("gpio", 0)))])
             dac_pins = platform.request("dac")
             m.d.comb += dac_pins.o.eq(Cat(self.sine_dac.out, self.cosine_dac.out))
 
+            platform.add_resources([UARTResource(0, rx="14", tx="15", conn=("gpio", 0))])
+            uart_pins = platform.request("uart")
+            m.d.comb += [
+                uart_pins.tx.o.eq(self.uart.tx_o),
+                self.uart.rx_i.eq(uart_pins.rx.i),
+            ]
+
             led_pin = platform.request("led")
             m.d.comb += led_pin.o.eq(self.led)
 
+            if self.xip is not None:
+                connect_flash(m, platform, self.xip.flash.pins, self.xip.flash.width)
+
         return m
 
 if __name__ == "__main__":
-    from nmigen_boards.tinyfpga_bx import TinyFPGABXPlatform
-    import sys
-
-    if len(sys.argv) != 2:
-        print("top.py <program|simulate>")
-    elif sys.argv[1] == "build":
-        platform = TinyFPGABXPlatform()
-        products = platform.build(Top(), do_program=False)
-    elif sys.argv[1] == "program":
-        platform = TinyFPGABXPlatform()
-        products = platform.build(Top(), do_program=True)
-    elif sys.argv[1] == "generate":
-        from nmigen.back import verilog
-        top = Top()
-        print(verilog.convert(top, name="top", ports=(top.led,)))
-    # elif sys.argv[1] == "simulate":
-    #     from nmigen.sim import Simulator, Tick
-
-    #     dut = Top()
-    #     sim = Simulator(dut, engine="cxxsim")
-    #     sim.add_clock(1 / 16e6, domain="sync")
-    #     sim.add_clock(1 / 50e6, domain="pll")
-
-    #     def proc():
-    #         for i in range(2000):
-    #             yield Tick()
-
-    #     sim.add_process(proc)
-    #     with sim.write_vcd("top.vcd"):
-    #         sim.run()
+    import argparse, os
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--firmware", metavar="APP_BIN", help="use a prebuilt firmware image instead of running cargo")
+    parser.add_argument("--nco-channels", type=int, default=0, help="replace the NCO with an NCOBank of this many channels")
+    parser.add_argument("--nco-backend", choices=["lookup", "cordic"], default="lookup",
+        help="phase to amplitude conversion of the NCO: quarter-wave table or CORDIC")
+    parser.add_argument("--dsp-clk", type=float, metavar="MHZ",
+        help="run the NCO and the DACs from the PLL at this frequency instead of the 16 MHz CPU clock")
+    parser.add_argument("--xip", type=int, choices=[1, 2, 4], metavar="LINES",
+        help="run the firmware from the SPI flash, read over 1, 2 or 4 data lines (4 needs the flash's QE bit set)")
+    parser.add_argument("--icache-sets", type=int, default=32, help="sets of the XIP instruction cache")
+    parser.add_argument("--icache-ways", type=int, choices=[1, 2], default=1, help="ways of the XIP instruction cache")
+    parser.add_argument("--awg-samples", type=int, default=0, metavar="N",
+        help="add an arbitrary waveform generator with buffers of N samples, selectable per DAC")
+    parser.add_argument("--capture", type=int, default=0, metavar="DEPTH",
+        help="add a logic analyzer on the DACs with DEPTH entries, read out with capture_dump.py")
+    p_action = parser.add_subparsers(dest="action")
+    for action in ["build", "program"]:
+        p_build = p_action.add_parser(action)
+        p_build.add_argument("--force", action="store_true", help="run the toolchain even if the netlist is unchanged")
+    p_generate = p_action.add_parser("generate")
+    p_generate.add_argument("--output", metavar="FILE", help="write the Verilog to FILE (e.g. top.v) if it changed")
+    p_action.add_parser("decoder", help="print the CPU address map and the cost of its decode logic")
+    p_csr = p_action.add_parser("csr", help="write the firmware's register bindings and a JSON register map")
+    p_csr.add_argument("--rust", metavar="FILE", default="app/csr.rs")
+    p_csr.add_argument("--json", metavar="FILE", default="build/csr.json")
+    p_csr.add_argument("--capture-json", metavar="FILE", default="build/capture.json",
+        help="where the logic analyzer's layout goes, for capture_dump.py")
+    p_simulate = p_action.add_parser("simulate")
+    p_simulate.add_argument("--engine", choices=["pysim", "cxxsim", "all"], default="cxxsim",
+        help="pysim does not simulate the picorv32 core, so the firmware only runs under cxxsim")
+    p_simulate.add_argument("--cycles", type=int, default=1_000_000)
+    p_simulate.add_argument("--bus", choices=["look_ahead", "registered"], default="look_ahead", help="CPU memory bus")
+    p_simulate.add_argument("--prefetch", action="store_true", help="instruction prefetch buffer (registered bus only)")
+    p_simulate.add_argument("--vcd", metavar="FILE", help="write a VCD trace (slows the simulation down considerably)")
+    p_simulate.add_argument("--profile", metavar="FILE",
+        help="add the profiler and write its counters and PC histogram as JSON for profile_report.py")
+
+    args = parser.parse_args()
+
+    def make_top(**kwargs):
+        xip = None
+        if args.xip is not None:
+            xip = InstructionCache(flash_width=args.xip, continuous=args.xip > 1, sets=args.icache_sets,
+                ways=args.icache_ways)
+        return Top(firmware=args.firmware, nco_channels=args.nco_channels, nco_backend=args.nco_backend,
+            dsp_clk_mhz=args.dsp_clk, xip=xip, awg_samples=args.awg_samples,
+            capture_depth=args.capture, **kwargs)
+
+    if args.action in ("build", "program"):
+        from nmigen_boards.tinyfpga_bx import TinyFPGABXPlatform
+        from build_cache import StageTimer, build
+        timer = StageTimer()
+        top = make_top()
+        products = build(TinyFPGABXPlatform(), top, do_program=args.action == "program", force=args.force,
+            timer=timer)
+        if top.xip is not None and args.action == "program":
+            # the firmware goes into the flash's user data area, where the cache reads it from
+            import subprocess
+            import numpy as np
+            from firmware import load_firmware
+            cpu = top.picorv32
+            words = load_firmware(image=cpu.firmware, sources=cpu.firmware_sources)
+            np.asarray(words, dtype="<u4").tofile("build/xip.bin")
+            with timer.stage("program firmware"):
+                subprocess.run(["tinyprog", "-u", "build/xip.bin"], check=True)
+        print(timer.summary())
+    elif args.action == "generate":
+        from build_cache import StageTimer, generate_verilog
+        timer = StageTimer()
+        top = make_top()
+        text = generate_verilog(top, ports=[top.led], timer=timer)
+        if args.output is None:
+            print(text)
+        else:
+            previous = None
+            if os.path.exists(args.output):
+                with open(args.output) as f:
+                    previous = f.read()
+            if text != previous:
+                with open(args.output, "w") as f:
+                    f.write(text)
+            print(timer.summary())
+            print(f"{args.output} {'unchanged' if text == previous else 'written'}")
+    elif args.action == "decoder":
+        from firmware import read_image
+        from picorv32 import RAM_SIZE
+        cpu = make_top().picorv32
+        # the RAM the CPU gets spans the image too unless it runs from flash; without a prebuilt image to size it
+        # the map is checked against the 16 KiB of block RAM of the iCE40LP8K, the most the RAM can take
+        if cpu.xip is not None:
+            ram_size = 4 * RAM_SIZE
+        elif args.firmware is not None:
+            ram_size = 4 * (RAM_SIZE + len(read_image(args.firmware)))
+        else:
+            ram_size = 16384
+        print(cpu.address_decoder(ram_size).summary())
+    elif args.action == "csr":
+        top = make_top()
+        csr_map = top.csr.map
+        outputs = [(args.rust, csr_map.to_rust(top.csr_constants)), (args.json, csr_map.to_json())]
+        if top.analyzer is not None:
+            import json
+            outputs.append((args.capture_json, json.dumps(top.analyzer.layout(), indent=2)))
+        for path, text in outputs:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as f:
+                f.write(text)
+        print(csr_map.summary())
+    elif args.action == "simulate":
+        from cxxsim import CxxrtlSimulation, run_pysim
+
+        engines = ["pysim", "cxxsim"] if args.engine == "all" else [args.engine]
+        if args.dsp_clk is not None and "cxxsim" in engines:
+            parser.error("the CXXRTL driver only clocks the sync domain; simulate --dsp-clk designs with pysim")
+        clocks = {"dsp": args.dsp_clk * 1e6} if args.dsp_clk is not None else {}
+        for engine in engines:
+            top = make_top(cpu_bus=args.bus, cpu_prefetch=args.prefetch, profile=args.profile is not None)
+            cpu = top.picorv32
+            phase_step = top.nco.phase_step if top.nco is not None else top.nco_bank.phase_step[0]
+            outputs = [top.led, phase_step, cpu.cycles, cpu.fetches, cpu.wait_states]
+            profile_outputs = top.profiler.outputs() if top.profiler is not None else []
+            memories = [top.profiler.histogram] if top.profiler is not None else []
+            vcd_file = None if args.vcd is None else f"{engine}-{args.vcd}" if len(engines) > 1 else args.vcd
+
+            if engine == "pysim":
+                seconds, values = run_pysim(top, outputs + profile_outputs, cycles=args.cycles, clk_freq=16e6,
+                    vcd_file=vcd_file, memories=memories, clocks=clocks)
+            else:
+                sim = CxxrtlSimulation(top, outputs + profile_outputs, verilog_files=["picorv32.v"], memories=memories)
+                sim.build()
+                seconds, values = sim.run(cycles=args.cycles, vcd_file=vcd_file)
+
+            print(f"{engine}: {args.cycles} cycles in {seconds:.2f} s ({args.cycles / seconds:,.0f} cycles/s)")
+            for signal in outputs:
+                print(f"  {signal.name} = {values[signal.name]:#x}")
+            if values["fetches"]:
+                print(f"  CPI = {values['cycles'] / values['fetches']:.2f} "
+                    f"({values['wait_states'] / values['cycles']:.1%} of cycles waiting on the bus)")
+            if top.profiler is not None:
+                import json
+                path = f"{engine}-{args.profile}" if len(engines) > 1 else args.profile
+                with open(path, "w") as f:
+                    json.dump(top.profiler.dump(values, values[top.profiler.histogram.name]), f, indent=2)
+                print(f"  profile written to {path}")
+    else:
+        parser.print_usage()
@@ -90,6 +90,101 @@ class UART(Elaboratable):
         return m
 
 
+
+# Bit timing of `FractionalUART`: a phase accumulator adds `baud_step` every clock and a bit period ends each
+# time it wraps, so any baud rate up to a quarter of the clock is met on average, with one clock of jitter.
+BAUD_PHASE_BITS = 24
+
+def baud_step(clk_freq: float, baud_rate: float) -> int:
+    return round(float(baud_rate) / float(clk_freq) * (1 << BAUD_PHASE_BITS))
+
+class FractionalUART(Elaboratable):
+    """
+    ``UART`` with a fractional, run-time programmable bit rate. It has the same ports, plus ``baud_step``
+    (see ``baud_step()``), which starts out at ``baud_rate``.
+    """
+    def __init__(self, clk_freq: float, baud_rate: float, data_bits: int = 8):
+        assert baud_rate <= clk_freq / 4
+
+        self.data_bits = data_bits
+        self.baud_step = Signal(BAUD_PHASE_BITS, reset=baud_step(clk_freq, baud_rate))
+
+        self.tx_o    = Signal(reset=1)
+        self.rx_i    = Signal(reset=1)
+
+        self.tx_data = Signal(data_bits)
+        self.tx_rdy  = Signal()
+        self.tx_ack  = Signal()
+
+        self.rx_data = Signal(data_bits)
+        self.rx_err  = Signal()
+        self.rx_ovf  = Signal()
+        self.rx_rdy  = Signal()
+        self.rx_ack  = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        tx_phase = Signal(BAUD_PHASE_BITS)
+        tx_next  = Signal(BAUD_PHASE_BITS + 1)
+        tx_shreg = Signal(1 + self.data_bits + 1, reset=-1)
+        tx_count = Signal(range(len(tx_shreg) + 1))
+
+        m.d.comb += [
+            self.tx_o.eq(tx_shreg[0]),
+            tx_next.eq(tx_phase + self.baud_step),
+        ]
+        with m.If(tx_count == 0):
+            m.d.comb += self.tx_ack.eq(1)
+            with m.If(self.tx_rdy):
+                m.d.sync += [
+                    tx_shreg.eq(Cat(C(0, 1), self.tx_data, C(1, 1))),
+                    tx_count.eq(len(tx_shreg)),
+                    tx_phase.eq(0),
+                ]
+        with m.Else():
+            m.d.sync += tx_phase.eq(tx_next[:-1])
+            with m.If(tx_next[-1]):
+                m.d.sync += [
+                    tx_shreg.eq(Cat(tx_shreg[1:], C(1, 1))),
+                    tx_count.eq(tx_count - 1),
+                ]
+
+        rx_phase = Signal(BAUD_PHASE_BITS)
+        rx_next  = Signal(BAUD_PHASE_BITS + 1)
+        rx_shreg = Signal(1 + self.data_bits + 1, reset=-1)
+        rx_count = Signal(range(len(rx_shreg) + 1))
+
+        m.d.comb += [
+            self.rx_data.eq(rx_shreg[1:-1]),
+            rx_next.eq(rx_phase + self.baud_step),
+        ]
+        with m.If(rx_count == 0):
+            m.d.comb += self.rx_err.eq(~(~rx_shreg[0] & rx_shreg[-1]))
+            with m.If(~self.rx_i):
+                with m.If(self.rx_ack | ~self.rx_rdy):
+                    m.d.sync += [
+                        self.rx_rdy.eq(0),
+                        self.rx_ovf.eq(0),
+                        rx_count.eq(len(rx_shreg)),
+                        # half a bit, to sample in the middle of each bit
+                        rx_phase.eq(1 << (BAUD_PHASE_BITS - 1)),
+                    ]
+                with m.Else():
+                    m.d.sync += self.rx_ovf.eq(1)
+        with m.Else():
+            m.d.sync += rx_phase.eq(rx_next[:-1])
+            with m.If(rx_next[-1]):
+                m.d.sync += [
+                    rx_shreg.eq(Cat(rx_shreg[1:], self.rx_i)),
+                    rx_count.eq(rx_count - 1),
+                ]
+                with m.If(rx_count == 1):
+                    m.d.sync += self.rx_rdy.eq(1)
+
+        return m
+
+
 if __name__ == "__main__":
     uart = UART(divisor=5)
     ports = [
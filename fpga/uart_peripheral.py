@@ -0,0 +1,284 @@
+from nmigen import Elaboratable, Module, Signal, Record, Repl, Mux
+from nmigen.lib.cdc import FFSynchronizer
+from nmigen.lib.fifo import SyncFIFOBuffered
+
+from csr import Bank, Register
+from picorv32 import dma_layout
+from uart import FractionalUART, BAUD_PHASE_BITS
+
+# interrupt sources, in bit order; the first two are levels, the rest are sticky until cleared
+IRQ_SOURCES = [
+    ("rx_ready", 1),     # the RX FIFO holds data
+    ("tx_empty", 1),     # the TX FIFO has drained
+    ("rx_dma_done", 1),
+    ("tx_dma_done", 1),
+    ("rx_overflow", 1),  # a byte arrived while the RX FIFO was full and was dropped
+    ("rx_error", 1),     # a byte arrived without its stop bit and was dropped
+]
+
+class UARTPeripheral(Elaboratable):
+    """
+    ``FractionalUART`` with a FIFO in block RAM on either side, CSRs (see ``csr_bank``), an interrupt
+    request and a DMA engine on a ``PicoRV32`` ``dma`` port.
+
+    Writing a length to ``rx_dma_len`` stores that many received bytes from ``rx_dma_addr`` onwards, and writing
+    one to ``tx_dma_len`` sends that many bytes from ``tx_dma_addr`` onwards. Received bytes take priority for
+    the memory port, and while a DMA transfer runs the CPU should leave that direction's FIFO alone.
+    ``irq`` is raised while any source enabled in ``irq_enable`` is pending.
+    """
+    def __init__(self, clk_freq: float, baud_rate: float, tx_depth: int = 512, rx_depth: int = 512):
+        self.uart = FractionalUART(clk_freq, baud_rate)
+        self.tx_fifo = SyncFIFOBuffered(width=8, depth=tx_depth)
+        self.rx_fifo = SyncFIFOBuffered(width=8, depth=rx_depth)
+
+        self.tx_o = Signal(reset=1)
+        self.rx_i = Signal(reset=1)
+        self.irq = Signal()
+        self.dma = Record(dma_layout(), name="uart_dma")
+
+        self.baud = Signal(BAUD_PHASE_BITS, reset=self.uart.baud_step.reset)
+        self.tx_data = Signal(8)
+        self.status = Record([
+            ("tx_full", 1),
+            ("rx_empty", 1),
+            ("tx_dma_busy", 1),
+            ("rx_dma_busy", 1),
+        ])
+        self.levels = Record([
+            ("tx", 16),
+            ("rx", 16),
+        ])
+        self.irq_enable = Record(IRQ_SOURCES)
+        self.irq_pending = Record(IRQ_SOURCES)
+        self.irq_clear = Record(IRQ_SOURCES)
+
+        self.rx_dma_addr = Signal(32)
+        self.rx_dma_len = Signal(16)
+        self.rx_dma_remaining = Signal(16)
+        self.tx_dma_addr = Signal(32)
+        self.tx_dma_len = Signal(16)
+        self.tx_dma_remaining = Signal(16)
+
+        self.registers = {register.name: register for register in [
+            Register("baud", self.baud, desc="Bit rate as a fraction of the clock, in units of 2**-24."),
+            Register("tx_data", self.tx_data, access="w", desc="Queues a byte for transmission."),
+            Register("rx_data", self.rx_fifo.r_data, access="r", desc="Oldest received byte; reading pops it."),
+            Register("status", self.status, access="r"),
+            Register("levels", self.levels, access="r", desc="Bytes in the TX and RX FIFOs."),
+            Register("irq_enable", self.irq_enable),
+            Register("irq_pending", self.irq_pending, access="r"),
+            Register("irq_clear", self.irq_clear, access="w", desc="Write ones to clear sticky interrupts."),
+            Register("rx_dma_addr", self.rx_dma_addr),
+            Register("rx_dma_len", self.rx_dma_len, access="w", desc="Starts receiving this many bytes."),
+            Register("rx_dma_remaining", self.rx_dma_remaining, access="r"),
+            Register("tx_dma_addr", self.tx_dma_addr),
+            Register("tx_dma_len", self.tx_dma_len, access="w", desc="Starts sending this many bytes."),
+            Register("tx_dma_remaining", self.tx_dma_remaining, access="r"),
+        ]}
+
+    def csr_bank(self, name: str = "uart") -> Bank:
+        return Bank(name, self.registers.values(), desc="FIFO UART with DMA.")
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.uart = uart = self.uart
+        m.submodules.tx_fifo = tx_fifo = self.tx_fifo
+        m.submodules.rx_fifo = rx_fifo = self.rx_fifo
+        registers = self.registers
+        dma = self.dma
+
+        m.submodules.rx_sync = FFSynchronizer(self.rx_i, uart.rx_i, reset=1)
+        m.d.comb += [
+            self.tx_o.eq(uart.tx_o),
+            uart.baud_step.eq(self.baud),
+        ]
+
+        rx_busy = self.rx_dma_remaining != 0
+        tx_busy = self.tx_dma_remaining != 0
+
+        # DMA: one memory access per cycle, received bytes first
+        rx_ptr = Signal(32)
+        tx_ptr = Signal(32)
+        tx_inflight = Signal()
+        tx_lane = Signal(2)
+
+        rx_req = rx_busy & rx_fifo.r_rdy
+        # one read in flight at a time, and only while its byte is sure to fit
+        tx_req = tx_busy & ~tx_inflight & (tx_fifo.level < tx_fifo.depth - 1) & ~rx_req
+        m.d.comb += [
+            dma.req.eq(rx_req | tx_req),
+            dma.adr.eq(Mux(rx_req, rx_ptr[2:], tx_ptr[2:])),
+            dma.we.eq(rx_req),
+            dma.sel.eq(1 << rx_ptr[:2]),
+            dma.dat_w.eq(Repl(rx_fifo.r_data, 4)),
+        ]
+
+        with m.If(registers["rx_dma_len"].w_stb):
+            m.d.sync += [
+                rx_ptr.eq(self.rx_dma_addr),
+                self.rx_dma_remaining.eq(self.rx_dma_len),
+            ]
+        with m.Elif(dma.grant & rx_req):
+            m.d.sync += [
+                rx_ptr.eq(rx_ptr + 1),
+                self.rx_dma_remaining.eq(self.rx_dma_remaining - 1),
+            ]
+
+        m.d.sync += tx_inflight.eq(dma.grant & tx_req)
+        with m.If(registers["tx_dma_len"].w_stb):
+            m.d.sync += [
+                tx_ptr.eq(self.tx_dma_addr),
+                self.tx_dma_remaining.eq(self.tx_dma_len),
+            ]
+        with m.Elif(dma.grant & tx_req):
+            m.d.sync += [
+                tx_ptr.eq(tx_ptr + 1),
+                tx_lane.eq(tx_ptr[:2]),
+                self.tx_dma_remaining.eq(self.tx_dma_remaining - 1),
+            ]
+
+        # TX FIFO: filled by DMA or by writes to `tx_data`, drained by the UART
+        m.d.comb += [
+            tx_fifo.w_en.eq(tx_inflight | registers["tx_data"].w_stb),
+            tx_fifo.w_data.eq(Mux(tx_inflight, dma.dat_r.word_select(tx_lane, 8), self.tx_data)),
+            uart.tx_data.eq(tx_fifo.r_data),
+            uart.tx_rdy.eq(tx_fifo.r_rdy),
+            tx_fifo.r_en.eq(uart.tx_ack),
+        ]
+
+        # RX FIFO: filled by the UART, drained by DMA or by reads of `rx_data`
+        rx_rdy_prev = Signal()
+        rx_push = Signal()
+        m.d.sync += rx_rdy_prev.eq(uart.rx_rdy)
+        m.d.comb += [
+            uart.rx_ack.eq(1),
+            rx_push.eq(uart.rx_rdy & ~rx_rdy_prev & ~uart.rx_err),
+            rx_fifo.w_en.eq(rx_push),
+            rx_fifo.w_data.eq(uart.rx_data),
+            rx_fifo.r_en.eq(Mux(rx_busy, dma.grant & rx_req, registers["rx_data"].r_stb)),
+        ]
+
+        m.d.comb += [
+            self.status.tx_full.eq(~tx_fifo.w_rdy),
+            self.status.rx_empty.eq(~rx_fifo.r_rdy),
+            self.status.tx_dma_busy.eq(tx_busy),
+            self.status.rx_dma_busy.eq(rx_busy),
+            self.levels.tx.eq(tx_fifo.level),
+            self.levels.rx.eq(rx_fifo.level),
+        ]
+
+        # interrupts
+        pending = self.irq_pending
+        m.d.comb += [
+            pending.rx_ready.eq(rx_fifo.r_rdy),
+            pending.tx_empty.eq(~tx_fifo.r_rdy & uart.tx_ack),
+        ]
+        events = {
+            "rx_dma_done": dma.grant & rx_req & (self.rx_dma_remaining == 1),
+            "tx_dma_done": tx_inflight & ~tx_busy,
+            "rx_overflow": rx_push & ~rx_fifo.w_rdy,
+            "rx_error": uart.rx_rdy & ~rx_rdy_prev & uart.rx_err,
+        }
+        for name, event in events.items():
+            with m.If(event):
+                m.d.sync += pending[name].eq(1)
+            with m.Elif(registers["irq_clear"].w_stb & self.irq_clear[name]):
+                m.d.sync += pending[name].eq(0)
+        m.d.comb += self.irq.eq((pending & self.irq_enable).any())
+
+        return m
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    p_action = parser.add_subparsers(dest="action")
+    p_check = p_action.add_parser("check", help="loop TX back to RX and move a buffer through both DMA channels")
+    p_check.add_argument("--baud", type=float, default=3e6)
+    p_check.add_argument("--length", type=int, default=37)
+
+    args = parser.parse_args()
+    if args.action == "check":
+        import numpy as np
+        from nmigen import Memory
+        from nmigen.sim import Simulator
+        from csr import CSRBridge, CSRMap, wishbone_access
+        from uart import baud_step
+
+        clk_freq = 16e6
+        rng = np.random.default_rng(0)
+        init = [int(x) for x in rng.integers(0, 1 << 32, size=64)]
+
+        peripheral = UARTPeripheral(clk_freq=clk_freq, baud_rate=115200, tx_depth=16, rx_depth=16)
+        bridge = CSRBridge(CSRMap([peripheral.csr_bank()]))
+        registers = peripheral.registers
+
+        m = Module()
+        m.submodules.peripheral = peripheral
+        m.submodules.bridge = bridge
+        # a stand-in for the CPU's RAM, which is never busy
+        mem = Memory(width=32, depth=len(init), init=init)
+        m.submodules.read_port = read_port = mem.read_port(transparent=False)
+        m.submodules.write_port = write_port = mem.write_port(granularity=8)
+        dma = peripheral.dma
+        m.d.comb += [
+            dma.grant.eq(dma.req),
+            read_port.addr.eq(dma.adr),
+            dma.dat_r.eq(read_port.data),
+            write_port.addr.eq(dma.adr),
+            write_port.data.eq(dma.dat_w),
+            write_port.en.eq(Mux(dma.req & dma.we, dma.sel, 0)),
+            peripheral.rx_i.eq(peripheral.tx_o),
+        ]
+
+        sim = Simulator(m)
+        sim.add_clock(1 / clk_freq)
+
+        def access(register, data=None):
+            return (yield from wishbone_access(bridge.bus, register, data))
+
+        src, dst = 0x13, 0x80
+        expected = np.frombuffer(np.array(init, dtype="<u4").tobytes(), dtype=np.uint8)[src:src + args.length]
+
+        def proc():
+            yield from access(registers["baud"], baud_step(clk_freq, args.baud))
+
+            # by hand, through the FIFOs
+            for byte in b"hi!":
+                yield from access(registers["tx_data"], byte)
+            for _ in range(int(40 * clk_freq / args.baud)):
+                yield
+            assert (yield from access(registers["levels"])) >> 16 == 3
+            received = []
+            for _ in range(3):
+                received.append((yield from access(registers["rx_data"])))
+            received = bytes(received)
+            assert received == b"hi!", received
+
+            # memory to memory through both DMA channels
+            yield from access(registers["irq_enable"], 0b1100)
+            yield from access(registers["rx_dma_addr"], dst)
+            yield from access(registers["rx_dma_len"], args.length)
+            yield from access(registers["tx_dma_addr"], src)
+            yield from access(registers["tx_dma_len"], args.length)
+            polls = 0
+            while (yield from access(registers["rx_dma_remaining"])):
+                # a poll takes four cycles, a byte ten bit periods
+                polls += 1
+                assert polls * 4 < 2 * 10 * args.length * clk_freq / args.baud, "DMA transfer stalled"
+            assert (yield peripheral.irq)
+            assert (yield from access(registers["irq_pending"])) & 0b1100 == 0b1100
+            yield from access(registers["irq_clear"], 0b1100)
+            assert not (yield peripheral.irq)
+
+            words = []
+            for i in range(len(init)):
+                words.append((yield mem[i]))
+            got = np.frombuffer(np.array(words, dtype="<u4").tobytes(), dtype=np.uint8)
+            assert (got[dst:dst + args.length] == expected).all()
+            assert (got[:dst] == np.frombuffer(np.array(init, dtype="<u4").tobytes(), dtype=np.uint8)[:dst]).all()
+            print(f"UARTPeripheral moved {args.length} bytes through both DMA channels at {args.baud / 1e6:g} Mbaud")
+        sim.add_sync_process(proc)
+        sim.run()
+    else:
+        parser.print_usage()
@@ -0,0 +1,216 @@
+from collections import namedtuple
+from typing import Dict, Iterable, Optional
+import numpy as np
+
+Trace = namedtuple('Trace', 'times values')
+
+_TIMESCALE_UNITS = {
+    b's': 1.0,
+    b'ms': 1e-3,
+    b'us': 1e-6,
+    b'ns': 1e-9,
+    b'ps': 1e-12,
+    b'fs': 1e-15,
+}
+
+class _SampleBuffer:
+    """
+    Growable pair of preallocated arrays that samples are appended to in batches.
+    """
+
+    def __init__(self, capacity: int):
+        self.times = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty(capacity, dtype=np.uint64)
+        self.length = 0
+
+    def extend(self, times: np.ndarray, values: np.ndarray):
+        end = self.length + len(times)
+        if end > len(self.times):
+            capacity = max(end, 2 * len(self.times))
+            self.times = np.resize(self.times, capacity)
+            self.values = np.resize(self.values, capacity)
+        self.times[self.length:end] = times
+        self.values[self.length:end] = values
+        self.length = end
+
+    def trace(self, timescale: float) -> Trace:
+        return Trace(
+            times=self.times[:self.length] * timescale,
+            values=self.values[:self.length].astype(np.int64),
+        )
+
+def bin_to_uint(bits: np.ndarray, size: int) -> np.ndarray:
+    """
+    Convert an array of binary strings (``b'0101'``, MSB first, possibly shorter than ``size``)
+    into unsigned integers in one vectorized pass. ``x`` and ``z`` bits read as 0.
+    """
+    assert size <= 64
+    if len(bits) == 0:
+        return np.empty(0, dtype=np.uint64)
+    padded = np.char.zfill(bits.astype(f'S{size}'), size)
+    digits = padded.view(np.uint8).reshape(-1, size) == ord('1')
+    weights = np.left_shift(np.uint64(1), np.arange(size - 1, -1, -1, dtype=np.uint64))
+    return (digits * weights).sum(axis=1, dtype=np.uint64)
+
+def _parse_header(f):
+    timescale = 1.0
+    scopes = []
+    variables = {}
+
+    tokens = []
+    for line in f:
+        tokens.extend(line.split())
+        if not tokens or tokens[-1] != b'$end':
+            continue
+
+        keyword = tokens[0]
+        if keyword == b'$timescale':
+            scale = b''.join(tokens[1:-1])
+            digits = scale.rstrip(b'abcdefghijklmnopqrstuvwxyz')
+            timescale = int(digits) * _TIMESCALE_UNITS[scale[len(digits):]]
+        elif keyword == b'$scope':
+            scopes.append(tokens[2].decode())
+        elif keyword == b'$upscope':
+            scopes.pop()
+        elif keyword == b'$var':
+            size, ident, name = int(tokens[2]), tokens[3], tokens[4].decode()
+            variables['.'.join(scopes + [name])] = (ident, size)
+        elif keyword == b'$enddefinitions':
+            return timescale, variables
+        tokens = []
+
+    raise ValueError("VCD file has no $enddefinitions")
+
+def _lookup(variables, name):
+    # simulators may wrap the design in extra scopes (e.g. `bench.top.sin`), so accept a unique suffix match
+    if name in variables:
+        return variables[name]
+    matches = [path for path in variables if path.endswith('.' + name)]
+    if len(matches) != 1:
+        raise KeyError(f"signal {name!r} not found in VCD" if not matches else f"signal {name!r} is ambiguous: {matches}")
+    return variables[matches[0]]
+
+def read_vcd(path: str, signals: Iterable[str], chunk_size: int = 1 << 24, capacity: int = 1 << 16) -> Dict[str, Trace]:
+    """
+    Stream the value changes of ``signals`` out of a VCD file.
+
+    The file is read ``chunk_size`` bytes at a time and each chunk is decoded with vectorized
+    NumPy operations, so memory use is bounded by the chunk and the samples of the requested
+    signals, not by the size of the file.
+
+    Returns a ``Trace`` per signal, with times in seconds and values as unsigned integers.
+    """
+    signals = list(signals)
+
+    with open(path, 'rb') as f:
+        timescale, variables = _parse_header(f)
+
+        wanted = {name: _lookup(variables, name) for name in signals}
+        buffers = {name: _SampleBuffer(capacity) for name in signals}
+
+        time = 0
+        rest = b''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                chunk, rest = rest, b''
+            else:
+                chunk, rest = rest + chunk, b''
+                cut = chunk.rfind(b'\n')
+                if cut < 0:
+                    rest = chunk
+                    continue
+                chunk, rest = chunk[:cut], chunk[cut + 1:]
+            if not chunk:
+                break
+            time = _decode_chunk(chunk, time, wanted, buffers)
+
+    return {name: buffers[name].trace(timescale) for name in signals}
+
+def _decode_chunk(chunk: bytes, time: int, wanted, buffers) -> int:
+    lines = np.char.strip(np.array(chunk.split(b'\n')))
+    lines = lines[np.char.str_len(lines) > 0]
+    if len(lines) == 0:
+        return time
+
+    first = lines.view(np.uint8).reshape(len(lines), -1)[:, 0]
+
+    # every line takes the timestamp of the most recent `#<time>` line, carrying in from the last chunk
+    is_time = first == ord('#')
+    stamps = np.concatenate(([time], np.char.lstrip(lines[is_time], b'#').astype(np.int64)))
+    line_times = stamps[np.cumsum(is_time)]
+
+    is_vector = (first == ord('b')) | (first == ord('B'))
+    is_scalar = np.isin(first, np.frombuffer(b'01xzXZ', dtype=np.uint8))
+
+    if is_vector.any():
+        bits, _, idents = np.char.partition(lines[is_vector], b' ').T
+        bits = np.char.lstrip(bits, b'bB')
+        idents = np.char.strip(idents)
+        vector_times = line_times[is_vector]
+        vector_lines = np.flatnonzero(is_vector)
+    if is_scalar.any():
+        scalars = lines[is_scalar]
+        scalar_bits = scalars.astype('S1')
+        width = scalars.dtype.itemsize
+        scalar_idents = np.ascontiguousarray(scalars.view(np.uint8).reshape(-1, width)[:, 1:]).view(f'S{width - 1}').ravel()
+        scalar_times = line_times[is_scalar]
+        scalar_lines = np.flatnonzero(is_scalar)
+
+    for name, (ident, size) in wanted.items():
+        if size == 1:
+            # a 1-bit variable may change in either form (`1!` or `b1 !`), so both are merged in file order
+            lines_of, times, values = [], [], []
+            if is_scalar.any():
+                match = scalar_idents == ident
+                lines_of.append(scalar_lines[match])
+                times.append(scalar_times[match])
+                values.append(bin_to_uint(scalar_bits[match], 1))
+            if is_vector.any():
+                match = idents == ident
+                lines_of.append(vector_lines[match])
+                times.append(vector_times[match])
+                values.append(bin_to_uint(bits[match], 1))
+            if lines_of:
+                order = np.argsort(np.concatenate(lines_of), kind='stable')
+                buffers[name].extend(np.concatenate(times)[order], np.concatenate(values)[order])
+        elif is_vector.any():
+            match = idents == ident
+            buffers[name].extend(vector_times[match], bin_to_uint(bits[match], size))
+
+    return int(stamps[-1])
+
+def resample(trace: Trace, samples: int) -> Trace:
+    """
+    Decimate a trace onto ``samples`` evenly spaced points, holding the last value like the waveform does.
+    """
+    times = np.linspace(trace.times[0], trace.times[-1], samples)
+    index = np.searchsorted(trace.times, times, side='right') - 1
+    return Trace(times=times, values=trace.values[index])
+
+def envelope(trace: Trace, bins: int, end: Optional[float] = None):
+    """
+    Reduce a trace to per-bin minimum and maximum values, so a long capture can be plotted
+    as a band without drawing every transition.
+
+    Returns ``(bin_start_times, minimums, maximums)``.
+    """
+    end = trace.times[-1] if end is None else end
+    edges = np.linspace(trace.times[0], end, bins + 1)
+    edges[-1] = np.nextafter(edges[-1], np.inf)
+
+    first = np.searchsorted(trace.times, edges[:-1], side='left')
+    last = np.searchsorted(trace.times, edges[1:], side='left')
+
+    # a bin starts at whatever value was held when it opened
+    held = trace.values[np.maximum(first - 1, 0)]
+    lo, hi = held.copy(), held.copy()
+
+    nonempty = last > first
+    if nonempty.any():
+        values = trace.values[:last[-1]]
+        starts = first[nonempty]
+        lo[nonempty] = np.minimum(lo[nonempty], np.minimum.reduceat(values, starts))
+        hi[nonempty] = np.maximum(hi[nonempty], np.maximum.reduceat(values, starts))
+
+    return edges[:-1], lo, hi